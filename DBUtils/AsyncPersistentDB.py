@@ -0,0 +1,161 @@
+"""AsyncPersistentDB - asyncio front-end for persistent DB-API 2 connections.
+
+Implements steady, thread-affine persistent connections to a database
+which can be used by asyncio applications, based on PersistentDB and
+an arbitrary DB-API 2 compliant database interface module.
+
+Since persistent connections are bound to threads, this module keeps a
+fixed number of worker threads, each of which holds its own persistent
+connection.  Requesting a connection means leasing one of these workers.
+All database operations on the connection are then run in the leased
+worker thread, so that they do not block the event loop.  Tasks waiting
+for a worker when all of them have been leased are suspended on futures.
+
+For the Python DB-API 2 specification, see:
+    https://www.python.org/dev/peps/pep-0249/
+For information on asyncio, see:
+    https://docs.python.org/3/library/asyncio.html
+
+
+Usage:
+
+First you need to set up a generator for your kind of database connections
+by creating an instance of AsyncPersistentDB, passing the same parameters
+as for PersistentDB.  Additionally, you can pass the number of worker
+threads as threads keyword parameter (by default, there will be 5 threads).
+
+    import pgdb  # import used DB-API 2 module
+    from DBUtils.AsyncPersistentDB import AsyncPersistentDB
+    persist = AsyncPersistentDB(pgdb, 1000, threads=10, database='mydb')
+
+Once you have set up the generator you can request
+database connections from it inside a coroutine:
+
+    async with persist.connection() as db:
+        cur = await db.cursor()
+        await cur.execute(...)
+        res = await cur.fetchall()
+        await cur.close()
+
+The worker thread is given back when the context is left.  The connections
+and cursors have the same interface as with AsyncPooledDB.  If all worker
+threads are leased, then by default the request waits until one becomes
+free, but you can also specify a timeout in seconds:
+
+    async with persist.connection(timeout=5) as db:
+        ...
+
+
+Copyright, credits and license:
+
+* Based on PersistentDB, contributed as supplement for Webware for Python
+  and PyGreSQL by Christoph Zwerschke in September 2005
+
+Licensed under the MIT license.
+
+"""
+
+import asyncio
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from DBUtils.AsyncPooledDB import (
+    AsyncDBConnection, AsyncDBConnectionRequest, TooManyConnections)
+from DBUtils.PersistentDB import PersistentDB
+
+__version__ = '1.3'
+
+
+class AsyncPersistentDB:
+    """Generator for persistent DB-API 2 connections usable with asyncio.
+
+    After you have created the connection generator, you can use
+    connection() to get thread-affine, steady DB-API 2 connections.
+
+    """
+
+    version = __version__
+
+    def __init__(self, creator, *args, threads=5, **kwargs):
+        """Set up the asyncio persistent DB-API 2 connection generator.
+
+        creator: either an arbitrary function returning new DB-API 2
+            connection objects or a DB-API 2 compliant database module
+        threads: the number of worker threads holding the connections
+        args, kwargs: the parameters that shall be passed to PersistentDB
+
+        """
+        self._persist = PersistentDB(creator, *args, **kwargs)
+        # every worker is an executor with its own single thread
+        self._workers = deque(
+            ThreadPoolExecutor(1) for i in range(threads or 1))
+        self._waiters = deque()  # futures of tasks waiting for a worker
+
+    def connection(self, timeout=None):
+        """Get a steady, persistent DB-API 2 connection.
+
+        The result can be awaited or used as asynchronous context manager,
+        in which case the worker thread is given back on exit.
+
+        """
+        return AsyncDBConnectionRequest(self._connection(timeout))
+
+    dedicated_connection = connection
+
+    async def _connection(self, timeout=None):
+        """Get a connection after waiting for a free worker."""
+        if self._workers:
+            worker = self._workers.popleft()
+        else:
+            if timeout is not None and timeout <= 0:
+                raise TooManyConnections
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:  # a worker will be handed over to us
+                worker = await asyncio.wait_for(waiter, timeout)
+            except BaseException as error:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(waiter.result())
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                if isinstance(error, asyncio.TimeoutError):
+                    raise TooManyConnections
+                raise
+        try:
+            con = await asyncio.get_running_loop().run_in_executor(
+                worker, self._persist.connection)
+        except BaseException:
+            self._release(worker)
+            raise
+        return AsyncDBConnection(self, con, worker)
+
+    async def _checkin(self, con, worker):
+        """Close the connection if allowed and give back the worker."""
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                worker, con.close)
+        finally:
+            self._release(worker)
+
+    def _leaked(self, con, worker):
+        """Give back the worker of a leaked connection."""
+        self._release(worker)
+
+    def _release(self, worker):
+        """Hand over a free worker to the first waiting task."""
+        waiters = self._waiters
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(worker)
+                return
+        self._workers.append(worker)
+
+    async def close(self):
+        """Shut down all worker threads."""
+        while self._workers:
+            self._workers.popleft().shutdown(wait=False)
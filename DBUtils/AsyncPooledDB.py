@@ -0,0 +1,570 @@
+"""AsyncPooledDB - asyncio front-end for pooled DB-API 2 connections.
+
+Implements a pool of steady, thread-safe cached connections to a database
+which can be used by asyncio applications, based on PooledDB and
+an arbitrary DB-API 2 compliant database interface module.
+
+The database operations themselves are still performed by the usual
+synchronous DB-API 2 module, but they are offloaded to a bounded thread
+pool executor, so that they do not block the event loop.  Tasks waiting
+for a connection when the maximum number of connections is reached are
+suspended on futures and do not tie up any threads.
+
+For the Python DB-API 2 specification, see:
+    https://www.python.org/dev/peps/pep-0249/
+For information on asyncio, see:
+    https://docs.python.org/3/library/asyncio.html
+
+
+Usage:
+
+First you need to set up the database connection pool by creating
+an instance of AsyncPooledDB, passing the same parameters as for PooledDB.
+Additionally, you can pass a concurrent.futures.Executor as executor
+keyword parameter.  By default, a thread pool executor is created with
+as many worker threads as maxconnections allows (or the default number
+of workers of ThreadPoolExecutor if there is no such limit).
+
+    import pgdb  # import used DB-API 2 module
+    from DBUtils.AsyncPooledDB import AsyncPooledDB
+    pool = AsyncPooledDB(pgdb, 5, maxconnections=20, database='mydb')
+
+Once you have set up the connection pool you can request
+database connections from that pool inside a coroutine:
+
+    async with pool.connection() as db:
+        cur = await db.cursor()
+        await cur.execute(...)
+        res = await cur.fetchall()
+        await cur.close()
+        await db.commit()
+
+The connection is returned to the pool when the context is left.
+Alternatively, you can await the connection and close it yourself:
+
+    db = await pool.connection()
+    ...
+    await db.close()
+
+All methods of connections and cursors which may need to communicate with
+the database are coroutines, while other attributes such as description
+or rowcount of cursors are passed through from the underlying objects.
+
+Connections are always requested as dedicated connections, so they are
+never shared between tasks.  If the maximum number of connections has been
+reached, then by default the request blocks or fails depending on the
+blocking parameter, but you can also specify a timeout in seconds:
+
+    async with pool.connection(timeout=5) as db:
+        ...
+
+Tasks waiting for a connection are served in the order of their requests.
+
+If your database driver is asynchronous itself, i.e. its methods for
+connecting, creating cursors and executing operations are coroutines,
+then you should use the AsyncSteadyPooledDB class instead.  It takes the
+same parameters as PooledDB, but it uses the hardened connections of the
+AsyncSteadyDB module and awaits all operations directly in the event loop
+without any thread pool executor.  Since connections are never shared
+between tasks, the maxshared parameter is ignored.  The initial number
+of idle connections is established with the first request, or you can
+await the open() method of the pool to establish them in advance:
+
+    import aiodb  # import used asynchronous database module
+    from DBUtils.AsyncPooledDB import AsyncSteadyPooledDB
+    pool = AsyncSteadyPooledDB(aiodb, 5, maxconnections=20, database='mydb')
+    await pool.open()
+    async with pool.connection() as db:
+        ...
+
+
+Copyright, credits and license:
+
+* Based on PooledDB, contributed as supplement for Webware for Python
+  and PyGreSQL by Christoph Zwerschke in September 2005
+
+Licensed under the MIT license.
+
+"""
+
+import asyncio
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from weakref import finalize
+
+from DBUtils.AsyncSteadyDB import connect, _discard
+from DBUtils.PooledDB import PooledDB, InvalidConnection, TooManyConnections
+
+__version__ = '1.3'
+
+
+def _release_leaked(leaked, con, executor, loop):
+    """Give back a connection whose asynchronous proxy has been leaked."""
+    try:  # the pool must only be changed in its event loop
+        loop.call_soon_threadsafe(leaked, con, executor)
+    except RuntimeError:  # the event loop has already been closed
+        try:
+            leaked(con, executor)
+        except Exception:
+            pass
+
+
+class AsyncPooledDB:
+    """Pool for DB-API 2 connections usable with asyncio.
+
+    After you have created the connection pool, you can use
+    connection() to get pooled, steady DB-API 2 connections.
+
+    """
+
+    version = __version__
+
+    def __init__(self, creator, *args, executor=None, **kwargs):
+        """Set up the asyncio DB-API 2 connection pool.
+
+        creator: either an arbitrary function returning new DB-API 2
+            connection objects or a DB-API 2 compliant database module
+        executor: an optional concurrent.futures.Executor that shall be
+            used for running the database operations (by default, a thread
+            pool executor with maxconnections workers will be created)
+        args, kwargs: the parameters that shall be passed to PooledDB
+
+        """
+        self._pool = PooledDB(creator, *args, **kwargs)
+        self._maxconnections = self._pool._maxconnections
+        self._blocking = self._pool._blocking
+        if executor is None:
+            executor = ThreadPoolExecutor(self._maxconnections or None)
+            self._own_executor = True
+        else:
+            self._own_executor = False
+        self._executor = executor
+        self._connections = 0
+        self._waiters = deque()  # futures of tasks waiting for a connection
+
+    def connection(self, timeout=None):
+        """Get a steady, cached DB-API 2 connection from the pool.
+
+        The result can be awaited or used as asynchronous context manager,
+        in which case the connection is returned to the pool on exit.
+
+        """
+        return AsyncDBConnectionRequest(self._connection(timeout))
+
+    dedicated_connection = connection
+
+    async def _connection(self, timeout=None):
+        """Get a connection from the pool after waiting for a free slot."""
+        await self._acquire(timeout)
+        try:
+            con = await self._run(self._pool.dedicated_connection, 0)
+        except BaseException:
+            self._release()
+            raise
+        return AsyncDBConnection(self, con, self._executor)
+
+    async def _acquire(self, timeout=None):
+        """Wait for a free connection slot and take it."""
+        if self._maxconnections and (
+                self._waiters or self._connections >= self._maxconnections):
+            if timeout is None:
+                if not self._blocking:
+                    raise TooManyConnections
+            elif timeout <= 0:
+                raise TooManyConnections
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:  # the slot will be handed over to us
+                await asyncio.wait_for(waiter, timeout)
+            except BaseException as error:
+                if waiter.done() and not waiter.cancelled():
+                    self._release()  # the slot has been handed over anyway
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                if isinstance(error, asyncio.TimeoutError):
+                    raise TooManyConnections
+                raise
+        else:
+            self._connections += 1
+
+    async def _run(self, method, *args, **kwargs):
+        """Run a synchronous method using the executor."""
+        if kwargs:
+            method = partial(method, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, method, *args)
+
+    async def _checkin(self, con, executor):
+        """Return a connection to the pool and free its slot."""
+        try:
+            await self._run(con.close)
+        finally:
+            self._release()
+
+    def _leaked(self, con, executor):
+        """Return a leaked connection to the pool and free its slot."""
+        try:
+            con.close()
+        except Exception:
+            pass
+        self._release()
+
+    def _release(self):
+        """Hand over a free slot to the first waiting task."""
+        waiters = self._waiters
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._connections -= 1
+
+    async def close(self):
+        """Close all connections in the pool and shut down the executor."""
+        await self._run(self._pool.close)
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+
+class AsyncSteadyPooledDB(AsyncPooledDB):
+    """Pool for connections of asynchronous DB-API 2 drivers.
+
+    After you have created the connection pool, you can use
+    connection() to get pooled, steady asynchronous connections.
+
+    """
+
+    def __init__(
+            self, creator, mincached=0, maxcached=0,
+            maxshared=0, maxconnections=0, blocking=False,
+            maxusage=None, setsession=None, reset=True,
+            failures=None, ping=1, *args, ping_interval=None,
+            probe=None, breaker=None, limiter=None, policy='fifo',
+            **kwargs):
+        """Set up the asynchronous DB-API 2 connection pool.
+
+        creator: either an arbitrary coroutine function returning new
+            asynchronous connection objects or an asynchronous database module
+        mincached: initial number of idle connections in the pool
+            (0 means no connections are made at startup)
+        maxcached: maximum number of idle connections in the pool
+            (0 or None means unlimited pool size)
+        maxshared: ignored, since connections are never shared
+        maxconnections: maximum number of connections generally allowed
+            (0 or None means an arbitrary number of connections)
+        blocking: determines behavior when exceeding the maximum
+            (if this is set to true, wait until the number of
+            connections decreases, otherwise an error will be reported)
+        maxusage: maximum number of reuses of a single connection
+            (0 or None means unlimited reuse)
+        setsession: optional list of SQL commands that may serve to prepare
+            the session, e.g. ["set datestyle to ...", "set time zone ..."]
+        reset: how connections should be reset when returned to the pool
+            (False or None to rollback transcations started with begin(),
+            True to issue a rollback for safety's sake unless the
+            session is known to be clean)
+        failures: an optional exception class or a tuple of exception classes
+            for which the connection failover mechanism shall be applied,
+            if the default (OperationalError, InternalError) is not adequate
+        ping: determines when the connection should be checked with ping()
+            (0 = None = never, 1 = default = whenever fetched from the pool,
+            2 = when a cursor is created, 4 = when a query is executed,
+            7 = always, and all other bit combinations of these values)
+        ping_interval: time in seconds during which connections that have
+            been used or pinged recently are not pinged again
+            (0 or None means no such interval, a pair of times means an
+            interval that grows with every successful ping)
+        probe: how the liveness of connections is checked
+            (None = with ping(), falling back to polling the socket,
+            'socket' = polling the socket first, which is cheaper, or an
+            SQL statement used as validation query if there is no ping())
+        breaker: an optional circuit breaker for failures to connect
+            (a SteadyDBBreaker or the number of failures for a breaker
+            shared by connections with the same creator and parameters)
+        limiter: an optional SteadyDBLimiter for the rate and number
+            of concurrent attempts to connect
+        policy: the order in which idle connections are reused
+            ('fifo' to take the connection that has been idle longest,
+            'lifo' to take the connection returned most recently)
+        args, kwargs: the parameters that shall be passed to the creator
+            function or the connection constructor of the database module
+
+        """
+        if policy not in ('fifo', 'lifo'):
+            raise ValueError("'policy' must be either 'fifo' or 'lifo'.")
+        self._creator = creator
+        self._args, self._kwargs = args, kwargs
+        self._blocking = blocking
+        self._maxusage = maxusage
+        self._setsession = setsession
+        self._reset = reset
+        self._failures = failures
+        self._ping = ping
+        self._ping_interval = ping_interval
+        self._probe = probe
+        self._breaker = breaker
+        self._limiter = limiter
+        if mincached is None:
+            mincached = 0
+        self._mincached = mincached
+        if maxcached:
+            if maxcached < mincached:
+                maxcached = mincached
+            self._maxcached = maxcached
+        else:
+            self._maxcached = 0
+        if maxconnections:
+            if maxconnections < maxcached:
+                maxconnections = maxcached
+            self._maxconnections = maxconnections
+        else:
+            self._maxconnections = 0
+        self._idle_cache = deque()  # the actual pool of idle connections
+        # connections are always returned to the right end of the cache
+        self._idle_pop = (
+            self._idle_cache.pop if policy == 'lifo'
+            else self._idle_cache.popleft)
+        self._opened = False
+        self._connections = 0
+        self._waiters = deque()  # futures of tasks waiting for a connection
+
+    def steady_connection(self):
+        """Get a steady, unpooled connection (to be awaited)."""
+        return connect(
+            self._creator, self._maxusage, self._setsession,
+            self._failures, self._ping, True, *self._args,
+            ping_interval=self._ping_interval, probe=self._probe,
+            breaker=self._breaker, limiter=self._limiter, **self._kwargs)
+
+    async def open(self):
+        """Establish the initial number of idle connections."""
+        self._opened = True
+        while len(self._idle_cache) < self._mincached:
+            self._idle_cache.append(await self.steady_connection())
+
+    async def _connection(self, timeout=None):
+        """Get a connection from the pool after waiting for a free slot."""
+        if not self._opened:
+            await self.open()
+        await self._acquire(timeout)
+        try:
+            if self._idle_cache:  # check an idle connection
+                con = self._idle_pop()
+                await con._ping_check()
+            else:  # get a fresh connection
+                con = await self.steady_connection()
+        except BaseException:
+            self._release()
+            raise
+        return AsyncPooledDedicatedDBConnection(self, con)
+
+    async def _checkin(self, con, executor=None):
+        """Put a connection back into the idle cache and free its slot."""
+        try:
+            await con._reset(force=self._reset)  # rollback transaction
+            if not self._maxcached or len(self._idle_cache) < self._maxcached:
+                # the idle cache is not full, so put it there
+                self._idle_cache.append(con)
+            else:  # if the idle cache is already full,
+                await con.close()  # then close the connection
+        finally:
+            self._release()
+
+    def _leaked(self, con, executor=None):
+        """Close a leaked connection and free its slot."""
+        try:  # the connection may be in an unknown state
+            _discard(con.close())
+        except Exception:
+            pass
+        self._release()
+
+    async def close(self):
+        """Close all connections in the pool."""
+        while self._idle_cache:
+            con = self._idle_cache.popleft()
+            try:
+                await con.close()
+            except Exception:
+                pass
+
+
+# Auxiliary classes for asynchronous connections and cursors
+
+class AsyncDBConnectionRequest:
+    """Auxiliary class for awaiting a connection or using it as context."""
+
+    def __init__(self, coro):
+        """Create a connection request from the given coroutine."""
+        self._coro = coro
+        self._con = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._con = await self._coro
+        return self._con
+
+    async def __aexit__(self, *exc):
+        con, self._con = self._con, None
+        await con.close()
+
+
+class AsyncDBConnection:
+    """Auxiliary proxy class for asynchronous DB-API 2 connections."""
+
+    def __init__(self, pool, con, executor):
+        """Create an asynchronous connection.
+
+        pool: the pool object the connection shall be returned to
+        con: the underlying pooled or persistent SteadyDB connection
+        executor: the executor for running the database operations
+
+        """
+        self._pool = pool
+        self._con = con
+        self._executor = executor
+        # give back the connection if the proxy is leaked without close()
+        self._finalizer = finalize(
+            self, _release_leaked, pool._leaked, con, executor,
+            asyncio.get_running_loop())
+
+    async def _run(self, method, *args, **kwargs):
+        """Run a synchronous method using the executor."""
+        if kwargs:
+            method = partial(method, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, method, *args)
+
+    def _method(self, name):
+        """Get a method of the underlying connection."""
+        if not self._con:
+            raise InvalidConnection
+        return getattr(self._con, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """Return the connection to the pool."""
+        con, self._con = self._con, None
+        if con:
+            self._finalizer.detach()
+            await self._pool._checkin(con, self._executor)
+
+    async def cursor(self, *args, **kwargs):
+        """Return a new asynchronous cursor object using the connection."""
+        cursor = await self._run(self._method('cursor'), *args, **kwargs)
+        return AsyncDBCursor(self, cursor)
+
+    async def begin(self, *args, **kwargs):
+        """Indicate the beginning of a transaction."""
+        return await self._run(self._method('begin'), *args, **kwargs)
+
+    async def commit(self):
+        """Commit any pending transaction."""
+        return await self._run(self._method('commit'))
+
+    async def rollback(self):
+        """Rollback pending transaction."""
+        return await self._run(self._method('rollback'))
+
+    async def cancel(self):
+        """Cancel a long-running transaction."""
+        return await self._run(self._method('cancel'))
+
+    async def ping(self, *args, **kwargs):
+        """Ping connection."""
+        return await self._run(self._method('ping'), *args, **kwargs)
+
+    def __getattr__(self, name):
+        """Proxy all other members of the connection."""
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._method(name)
+
+
+class AsyncDBCursor:
+    """Auxiliary proxy class for asynchronous DB-API 2 cursors."""
+
+    def __init__(self, con, cursor):
+        """Create an asynchronous cursor.
+
+        con: the corresponding AsyncDBConnection
+        cursor: the underlying SteadyDB cursor
+
+        """
+        self._con = con
+        self._cursor = cursor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """Close the cursor."""
+        await self._con._run(self._cursor.close)
+
+    def __getattr__(self, name):
+        """Proxy all members of the cursor.
+
+        Methods which may need to communicate with the database are
+        returned as coroutine functions running in the executor.
+
+        """
+        if name.startswith('__'):
+            raise AttributeError(name)
+        attr = getattr(self._cursor, name)
+        if name.startswith(('execute', 'call', 'fetch', 'nextset')):
+            return partial(self._con._run, attr)
+        return attr
+
+
+class AsyncPooledDedicatedDBConnection:
+    """Auxiliary proxy class for pooled asynchronous connections."""
+
+    def __init__(self, pool, con):
+        """Create a pooled asynchronous connection.
+
+        pool: the corresponding AsyncSteadyPooledDB instance
+        con: the underlying AsyncSteadyDB connection
+
+        """
+        self._pool = pool
+        self._con = con
+        # close the connection if the proxy is leaked without close()
+        self._finalizer = finalize(
+            self, _release_leaked, pool._leaked, con, None,
+            asyncio.get_running_loop())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """Return the connection to the pool."""
+        con, self._con = self._con, None
+        if con:
+            self._finalizer.detach()
+            await self._pool._checkin(con)
+
+    def __getattr__(self, name):
+        """Proxy all members of the class."""
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._con:
+            return getattr(self._con, name)
+        else:
+            raise InvalidConnection
@@ -0,0 +1,702 @@
+"""AsyncSteadyDB - hardened connections for asynchronous database drivers.
+
+Implements steady connections to a database based on a database
+interface module that follows the DB-API 2 specification, but whose
+methods for connecting, creating cursors and executing operations
+are coroutines, as is the case with many asyncio database drivers.
+
+The connections behave like the connections of the SteadyDB module:
+they are transparently reopened when they are closed or the database
+connection has been lost or when they are used more often than an
+optional usage limit, and database cursors are transparently reopened
+as well when the execution of a database operation cannot be performed
+due to a lost connection.  Connections which have been marked as being
+in a transaction with a begin() call will not be silently replaced.
+
+Since all operations are awaited directly in the event loop, there is
+no need for offloading them to a pool of worker threads.  Methods of the
+driver that are not coroutines are supported as well, so it does not
+matter whether e.g. closing a cursor is synchronous or asynchronous.
+
+For the Python DB-API 2 specification, see:
+    https://www.python.org/dev/peps/pep-0249/
+For information on asyncio, see:
+    https://docs.python.org/3/library/asyncio.html
+
+
+Usage:
+
+You can use the coroutine connect() with the same parameters as
+the connect() function of the SteadyDB module, passing either an
+asynchronous database module or a coroutine function returning new
+connections as the first parameter:
+
+    import aiodb  # import used asynchronous database module
+    from DBUtils.AsyncSteadyDB import connect
+    db = await connect(aiodb, 10000, ["set datestyle to german"],
+        host=..., database=..., user=..., ...)
+    ...
+    cursor = await db.cursor()
+    ...
+    await cursor.execute('select ...')
+    result = await cursor.fetchall()
+    ...
+    await cursor.close()
+    ...
+    await db.close()
+
+Instead of calling commit() or rollback() yourself, you can also
+use the connection as an asynchronous context manager:
+
+    async with db:
+        cursor = await db.cursor()
+        await cursor.execute(...)
+
+In order to get a pool of such connections, use the AsyncSteadyPooledDB
+class from the AsyncPooledDB module.
+
+
+Copyright, credits and license:
+
+* Based on SteadyDB, contributed as supplement for Webware for Python
+  and PyGreSQL by Christoph Zwerschke in September 2005
+
+Licensed under the MIT license.
+
+"""
+
+import asyncio
+
+from inspect import isawaitable
+from time import monotonic
+from weakref import finalize
+
+from DBUtils.SteadyDB import (
+    SteadyDBConnection, SteadyDBCursor, SteadyDBError, InvalidCursor)
+
+__version__ = '1.3'
+
+
+async def connect(
+        creator, maxusage=None, setsession=None,
+        failures=None, ping=1, closeable=True, *args,
+        ping_interval=None, probe=None, breaker=None, limiter=None,
+        **kwargs):
+    """A tough version of the connection constructor of a database module.
+
+    creator: either an arbitrary coroutine function returning new
+        asynchronous connection objects or an asynchronous database module
+    maxusage: maximum usage limit for the underlying connection
+        (number of database operations, 0 or None means unlimited usage)
+        callproc(), execute() and executemany() count as one operation.
+        When the limit is reached, the connection is automatically reset.
+    setsession: an optional list of SQL commands that may serve to prepare
+        the session, e.g. ["set datestyle to german", "set time zone mez"]
+    failures: an optional exception class or a tuple of exception classes
+        for which the failover mechanism shall be applied, if the default
+        (OperationalError, InternalError) is not adequate
+    ping: determines when the connection should be checked with ping()
+        (0 = None = never, 1 = default = when _ping_check() is called,
+        2 = whenever a cursor is created, 4 = when a query is executed,
+        7 = always, and all other bit combinations of these values)
+    closeable: if this is set to false, then closing the connection will
+        be silently ignored, but by default the connection can be closed
+    ping_interval: time in seconds during which a connection that has been
+        used or pinged successfully is trusted without pinging it again
+        (or a pair of times for an interval that grows with every ping)
+    probe: how the liveness of the connection is checked
+        (None = with ping(), falling back to polling the socket returned
+        by fileno(), 'socket' = polling the socket first, or an SQL
+        statement that is used as a validation query without ping())
+    breaker: an optional circuit breaker for failures to connect
+        (a SteadyDBBreaker or the number of failures for a breaker
+        shared by connections with the same creator and parameters)
+    limiter: an optional SteadyDBLimiter for the rate and number
+        of concurrent attempts to connect (waiting in line is done
+        in a thread, so that the event loop is not blocked)
+    args, kwargs: the parameters that shall be passed to the creator
+        function or the connection constructor of the database module
+
+    """
+    con = AsyncSteadyDBConnection(
+        creator, maxusage, setsession,
+        failures, ping, closeable, *args,
+        ping_interval=ping_interval, probe=probe, breaker=breaker,
+        limiter=limiter, **kwargs)
+    await con._open()
+    return con
+
+
+async def _await(value):
+    """Await the given value if it is awaitable."""
+    if isawaitable(value):
+        value = await value
+    return value
+
+
+async def _acquire(limiter):
+    """Wait in line for an attempt to connect in a thread."""
+    attempt = asyncio.get_running_loop().run_in_executor(
+        None, limiter.acquire)
+    try:
+        await asyncio.shield(attempt)
+    except asyncio.CancelledError:
+        # if the attempt is granted nevertheless, give it back
+        attempt.add_done_callback(
+            lambda attempt: attempt.cancelled() or attempt.exception()
+            or limiter.release())
+        raise
+
+
+def _discard(value):
+    """Dispose of a value that cannot be awaited any more.
+
+    If there is a running event loop, an awaitable will be scheduled
+    as a task, otherwise a coroutine will simply be closed.
+
+    """
+    if isawaitable(value):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:  # no running event loop
+            try:
+                value.close()
+            except AttributeError:
+                pass
+        else:
+            asyncio.ensure_future(value)
+
+
+def _close_leaked(resource):
+    """Close a connection or cursor whose tough version has been leaked."""
+    try:
+        _discard(resource.close())
+    except Exception:
+        pass
+
+
+class AsyncSteadyDBConnection(SteadyDBConnection):
+    """A "tough" version of asynchronous DB-API 2 connections.
+
+    The connection must be opened by awaiting _open() before it can be
+    used, which is done automatically when it is created with connect().
+
+    """
+
+    version = __version__
+
+    __slots__ = ('_finalizer', '__weakref__')
+
+    def __init__(
+            self, creator, maxusage=None, setsession=None,
+            failures=None, ping=1, closeable=True, *args,
+            ping_interval=None, probe=None, breaker=None, limiter=None,
+            **kwargs):
+        """Create a "tough" asynchronous DB-API 2 connection."""
+        # basic initialization to make finalizer work
+        self._con = None
+        self._closed = True
+        self._metrics = None
+        self._spares = None
+        # proper initialization of the connection
+        self._setup(
+            creator, maxusage, setsession,
+            failures, ping, closeable, *args,
+            ping_interval=ping_interval, probe=probe, breaker=breaker,
+            limiter=limiter, **kwargs)
+
+    async def _open(self):
+        """Open the underlying connection."""
+        self._store(await self._create())
+
+    def _store(self, con):
+        """Store a database connection for subsequent use."""
+        SteadyDBConnection._store(self, con)
+        # close the connection if this object is leaked without close()
+        self._finalizer = finalize(self, _close_leaked, con)
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with asynchronous connections.")
+
+    def __exit__(self, *exc):
+        pass  # pragma: no cover
+
+    async def __aenter__(self):
+        """Enter the runtime context for the connection object."""
+        return self
+
+    async def __aexit__(self, *exc):
+        """Exit the runtime context for the connection object.
+
+        This does not close the connection, but it ends a transaction.
+
+        """
+        if exc[0] is None and exc[1] is None and exc[2] is None:
+            await self.commit()
+        else:
+            await self.rollback()
+
+    async def _create(self):
+        """Create a new connection using the creator function."""
+        breaker, limiter = self._breaker, self._limiter
+        if breaker:
+            breaker.enter()  # fail fast while the breaker is open
+        if limiter:
+            try:  # wait in line until the attempt can be made
+                await _acquire(limiter)
+            except BaseException:
+                if breaker:
+                    breaker.cancel()
+                raise
+        try:
+            try:
+                con = await _await(
+                    self._creator(*self._args, **self._kwargs))
+            except BaseException:
+                if breaker:
+                    breaker.failed()
+                raise
+            if breaker:
+                breaker.succeeded()
+            try:
+                self._examine(con)
+                await self._setsession(con)
+            except Exception as error:
+                # the database module could not be determined
+                # or the session could not be prepared
+                try:  # close the connection first
+                    await _await(con.close())
+                except Exception:
+                    pass
+                raise error  # re-raise the original error again
+        finally:
+            if limiter:
+                limiter.release()
+        return con
+
+    async def _setsession(self, con=None):
+        """Execute the SQL commands for session preparation."""
+        if con is None:
+            con = self._con
+        if self._setsession_sql:
+            cursor = await _await(con.cursor())
+            for sql in self._setsession_sql:
+                await _await(cursor.execute(sql))
+            await _await(cursor.close())
+
+    async def _renew(self, con):
+        """Replace the underlying connection with a new one."""
+        metrics = self._metrics
+        if metrics:
+            if self._maxusage and self._usage >= self._maxusage:
+                metrics.recycle()
+            else:
+                metrics.failover()
+        await self._close()
+        self._store(con)
+
+    async def _close(self):
+        """Close the tough connection.
+
+        You can always close a tough connection with this method
+        and it will not complain if you close it more than once.
+
+        """
+        if not self._closed:
+            self._finalizer.detach()
+            try:
+                await _await(self._con.close())
+            except Exception:
+                pass
+            self._transaction = False
+            self._closed = True
+
+    async def _reset(self, force=False):
+        """Reset a tough connection.
+
+        Rollback if the connection was in a transaction, or if forced
+        and the session may have uncommitted changes.
+
+        """
+        self._cancelled = False  # the connection is used for something else
+        if not self._closed and (
+                self._transaction or force and self._in_transaction()):
+            try:
+                await self.rollback()
+            except Exception:
+                pass
+
+    async def _ping_probe(self):
+        """Check whether the connection is alive using ping()."""
+        try:  # pass a reconnect=False flag if this is supported
+            alive = self._con.ping(False)
+        except TypeError:  # the reconnect flag is not supported
+            alive = self._con.ping()
+        alive = await _await(alive)
+        return True if alive is None else alive
+
+    async def _query_probe(self):
+        """Check whether the connection is alive using a query."""
+        self._dirty = True  # the query may have started a transaction
+        cursor = await _await(self._con.cursor())
+        try:
+            await _await(cursor.execute(self._probe))
+            await _await(cursor.fetchone())
+        finally:
+            await _await(cursor.close())
+        return True
+
+    async def _ping_check(self, ping=1, reconnect=True):
+        """Check whether the connection is still alive.
+
+        The cheapest available probe is used for this check, usually
+        ping(), but see the probe parameter for the alternatives.
+
+        If the the underlying connection is not active and the ping
+        parameter is set accordingly, the connection will be recreated
+        unless the connection is currently inside a transaction.
+
+        """
+        if ping & self._ping:
+            interval = self._ping_interval
+            if interval and monotonic() - self._last_used < interval:
+                return True  # the connection has been used recently
+            probes = self._probes
+            while True:
+                try:  # if possible, probe the connection
+                    alive = await _await(probes[0](self))
+                except (AttributeError, IndexError, TypeError):
+                    probes = self._probes = probes[1:]  # not available
+                    if probes:
+                        continue  # try the next probe
+                    self._ping = 0  # no probe is available
+                    alive = None
+                    reconnect = False
+                except Exception:
+                    alive = False
+                else:
+                    if alive:
+                        reconnect = False
+                break
+            if interval:
+                self._pinged(alive)
+            if reconnect and not self._transaction:
+                try:  # try to reopen the connection
+                    con = await self._create()
+                except Exception:
+                    pass
+                else:
+                    await self._renew(con)
+                    alive = True
+            return alive
+
+    async def close(self):
+        """Close the tough connection.
+
+        You are allowed to close a tough connection by default
+        and it will not complain if you close it more than once.
+
+        You can disallow closing connections by setting
+        the closeable parameter to something false.  In this case,
+        closing tough connections will be silently ignored.
+
+        """
+        if self._closeable:
+            await self._close()
+        elif self._transaction:
+            await self._reset()
+
+    async def begin(self, *args, **kwargs):
+        """Indicate the beginning of a transaction.
+
+        During a transaction, connections won't be transparently
+        replaced, and all errors will be raised to the application.
+
+        If the underlying driver supports this method, it will be called
+        with the given parameters (e.g. for distributed transactions).
+
+        """
+        self._transaction = True
+        try:
+            begin = self._con.begin
+        except AttributeError:
+            pass
+        else:
+            await _await(begin(*args, **kwargs))
+
+    async def _end(self, name):
+        """End a transaction with commit() or rollback()."""
+        self._transaction = False
+        try:
+            await _await(getattr(self._con, name)())
+            self._dirty = False
+            self._last_used = monotonic()
+        except self._failures as error:  # cannot end the transaction
+            try:  # try to reopen the connection
+                con = await self._create()
+            except Exception:
+                pass
+            else:
+                await self._renew(con)
+            raise error  # re-raise the original error
+
+    async def commit(self):
+        """Commit any pending transaction."""
+        await self._end('commit')
+
+    async def rollback(self):
+        """Rollback pending transaction."""
+        await self._end('rollback')
+
+    async def cancel(self):
+        """Cancel a long-running transaction.
+
+        If the underlying driver supports this method, it will be called.
+        A query failing because it has been cancelled is not executed again.
+
+        """
+        self._transaction = False
+        try:
+            cancel = self._con.cancel
+        except AttributeError:
+            pass
+        else:
+            self._cancelled = True
+            await _await(cancel())
+
+    async def ping(self, *args, **kwargs):
+        """Ping connection."""
+        return await _await(self._con.ping(*args, **kwargs))
+
+    async def _cursor(self, *args, **kwargs):
+        """A "tough" version of the method cursor()."""
+        transaction = self._transaction
+        if not transaction:
+            await self._ping_check(2)
+        try:
+            if self._maxusage:
+                if self._usage >= self._maxusage:
+                    # the connection was used too often
+                    raise self._failure
+            # try to get a cursor
+            cursor = await _await(self._con.cursor(*args, **kwargs))
+        except self._failures as error:  # error in getting cursor
+            try:  # try to reopen the connection
+                con = await self._create()
+            except Exception:
+                pass
+            else:
+                try:  # and try one more time to get a cursor
+                    cursor = await _await(con.cursor(*args, **kwargs))
+                except Exception:
+                    pass
+                else:
+                    await self._renew(con)
+                    if transaction:
+                        raise error  # re-raise the original error again
+                    return cursor
+                try:
+                    await _await(con.close())
+                except Exception:
+                    pass
+            if transaction:
+                self._transaction = False
+            raise error  # re-raise the original error again
+        return cursor
+
+    async def cursor(self, *args, **kwargs):
+        """Return a new Cursor Object using the connection."""
+        cursor = AsyncSteadyDBCursor(self, *args, **kwargs)
+        await cursor._open()
+        return cursor
+
+
+class AsyncSteadyDBCursor(SteadyDBCursor):
+    """A "tough" version of asynchronous DB-API 2 cursors.
+
+    The cursor must be opened by awaiting _open() before it can be used,
+    which is done automatically when it is created with cursor().
+
+    """
+
+    __slots__ = ('_finalizer', '__weakref__')
+
+    _tough_methods = {}  # the wrappers of other execution methods
+
+    def __init__(self, con, *args, **kwargs):
+        """Create a "tough" asynchronous DB-API 2 cursor."""
+        # basic initialization to make finalizer work
+        self._cursor = None
+        self._closed = True
+        # proper initialization of the cursor
+        if not isinstance(con, AsyncSteadyDBConnection):
+            raise TypeError("%r is not an AsyncSteadyDBConnection." % (con,))
+        self._con = con
+        self._args, self._kwargs = args, kwargs
+        self._clearsizes()
+
+    async def _open(self):
+        """Open the underlying cursor."""
+        self._store(await self._con._cursor(*self._args, **self._kwargs))
+
+    def _store(self, cursor):
+        """Store a database cursor for subsequent use."""
+        self._cursor = cursor
+        self._closed = False
+        # close the cursor if this object is leaked without close()
+        self._finalizer = finalize(self, _close_leaked, cursor)
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with asynchronous cursors.")
+
+    def __exit__(self, *exc):
+        pass  # pragma: no cover
+
+    async def __aenter__(self):
+        """Enter the runtime context for the cursor object."""
+        return self
+
+    async def __aexit__(self, *exc):
+        """Exit the runtime context for the cursor object."""
+        await self.close()
+
+    async def close(self):
+        """Close the tough cursor.
+
+        It will not complain if you close it more than once.
+
+        """
+        if not self._closed:
+            self._finalizer.detach()
+            try:
+                await _await(self._cursor.close())
+            except Exception:
+                pass
+            self._closed = True
+
+    async def execute(self, *args, **kwargs):
+        """Prepare and execute a database operation ("tough" version)."""
+        return await self._tough_call('execute', True, args, kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        """Execute an operation for a sequence ("tough" version)."""
+        return await self._tough_call('executemany', True, args, kwargs)
+
+    async def callproc(self, *args, **kwargs):
+        """Call a stored database procedure ("tough" version)."""
+        return await self._tough_call('callproc', False, args, kwargs)
+
+    @classmethod
+    def _tough_method(cls, name):
+        """Return a "tough" version of the given cursor method."""
+        execute = name.startswith('execute')
+
+        async def tough_method(self, *args, **kwargs):
+            return await self._tough_call(name, execute, args, kwargs)
+
+        tough_method.__name__ = name
+        return tough_method
+
+    async def _call(self, cursor, name, execute, args, kwargs):
+        """Call the given method of a cursor, setting sizes if needed."""
+        if execute:
+            self._setsizes(cursor)
+        result = await _await(getattr(cursor, name)(*args, **kwargs))
+        if execute:
+            self._clearsizes()
+        return result
+
+    async def _tough_call(self, name, execute, args, kwargs):
+        """Call the given cursor method in a "tough" way."""
+        con = self._con
+        transaction = con._transaction
+        if not transaction:
+            await con._ping_check(4)
+        con._dirty = True
+        try:
+            if con._maxusage:
+                if con._usage >= con._maxusage:
+                    # the connection was used too often
+                    raise con._failure
+            result = await self._call(
+                self._cursor, name, execute, args, kwargs)  # try to execute
+        except con._failures as error:  # execution error
+            if con._cancelled:  # do not execute a cancelled query again
+                con._cancelled = False
+                raise
+            if not transaction:
+                try:
+                    cursor2 = await con._cursor(
+                        *self._args, **self._kwargs)  # open new cursor
+                except Exception:
+                    pass
+                else:
+                    try:  # and try one more time to execute
+                        result = await self._call(
+                            cursor2, name, execute, args, kwargs)
+                    except Exception:
+                        pass
+                    else:
+                        await self.close()
+                        self._store(cursor2)
+                        con._usage += 1
+                        con._last_used = monotonic()
+                        return result
+                    try:
+                        await _await(cursor2.close())
+                    except Exception:
+                        pass
+            try:  # try to reopen the connection
+                con2 = await con._create()
+            except Exception:
+                pass
+            else:
+                try:
+                    cursor2 = await _await(con2.cursor(
+                        *self._args, **self._kwargs))  # open new cursor
+                except Exception:
+                    pass
+                else:
+                    if transaction:
+                        await self.close()
+                        await con._renew(con2)
+                        self._store(cursor2)
+                        raise error  # raise the original error again
+                    error2 = None
+                    try:  # try one more time to execute
+                        result = await self._call(
+                            cursor2, name, execute, args, kwargs)
+                    except error.__class__:  # same execution error
+                        use2 = False
+                        error2 = error
+                    except Exception as error:  # other execution errors
+                        use2 = True
+                        error2 = error
+                    else:
+                        use2 = True
+                    if use2:
+                        await self.close()
+                        await con._renew(con2)
+                        con._dirty = True
+                        self._store(cursor2)
+                        con._usage += 1
+                        con._last_used = monotonic()
+                        if error2:
+                            raise error2  # raise the other error
+                        return result
+                    try:
+                        await _await(cursor2.close())
+                    except Exception:
+                        pass
+                try:
+                    await _await(con2.close())
+                except Exception:
+                    pass
+            if transaction:
+                con._transaction = False
+            raise error  # re-raise the original error again
+        else:
+            con._cancelled = False  # it has been cancelled too late
+            con._usage += 1
+            con._last_used = monotonic()
+            return result
@@ -0,0 +1,60 @@
+"""Finalize - a substitute for weakref.finalize on Python 2.
+
+The pools in DBUtils use weakref.finalize to give back connections that
+have been dropped by the application without closing them.  Since this
+function has been added in Python 3.4, this module provides a simple
+implementation with the same interface for older Python versions.
+Unlike the original, pending finalizers are not called at exit.
+
+
+Usage:
+
+    try:
+        from weakref import finalize
+    except ImportError:  # Python 2
+        from DBUtils.Finalize import finalize
+
+
+Copyright, credits and license:
+
+Licensed under the MIT license.
+
+"""
+
+from weakref import ref
+
+__version__ = '1.3'
+
+
+class finalize:
+    """Finalizer calling a function when an object is garbage collected."""
+
+    version = __version__
+
+    # the finalizers must be kept alive until they have been called
+    _registry = {}
+
+    def __init__(self, obj, func, *args, **kwargs):
+        """Register a finalizer for the given object."""
+        self._ref = ref(obj, self)
+        self._info = func, args, kwargs
+        self._registry[id(self)] = self
+
+    def __call__(self, _ref=None):
+        """Call the function unless this has been done already."""
+        if self._registry.pop(id(self), None) is not None:
+            func, args, kwargs = self._info
+            return func(*args, **kwargs)
+
+    def detach(self):
+        """Detach the finalizer and return the object and the function."""
+        obj = self._ref()
+        if obj is not None and self._registry.pop(
+                id(self), None) is not None:
+            func, args, kwargs = self._info
+            return obj, func, args, kwargs
+
+    @property
+    def alive(self):
+        """Check whether the finalizer has not been called yet."""
+        return id(self) in self._registry
@@ -0,0 +1,269 @@
+"""MultiPooledDB - pooling for DB-API 2 connections to multiple hosts.
+
+Implements a pool of steady, thread-safe cached connections to a
+database that is served by several hosts, such as a set of replicas,
+using an arbitrary DB-API 2 compliant database interface module.
+
+Every host gets its own PooledDB instance.  Connections are requested
+from these pools according to a load balancing strategy, and hosts that
+cannot be reached any more are ejected for a while.  When a connection
+is lost and transparently reopened by SteadyDB, e.g. in the middle of
+executing a query with a tough cursor method, the new connection will
+be made to the original host only if it is still healthy, and to one of
+the other healthy hosts otherwise.
+
+
+Usage:
+
+First you need to set up the database connection pool by creating
+an instance of MultiPooledDB, passing the following parameters:
+
+    creator: either an arbitrary function returning new DB-API 2
+        connection objects or a DB-API 2 compliant database module
+    hosts: a list of dictionaries with the connection parameters that
+        are specific for each of the hosts, such as their host names
+        (these will be added to the parameters passed to the creator)
+    balance: the strategy for choosing a host for a connection
+        ('round-robin' = default = take turns with all healthy hosts,
+        'least-outstanding' = the host with the fewest connections
+        in use, 'latency' = the host with the lowest moving average
+        of the time for getting a connection, weighted by the number
+        of connections in use)
+    ejecttime: the time in seconds that hosts are not used any more
+        after a connection to them could not be established
+        (the default is 30 seconds, after which they will be tried again)
+
+    The parameters balance and ejecttime can only be passed as keyword
+    arguments.  All other parameters will be passed on to PooledDB for
+    each of the hosts, so you can pass the usual PooledDB parameters
+    and the common connection parameters such as database and user.
+
+For instance, if you are using pgdb as your DB-API 2 database module and
+want a pool of at least five connections to each of two database hosts:
+
+    import pgdb  # import used DB-API 2 module
+    from DBUtils.MultiPooledDB import MultiPooledDB
+    pool = MultiPooledDB(pgdb, [dict(host='db1'), dict(host='db2')],
+        5, database='mydb', balance='least-outstanding')
+
+Once you have set up the connection pool you can request
+database connections from that pool, like from PooledDB:
+
+    db = pool.connection()
+
+The pools of the individual hosts and their metrics are available
+in the list pools of the MultiPooledDB instance.
+
+Note that a connection that has been reopened on a different host after
+a failover stays in the pool of its original host until it is renewed,
+for instance because it reached the maxusage or maxlifetime limit.
+
+
+Copyright, credits and license:
+
+Licensed under the MIT license.
+
+"""
+
+import sys
+
+from itertools import count
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+from DBUtils.PooledDB import PooledDB, TooManyConnections
+
+__version__ = '1.3'
+
+
+class MultiPooledDB:
+    """Pool for DB-API 2 connections to multiple database hosts.
+
+    After you have created the connection pool, you can use
+    connection() to get pooled, steady DB-API 2 connections.
+
+    """
+
+    version = __version__
+
+    def __init__(self, creator, hosts, *args, **kwargs):
+        """Set up the DB-API 2 connection pools for all hosts.
+
+        creator: either an arbitrary function returning new DB-API 2
+            connection objects or a DB-API 2 compliant database module
+        hosts: list of dictionaries with the host specific parameters
+            that shall be passed to the creator in addition to kwargs
+        balance: how a host is chosen for a connection
+            ('round-robin', 'least-outstanding' or 'latency')
+        ejecttime: time in seconds a host is not used any more after
+            a connection to it could not be established
+        args, kwargs: the parameters that shall be passed to PooledDB
+            and to the creator function or the connection constructor
+            of the DB-API 2 module
+
+        """
+        # the following options can only be passed as keyword arguments
+        balance = kwargs.pop('balance', 'round-robin')
+        ejecttime = kwargs.pop('ejecttime', 30)
+        if not hosts:
+            raise ValueError("'hosts' must not be empty.")
+        if balance not in ('round-robin', 'least-outstanding', 'latency'):
+            raise ValueError("'balance' must be either 'round-robin',"
+                             " 'least-outstanding' or 'latency'.")
+        self._balance = balance
+        self._hosts = MultiPooledDBHosts(creator, hosts, ejecttime)
+        self._turn = count()
+        self.pools = [
+            PooledDB(MultiPooledDBConnector(
+                creator, self._hosts, index), *args, **kwargs)
+            for index in range(len(hosts))]
+
+    def _choose(self):
+        """Get the order in which the pools shall be tried."""
+        hosts = self._hosts
+        healthy = hosts.healthy()
+        if len(healthy) > 1:
+            balance = self._balance
+            if balance == 'round-robin':
+                turn = next(self._turn) % len(healthy)
+                healthy = healthy[turn:] + healthy[:turn]
+            else:
+                pools = self.pools
+                if balance == 'least-outstanding':
+                    def load(index):
+                        return pools[index]._connections
+                else:
+                    latency = hosts.latency
+
+                    def load(index):
+                        return latency[index] * (
+                            pools[index]._connections + 1)
+                healthy.sort(key=load)
+        return healthy
+
+    def connection(self, shareable=True, timeout=None, lazy=False):
+        """Get a steady, cached DB-API 2 connection from one of the pools.
+
+        The host is chosen according to the balancing strategy.  If the
+        pool of that host has reached its maximum number of connections,
+        the pools of the other healthy hosts are tried as well.
+
+        """
+        error = None
+        for index in self._choose():
+            start = monotonic()
+            try:
+                con = self.pools[index].connection(shareable, timeout, lazy)
+            except TooManyConnections as e:
+                error = e  # try the next host
+            else:
+                if not lazy:
+                    self._hosts.measure(index, monotonic() - start)
+                return con
+        raise error
+
+    def dedicated_connection(self, timeout=None, lazy=False):
+        """Alias for connection(shareable=False)."""
+        return self.connection(False, timeout, lazy)
+
+    def close(self):
+        """Close all connections in the pools of all hosts."""
+        for pool in self.pools:
+            pool.close()
+
+
+# Auxiliary classes for the hosts and their connection creators
+
+class MultiPooledDBHosts:
+    """Auxiliary class keeping track of the health of the hosts."""
+
+    def __init__(self, creator, hosts, ejecttime):
+        try:
+            self.connect = creator.connect
+        except AttributeError:
+            self.connect = creator
+        self.params = [dict(host) for host in hosts]
+        self.ejecttime = ejecttime or 0
+        self.ejected = [0] * len(hosts)  # times until hosts are ejected
+        self.latency = [0] * len(hosts)  # moving averages of the latency
+
+    def healthy(self):
+        """Get the list of the healthy hosts.
+
+        If all hosts have been ejected, all of them are returned,
+        starting with those that have been ejected first.
+
+        """
+        ejected = self.ejected
+        now = monotonic()
+        healthy = [i for i, until in enumerate(ejected) if until <= now]
+        if not healthy:
+            healthy = sorted(range(len(ejected)), key=ejected.__getitem__)
+        return healthy
+
+    def eject(self, index):
+        """Eject the given host for the configured time."""
+        self.ejected[index] = monotonic() + self.ejecttime
+
+    def measure(self, index, latency):
+        """Add the given latency to the moving average of the host."""
+        average = self.latency[index]
+        self.latency[index] = (
+            average + 0.2 * (latency - average) if average else latency)
+
+    def connect_to(self, index, args, kwargs):
+        """Connect to the given host or to another healthy host."""
+        healthy = self.healthy()
+        if index in healthy:
+            healthy.remove(index)
+            healthy.insert(0, index)
+        else:  # try the ejected host only as the last resort
+            healthy.append(index)
+        error = None
+        for index in healthy:
+            params = self.params[index]
+            try:
+                con = self.connect(*args, **dict(kwargs, **params))
+            except Exception as e:
+                self.eject(index)
+                error = e
+            else:
+                self.ejected[index] = 0  # the host is healthy again
+                return con
+        raise error
+
+
+class MultiPooledDBConnector:
+    """Auxiliary connection creator for the pool of one of the hosts."""
+
+    def __init__(self, creator, hosts, index):
+        self.hosts = hosts
+        self.index = index
+        # let SteadyDB and PooledDB find the DB-API 2 module
+        dbapi = None
+        try:
+            if callable(creator.connect):
+                dbapi = creator
+        except AttributeError:
+            try:
+                dbapi = creator.dbapi
+            except AttributeError:
+                try:
+                    dbapi = sys.modules[creator.__module__]
+                    if dbapi.connect != creator:
+                        dbapi = None
+                except (AttributeError, KeyError):
+                    pass
+        if dbapi is not None:
+            self.dbapi = dbapi
+        try:
+            self.threadsafety = creator.threadsafety
+        except AttributeError:
+            if dbapi is creator:  # let PooledDB reject this module
+                self.threadsafety = 0
+
+    def __call__(self, *args, **kwargs):
+        """Connect to the host of the pool or to another healthy host."""
+        return self.hosts.connect_to(self.index, args, kwargs)
@@ -53,6 +53,30 @@ by creating an instance of PersistentDB, passing the following parameters:
     threadlocal: an optional class for representing thread-local data
         that will be used instead of our Python implementation
         (threading.local is faster, but cannot be used in all cases)
+    ping_interval: time in seconds during which a connection that has
+        been used or pinged successfully is trusted without a ping
+        (the default value of 0 or None means that it is always pinged)
+        If you pass a pair of times, the interval starts with the first
+        time and is doubled after every successful ping up to the second.
+        This parameter can only be passed as a keyword argument.
+    probe: how the liveness of connections is checked when they are pinged
+        (by default with ping(), or by polling the socket returned by the
+        fileno() method of the connection if ping() is not supported; the
+        value 'socket' prefers the socket poll, which does not need a round
+        trip to the server, but only detects closed sockets, and an SQL
+        statement such as "select 1" serves as validation query if ping()
+        is not supported)
+        This parameter can only be passed as a keyword argument.
+    breaker: an optional circuit breaker that lets attempts to reconnect
+        fail fast with a BreakerOpen error after consecutive failures
+        (an instance of SteadyDBBreaker, or the number of failures after
+        which a breaker opens that is shared by all connections using
+        the same creator and connection parameters)
+        This parameter can only be passed as a keyword argument.
+    limiter: an optional SteadyDBLimiter that limits the rate and number
+        of concurrent attempts to connect, letting the others wait in line
+        (pass the same instance to all pools for a process-wide limit)
+        This parameter can only be passed as a keyword argument.
 
     The creator function or the connect function of the DB-API 2 compliant
     database module specified as the creator will receive any additional
@@ -79,7 +103,8 @@ SteadyDB version of the underlying DB-API 2 connection.
 Closing a persistent connection with db.close() will be silently
 ignored since it would be reopened at the next usage anyway and
 contrary to the intent of having persistent connections.  Instead,
-the connection will be automatically closed when the thread dies.
+the connection will be dropped when the thread dies, and it will then
+be closed by the database module when it is garbage collected.
 You can change this behavior be setting the closeable parameter.
 
 Note that you need to explicitly start transactions by calling the
@@ -168,6 +193,19 @@ class PersistentDB:
         threadlocal: an optional class for representing thread-local data
             that will be used instead of our Python implementation
             (threading.local is faster, but cannot be used in all cases)
+        ping_interval: time in seconds during which connections that have
+            been used or pinged recently are not pinged again
+            (0 or None means no such interval, a pair of times means an
+            interval that grows with every successful ping)
+        probe: how the liveness of connections is checked
+            (None = with ping(), falling back to polling the socket,
+            'socket' = polling the socket first, which is cheaper, or an
+            SQL statement used as validation query if there is no ping())
+        breaker: an optional circuit breaker for failures to connect
+            (a SteadyDBBreaker or the number of failures for a breaker
+            shared by connections with the same creator and parameters)
+        limiter: an optional SteadyDBLimiter for the rate and number
+            of concurrent attempts to connect
         args, kwargs: the parameters that shall be passed to the creator
             function or the connection constructor of the DB-API 2 module
 
@@ -189,6 +227,11 @@ class PersistentDB:
         self._setsession = setsession
         self._failures = failures
         self._ping = ping
+        # the following options can only be passed as keyword arguments
+        self._ping_interval = kwargs.pop('ping_interval', None)
+        self._probe = kwargs.pop('probe', None)
+        self._breaker = kwargs.pop('breaker', None)
+        self._limiter = kwargs.pop('limiter', None)
         self._closeable = closeable
         self._args, self._kwargs = args, kwargs
         self.thread = (threadlocal or local)()
@@ -198,7 +241,9 @@ class PersistentDB:
         return connect(
             self._creator, self._maxusage, self._setsession,
             self._failures, self._ping, self._closeable,
-            *self._args, **self._kwargs)
+            *self._args, ping_interval=self._ping_interval,
+            probe=self._probe, breaker=self._breaker,
+            limiter=self._limiter, **self._kwargs)
 
     def connection(self, shareable=False):
         """Get a steady, persistent DB-API 2 connection.
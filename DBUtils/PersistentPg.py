@@ -69,7 +69,8 @@ hardened SteadyPg version of a classic PyGreSQL connection.
 Closing a persistent connection with db.close() will be silently
 ignored since it would be reopened at the next usage anyway and
 contrary to the intent of having persistent connections.  Instead,
-the connection will be automatically closed when the thread dies.
+the connection will be dropped when the thread dies, and it will then
+be closed by the PyGreSQL module when it is garbage collected.
 You can change this behavior be setting the closeable parameter.
 
 Note that you need to explicitly start transactions by calling the
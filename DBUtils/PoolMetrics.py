@@ -0,0 +1,241 @@
+"""PoolMetrics - usage statistics for connection pools.
+
+Implements a lightweight collector for the usage statistics of the
+connection pools provided by PooledDB and PooledPg, which may help
+with choosing the right sizes and limits for these pools.
+
+Every thread records its events in its own set of counters, so that
+recording does not require acquiring any lock.  The counters of all
+threads are only aggregated when the statistics are read.  Counters of
+threads that have terminated are merged and kept until the next reset.
+
+
+Usage:
+
+Statistics are only collected if the pool has been created with the
+keyword parameter metrics set to True.  The pool then has a metrics
+attribute holding a PoolMetrics instance; otherwise this attribute is
+None.  You can also pass your own PoolMetrics instance, e.g.
+in order to use different histogram buckets or to let several pools
+share the same metrics.  You can get a snapshot of the statistics
+of a pool in form of a dictionary like this:
+
+    from DBUtils.PooledDB import PooledDB
+    pool = PooledDB(pgdb, 5, database='mydb', metrics=True)
+    ...
+    stats = pool.metrics.snapshot()
+    print(stats['hits'], stats['misses'], stats['wait']['max'])
+
+The following statistics are collected:
+
+    checkouts: the number of connections fetched from the pool
+    hits: the number of checkouts served by an existing connection
+    misses: the number of checkouts that needed a fresh connection
+    failovers: the number of connections that were transparently
+        reopened after they had been lost or could not be used
+    recycles: the number of connections that were transparently
+        reopened because they reached the maxusage limit
+    rejects: the number of times TooManyConnections was raised
+    wait: the histogram of the times needed for checking out connections
+    hold: the histogram of the times connections were held by the
+        application before they were given back to the pool
+
+The histograms are dictionaries with the number of recorded times (count),
+their sum (total), the largest time (max) and the list of buckets, where
+every bucket is a pair of the upper bound in seconds and the number of
+times up to that bound and above the bound of the previous bucket.
+The last bucket has an upper bound of None and counts all larger times.
+
+
+Copyright, credits and license:
+
+Licensed under the MIT license.
+
+"""
+
+from bisect import bisect_left
+from threading import Lock, current_thread, local
+from weakref import ref
+
+__version__ = '1.3'
+
+
+class PoolMetrics:
+    """Collector for the usage statistics of a connection pool.
+
+    The methods for recording events are meant to be called by the pools
+    and the steady connections, while applications will usually only
+    need snapshot() and reset().
+
+    """
+
+    version = __version__
+
+    # upper bounds in seconds of the histogram buckets
+    buckets = (0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+    def __init__(self, buckets=None):
+        """Create a metrics collector.
+
+        buckets: an optional sequence of upper bounds in seconds
+            that shall be used for the histogram buckets
+
+        """
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+        self._lock = Lock()
+        self._local = local()
+        self._counters = []  # weak thread references and counters
+        self._retired = PoolMetricsCounters(len(self.buckets))
+
+    def _get(self):
+        """Get the counters of the current thread."""
+        try:
+            return self._local.counters
+        except AttributeError:
+            counters = PoolMetricsCounters(len(self.buckets))
+            self._lock.acquire()
+            try:
+                self._retire()
+                self._counters.append((ref(current_thread()), counters))
+            finally:
+                self._lock.release()
+            self._local.counters = counters
+            return counters
+
+    def _retire(self):
+        """Merge the counters of terminated threads.
+
+        This must be called while holding the lock.
+
+        """
+        alive = []
+        for thread, counters in self._counters:
+            thread = thread()
+            if thread is not None and thread.is_alive():
+                alive.append((ref(thread), counters))
+            else:
+                self._retired.add(counters)
+        self._counters = alive
+
+    def checkout(self, wait, fresh=False):
+        """Record the checkout of a connection.
+
+        wait: the time in seconds needed for the checkout
+        fresh: whether a fresh connection had to be opened
+
+        """
+        counters = self._get()
+        if fresh:
+            counters.misses += 1
+        else:
+            counters.hits += 1
+        counters.wait.add(wait, self.buckets)
+
+    def hold(self, hold):
+        """Record the time in seconds a connection was held."""
+        self._get().hold.add(hold, self.buckets)
+
+    def failover(self):
+        """Record the failover of a connection."""
+        self._get().failovers += 1
+
+    def recycle(self):
+        """Record the renewal of a connection due to maxusage."""
+        self._get().recycles += 1
+
+    def reject(self):
+        """Record a checkout that failed with TooManyConnections."""
+        self._get().rejects += 1
+
+    def snapshot(self):
+        """Get the aggregated statistics of all threads as a dictionary."""
+        total = PoolMetricsCounters(len(self.buckets))
+        self._lock.acquire()
+        try:
+            self._retire()
+            total.add(self._retired)
+            for thread, counters in self._counters:
+                total.add(counters)
+        finally:
+            self._lock.release()
+        return total.stats(self.buckets)
+
+    def reset(self):
+        """Reset all statistics."""
+        self._lock.acquire()
+        try:
+            self._retire()
+            self._retired = PoolMetricsCounters(len(self.buckets))
+            for thread, counters in self._counters:
+                counters.clear()
+        finally:
+            self._lock.release()
+
+
+# Auxiliary classes for the counters
+
+class PoolMetricsCounters:
+    """Auxiliary class holding the counters of a single thread."""
+
+    def __init__(self, size):
+        """Create counters using histograms of the given size."""
+        self._size = size
+        self.clear()
+
+    def clear(self):
+        """Reset all counters."""
+        self.hits = self.misses = 0
+        self.failovers = self.recycles = self.rejects = 0
+        self.wait = PoolMetricsHistogram(self._size)
+        self.hold = PoolMetricsHistogram(self._size)
+
+    def add(self, other):
+        """Add the counters of other to these counters."""
+        self.hits += other.hits
+        self.misses += other.misses
+        self.failovers += other.failovers
+        self.recycles += other.recycles
+        self.rejects += other.rejects
+        self.wait.merge(other.wait)
+        self.hold.merge(other.hold)
+
+    def stats(self, buckets):
+        """Get the counters as a dictionary."""
+        return dict(
+            checkouts=self.hits + self.misses,
+            hits=self.hits, misses=self.misses,
+            failovers=self.failovers, recycles=self.recycles,
+            rejects=self.rejects,
+            wait=self.wait.stats(buckets), hold=self.hold.stats(buckets))
+
+
+class PoolMetricsHistogram:
+    """Auxiliary class for a histogram of times."""
+
+    def __init__(self, size):
+        """Create a histogram with size buckets plus an overflow bucket."""
+        self.counts = [0] * (size + 1)
+        self.total = self.max = 0
+
+    def add(self, value, buckets):
+        """Add a time in seconds to the histogram."""
+        self.counts[bisect_left(buckets, value)] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add the times of another histogram to this histogram."""
+        counts = self.counts
+        for i, count in enumerate(other.counts):
+            counts[i] += count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    def stats(self, buckets):
+        """Get the histogram as a dictionary."""
+        return dict(
+            count=sum(self.counts), total=self.total, max=self.max,
+            buckets=list(zip(list(buckets) + [None], self.counts)))
@@ -54,7 +54,8 @@ an instance of PooledDB, passing the following parameters:
         prepare the session, e.g. ["set datestyle to german", ...]
     reset: how connections should be reset when returned to the pool
         (False or None to rollback transcations started with begin(),
-        the default value True always issues a rollback for safety's sake)
+        the default value True issues a rollback for safety's sake
+        unless the session is known to be clean)
     failures: an optional exception class or a tuple of exception classes
         for which the connection failover mechanism shall be applied,
         if the default (OperationalError, InternalError) is not adequate
@@ -63,6 +64,73 @@ an instance of PooledDB, passing the following parameters:
         (0 = None = never, 1 = default = whenever fetched from the pool,
         2 = when a cursor is created, 4 = when a query is executed,
         7 = always, and all other bit combinations of these values)
+    ping_interval: time in seconds during which a connection that has
+        been used or pinged successfully is trusted without a ping
+        (the default value of 0 or None means that it is always pinged)
+        If you pass a pair of times, the interval starts with the first
+        time and is doubled after every successful ping up to the second.
+    probe: how the liveness of connections is checked when they are pinged
+        (by default with ping(), or by polling the socket returned by the
+        fileno() method of the connection if ping() is not supported; the
+        value 'socket' prefers the socket poll, which does not need a round
+        trip to the server, but only detects closed sockets, and an SQL
+        statement such as "select 1" serves as validation query if ping()
+        is not supported)
+    breaker: an optional circuit breaker that lets attempts to reconnect
+        fail fast with a BreakerOpen error after consecutive failures
+        (an instance of SteadyDBBreaker, or the number of failures after
+        which a breaker opens that is shared by all connections using
+        the same creator and connection parameters)
+    limiter: an optional SteadyDBLimiter that limits the rate and number
+        of concurrent attempts to connect, letting the others wait in line
+        (pass the same instance to all pools for a process-wide limit)
+    spares: number of hot spare connections that are kept ready, so
+        that connections which have been lost can be replaced at once
+        (the default value of 0 or None means no spare connections)
+        The spare connections are opened and prepared with setsession
+        by a background thread, which replaces them after they have
+        been used.  They do not count against maxconnections.
+    policy: the order in which idle connections are taken from the pool
+        ('fifo' = default = the connection idle for the longest time,
+        'lifo' = the connection that has been returned most recently)
+    maintenance: interval in seconds for a background thread that keeps
+        at least mincached idle connections in the pool and renews idle
+        connections which have reached the maxusage limit
+        (the default value of 0 or None means no maintenance thread)
+        The thread is also woken up whenever the idle cache runs low.
+        It never uses the last free slot below maxconnections, so that
+        checkouts are not refused while it opens a connection.
+    maxidletime: maximum time in seconds a connection may stay unused
+        (the default value of 0 or None means no limit)
+        Idle connections exceeding this time are closed when they are
+        returned or fetched from the pool, or by the maintenance thread,
+        but only as long as more than mincached idle connections remain.
+    maxlifetime: maximum time in seconds a connection may be kept open
+        (the default value of 0 or None means no limit)
+        Connections exceeding this time are replaced when they are
+        fetched from the pool, or closed by the maintenance thread.
+    magazine: maximum number of dedicated connections every thread keeps
+        for itself after returning them, so that it can get them back
+        without acquiring the lock of the pool
+        (the default value of 0 or None means no such magazines are used)
+        Connections kept in magazines still count as being in use, but
+        they are given back to the pool when other threads need to wait
+        for a connection, even if the thread keeping them is idle, and
+        when the thread terminates.
+    metrics: whether usage statistics of the pool shall be collected
+        (the default value False means no statistics; if you set this
+        to True, they are collected in a PoolMetrics instance which is
+        available as the metrics attribute of the pool, but you can
+        also pass your own instance)
+    reentrant: if this is set to true, a thread holding a dedicated
+        connection gets the same connection again when it requests
+        another one, and the connection is only given back to the pool
+        when the outermost of these nested connections is closed
+
+    The parameters ping_interval, probe, breaker, limiter, spares, policy,
+    maintenance, maxidletime, maxlifetime, magazine, metrics and reentrant
+    can only be passed as keyword arguments.  Note that closing the pool
+    stops the maintenance thread and the thread providing spares.
 
     The creator function or the connect function of the DB-API 2 compliant
     database module specified as the creator will receive any additional
@@ -96,6 +164,26 @@ You can also use this to get a dedicated connection:
 
     db = pool.dedicated_connection()
 
+If the maximum number of connections has been reached, you can
+specify how many seconds you are willing to wait for a connection:
+
+    db = pool.connection(timeout=5)
+
+If no connection becomes available in time, TooManyConnections will be
+raised.  Threads waiting for dedicated connections are served in order.
+
+If you are not sure whether you will need the connection at all, you can
+ask for a lazy connection which takes a connection from the pool only
+when you create a cursor, begin a transaction or use any other method:
+
+    db = pool.connection(lazy=True)
+
+If the pool has been created with metrics=True, it collects statistics
+such as the number of checkouts and the time spent waiting for and
+holding connections.  You can read them with:
+
+    stats = pool.metrics.snapshot()
+
 If you don't need it any more, you should immediately return it to the
 pool with db.close().  You can get another connection in the same way.
 
@@ -114,6 +202,15 @@ connection object stays alive as long as you are using it, like that:
     cur.close()  # or del cur
     db.close()  # or del db
 
+You can also use the connection as a context manager, which gives it
+back to the pool as soon as the block is left:
+
+    with pool.connection() as db:
+        cur = db.cursor()
+        cur.execute(...)
+        res = cur.fetchone()
+        cur.close()
+
 Note that you need to explicitly start transactions by calling the
 begin() method.  This ensures that the connection will not be shared
 with other threads, that the transparent reopening will be suspended
@@ -123,9 +220,10 @@ back before being given back to the connection pool.
 
 Ideas for improvement:
 
-* Add a thread for monitoring, restarting (or closing) bad or expired
+* Let the maintenance thread also monitor and restart (or close) bad
   connections (similar to DBConnectionPool/ResourcePool by Warren Smith).
-* Optionally log usage, bad connections and exceeding of limits.
+* Optionally log bad connections and exceeding of limits
+  in addition to counting them in the metrics of the pool.
 
 
 Copyright, credits and license:
@@ -139,8 +237,19 @@ Licensed under the MIT license.
 
 """
 
-from threading import Condition
-
+from collections import deque
+from threading import Condition, Event, RLock, Thread, local
+from weakref import WeakValueDictionary, ref
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+try:
+    from weakref import finalize
+except ImportError:  # Python 2
+    from DBUtils.Finalize import finalize
+
+from DBUtils.PoolMetrics import PoolMetrics
 from DBUtils.SteadyDB import connect
 
 __version__ = '1.3'
@@ -162,6 +271,28 @@ class TooManyConnections(PooledDBError):
     """Too many database connections were opened."""
 
 
+def _release_leaked(release, con):
+    """Give back a connection whose pooled proxy has been leaked."""
+    try:
+        release(con)
+    except Exception:
+        pass
+
+
+def _release_magazine(pool, cons):
+    """Give back the connections of a magazine that has been deleted."""
+    pool = pool()
+    while cons:
+        con = cons.pop()
+        try:
+            if pool is None:
+                con.close()
+            else:
+                pool._spill(con)
+        except Exception:
+            pass
+
+
 class PooledDB:
     """Pool for DB-API 2 connections.
 
@@ -176,8 +307,7 @@ class PooledDB:
             self, creator, mincached=0, maxcached=0,
             maxshared=0, maxconnections=0, blocking=False,
             maxusage=None, setsession=None, reset=True,
-            failures=None, ping=1,
-            *args, **kwargs):
+            failures=None, ping=1, *args, **kwargs):
         """Set up the DB-API 2 connection pool.
 
         creator: either an arbitrary function returning new DB-API 2
@@ -203,7 +333,8 @@ class PooledDB:
             the session, e.g. ["set datestyle to ...", "set time zone ..."]
         reset: how connections should be reset when returned to the pool
             (False or None to rollback transcations started with begin(),
-            True to always issue a rollback for safety's sake)
+            True to issue a rollback for safety's sake unless the
+            session is known to be clean)
         failures: an optional exception class or a tuple of exception classes
             for which the connection failover mechanism shall be applied,
             if the default (OperationalError, InternalError) is not adequate
@@ -211,10 +342,60 @@ class PooledDB:
             (0 = None = never, 1 = default = whenever fetched from the pool,
             2 = when a cursor is created, 4 = when a query is executed,
             7 = always, and all other bit combinations of these values)
+        ping_interval: time in seconds during which connections that have
+            been used or pinged recently are not pinged again
+            (0 or None means no such interval, a pair of times means an
+            interval that grows with every successful ping)
+        probe: how the liveness of connections is checked
+            (None = with ping(), falling back to polling the socket,
+            'socket' = polling the socket first, which is cheaper, or an
+            SQL statement used as validation query if there is no ping())
+        breaker: an optional circuit breaker for failures to connect
+            (a SteadyDBBreaker or the number of failures for a breaker
+            shared by connections with the same creator and parameters)
+        limiter: an optional SteadyDBLimiter for the rate and number
+            of concurrent attempts to connect
+        spares: number of hot spare connections kept ready by a thread
+            for replacing lost connections without connecting first
+            (0 or None means no spare connections are kept)
+        policy: the order in which idle connections are reused
+            ('fifo' to take the connection that has been idle longest,
+            'lifo' to take the connection returned most recently)
+        maintenance: interval in seconds for a thread that keeps mincached
+            idle connections ready and renews worn out idle connections
+            (0 or None means no maintenance thread is started)
+        maxidletime: maximum time in seconds a connection may stay unused
+            (0 or None means no limit, otherwise connections exceeding this
+            time will be closed as long as mincached connections remain)
+        maxlifetime: maximum time in seconds a connection may be kept open
+            (0 or None means no limit, otherwise connections exceeding this
+            time will be closed when fetched or by the maintenance thread)
+        magazine: number of returned dedicated connections kept per thread
+            for reuse by the same thread without acquiring the pool lock
+            (0 or None means that connections are always returned to the
+            pool; connections kept in magazines still count as being used)
+        metrics: whether usage statistics shall be collected
+            (False by default; if True, a PoolMetrics instance is created,
+            but you can also pass your own instance)
+        reentrant: whether threads holding a dedicated connection
+            shall get the same connection again for nested requests
         args, kwargs: the parameters that shall be passed to the creator
             function or the connection constructor of the DB-API 2 module
 
         """
+        # the following options can only be passed as keyword arguments
+        ping_interval = kwargs.pop('ping_interval', None)
+        probe = kwargs.pop('probe', None)
+        breaker = kwargs.pop('breaker', None)
+        limiter = kwargs.pop('limiter', None)
+        spares = kwargs.pop('spares', None)
+        policy = kwargs.pop('policy', 'fifo')
+        maintenance = kwargs.pop('maintenance', None)
+        maxidletime = kwargs.pop('maxidletime', None)
+        maxlifetime = kwargs.pop('maxlifetime', None)
+        magazine = kwargs.pop('magazine', None)
+        metrics = kwargs.pop('metrics', False)
+        reentrant = kwargs.pop('reentrant', False)
         try:
             threadsafety = creator.threadsafety
         except AttributeError:
@@ -227,6 +408,8 @@ class PooledDB:
                 threadsafety = 0
         if not threadsafety:
             raise NotSupportedError("Database module is not thread-safe.")
+        if policy not in ('fifo', 'lifo'):
+            raise ValueError("'policy' must be either 'fifo' or 'lifo'.")
         self._creator = creator
         self._args, self._kwargs = args, kwargs
         self._blocking = blocking
@@ -235,8 +418,15 @@ class PooledDB:
         self._reset = reset
         self._failures = failures
         self._ping = ping
+        self._ping_interval = ping_interval
+        self._probe = probe
+        self._breaker = breaker
+        self._limiter = limiter
+        self._maxidletime = maxidletime or 0
+        self._maxlifetime = maxlifetime or 0
         if mincached is None:
             mincached = 0
+        self._mincached = mincached
         if maxcached is None:
             maxcached = 0
         if maxconnections is None:
@@ -249,7 +439,8 @@ class PooledDB:
             self._maxcached = 0
         if threadsafety > 1 and maxshared:
             self._maxshared = maxshared
-            self._shared_cache = []  # the cache for shared connections
+            self._shared_cache = SharedDBCache()  # for shared connections
+            self._shared_pending = 0  # shared connections being opened
         else:
             self._maxshared = 0
         if maxconnections:
@@ -260,82 +451,272 @@ class PooledDB:
             self._maxconnections = maxconnections
         else:
             self._maxconnections = 0
-        self._idle_cache = []  # the actual pool of idle connections
-        self._lock = Condition()
+        self._idle_cache = deque()  # the actual pool of idle connections
+        # connections are always returned to the right end of the cache
+        self._idle_pop = (
+            self._idle_cache.pop if policy == 'lifo'
+            else self._idle_cache.popleft)
+        self._lock = RLock()
+        self._waiters = deque()  # threads waiting in line for a connection
+        if self._maxshared:  # threads waiting to share a connection
+            self._shared_lock = Condition(self._lock)
         self._connections = 0
+        self._maintainer = None
+        # the hot spares must be known to the initial connections as well
+        self._spares = PooledDBSpares(self, spares) if spares else None
+        self._magazine = 0
+        self._reentrant = False
+        self.metrics = PoolMetrics() if metrics is True else metrics or None
         # Establish an initial number of idle database connections:
-        idle = [self.dedicated_connection() for i in range(mincached)]
+        idle = [self._connection(False) for i in range(mincached)]
         while idle:
             idle.pop().close()
+        if magazine:
+            self._magazine = magazine
+            self._drain = False  # whether magazines shall be emptied
+            # the magazines of all threads, by their ids
+            self._magazines = WeakValueDictionary()
+        if magazine or reentrant:
+            # holds the magazine and the reentrant scope of every thread
+            self._thread = local()
+        self._reentrant = bool(reentrant)
+        if maintenance:
+            self._maintainer = PooledDBMaintainer(self, maintenance)
+            self._maintainer.start()
+        if spares:
+            self._spares.start()
 
     def steady_connection(self):
         """Get a steady, unpooled DB-API 2 connection."""
-        return connect(
+        con = connect(
             self._creator, self._maxusage, self._setsession,
-            self._failures, self._ping, True, *self._args, **self._kwargs)
+            self._failures, self._ping, True, *self._args,
+            ping_interval=self._ping_interval, probe=self._probe,
+            breaker=self._breaker, limiter=self._limiter,
+            **self._kwargs)
+        con._metrics = self.metrics
+        con._spares = self._spares
+        return con
 
-    def connection(self, shareable=True):
+    def connection(self, shareable=True, timeout=None, lazy=False):
         """Get a steady, cached DB-API 2 connection from the pool.
 
         If shareable is set and the underlying DB-API 2 allows it,
         then the connection may be shared with other threads.
 
+        If the maximum number of connections has been reached, then
+        by default the call blocks or fails depending on the blocking
+        parameter of the pool.  If a timeout in seconds is given, the
+        call waits at most that long before TooManyConnections is raised.
+        Threads waiting for dedicated connections are served in order.
+
+        If lazy is set, the connection will be taken from the pool only
+        when it is actually used for the first time.
+
         """
+        if lazy:
+            return PooledLazyDBConnection(self, shareable, timeout)
+        if self._reentrant:
+            scope = getattr(self._thread, 'scope', None)
+            if scope:  # this thread already holds a dedicated connection
+                scope.append(None)
+                return PooledDedicatedDBConnection(self, scope[0], scope)
+        metrics = self.metrics
+        if not metrics:
+            return self._connection(shareable, timeout)
+        start = monotonic()
+        try:
+            con = self._connection(shareable, timeout)
+        except TooManyConnections:
+            metrics.reject()
+            raise
+        now = monotonic()
+        # the connection is fresh if it has been opened during the checkout
+        metrics.checkout(now - start, con._con._created >= start)
+        con._since = now
+        return con
+
+    def _connection(self, shareable=True, timeout=None):
+        """Get a connection from the pool without recording metrics."""
+        if timeout is None:
+            deadline = None if self._blocking else 0
+        else:
+            deadline = monotonic() + timeout
         if shareable and self._maxshared:
             self._lock.acquire()
             try:
-                while (not self._shared_cache and self._maxconnections
-                        and self._connections >= self._maxconnections):
-                    self._wait_lock()
-                if len(self._shared_cache) < self._maxshared:
-                    # shared cache is not full, get a dedicated connection
-                    try:  # first try to get it from the idle cache
-                        con = self._idle_cache.pop(0)
-                    except IndexError:  # else get a fresh connection
-                        con = self.steady_connection()
-                    else:
-                        con._ping_check()  # check this connection
-                    con = SharedDBConnection(con)
-                    self._connections += 1
-                else:  # shared cache full or no more connections allowed
-                    self._shared_cache.sort()  # least shared connection first
-                    con = self._shared_cache.pop(0)  # get it
-                    while con.con._transaction:
+                cache = self._shared_cache
+                while True:
+                    if (len(cache) + self._shared_pending < self._maxshared
+                            and (cache or not self._maxconnections
+                                 or self._connections < self._maxconnections)):
+                        # shared cache is not full, reserve a new connection
+                        self._connections += 1
+                        con = self._reserve()
+                        self._shared_pending += 1
+                        shared = False
+                        break
+                    if cache:  # shared cache full or no more connections
+                        con = cache.top()  # least shared connection first
+                        if con.con._transaction:
+                            # the transaction states may have changed behind
+                            # our back, so update the order of the connections
+                            cache.refresh()
+                            con = cache.top()
                         # do not share connections which are in a transaction
-                        self._shared_cache.insert(0, con)
-                        self._wait_lock()
-                        self._shared_cache.sort()
-                        con = self._shared_cache.pop(0)
-                    con.con._ping_check()  # check the underlying connection
-                    con.share()  # increase share of this connection
-                # put the connection (back) into the shared cache
-                self._shared_cache.append(con)
-                self._lock.notify()
+                        if not con.con._transaction:
+                            con.con._ping_check()  # check the connection
+                            con.share()  # increase share of this connection
+                            cache.update(con, True)
+                            shared = True
+                            break
+                    self._wait_shared(deadline)
             finally:
                 self._lock.release()
+            if not shared:
+                try:  # the reserved connection is prepared without the lock
+                    con = SharedDBConnection(self._prepare(con))
+                except Exception:
+                    self._release(shared=True)
+                    raise
+                self._lock.acquire()
+                try:  # publish the connection in the shared cache
+                    self._shared_pending -= 1
+                    self._shared_cache.push(con)
+                    self._shared_lock.notify_all()
+                finally:
+                    self._lock.release()
             con = PooledSharedDBConnection(self, con)
         else:  # try to get a dedicated connection
+            if self._magazine:  # try to get it from the magazine first
+                try:
+                    con = self._thread.magazine.pop()
+                except (AttributeError, IndexError):
+                    pass
+                else:  # this connection still has its slot
+                    try:
+                        return self._dedicated(self._prepare(con))
+                    except Exception:
+                        self._release()
+                        raise
             self._lock.acquire()
             try:
-                while (self._maxconnections
-                        and self._connections >= self._maxconnections):
-                    self._wait_lock()
-                # connection limit not reached, get a dedicated connection
-                try:  # first try to get it from the idle cache
-                    con = self._idle_cache.pop(0)
-                except IndexError:  # else get a fresh connection
-                    con = self.steady_connection()
+                if self._maxconnections and (
+                        self._waiters
+                        or self._connections >= self._maxconnections):
+                    self._wait_lock(deadline)  # wait for a free slot
                 else:
-                    con._ping_check()  # check connection
-                con = PooledDedicatedDBConnection(self, con)
-                self._connections += 1
+                    self._connections += 1
+                # connection limit not reached, reserve a dedicated connection
+                con = self._reserve()
             finally:
                 self._lock.release()
+            try:  # the reserved connection is prepared without the lock
+                con = self._dedicated(self._prepare(con))
+            except Exception:
+                self._release()
+                raise
+        return con
+
+    def _dedicated(self, con):
+        """Wrap a dedicated connection, opening a scope if reentrant."""
+        if self._reentrant:
+            # the scope holds the connection followed by one entry
+            # for every nested request for a connection by the thread
+            scope = self._thread.scope = [con]
+            return PooledDedicatedDBConnection(self, con, scope)
+        return PooledDedicatedDBConnection(self, con)
+
+    def _leave(self, scope):
+        """Leave a reentrant scope, giving back the connection at the end."""
+        con = scope.pop()  # atomic, so only the last close gets the connection
+        if con is not None:
+            self.cache(con)
+
+    def _reserve(self):
+        """Fill a reserved connection slot while holding the lock.
+
+        Returns an idle connection if there is one, or None if a fresh
+        connection must be opened after the lock has been released.
+
+        """
+        try:  # first try to get it from the idle cache
+            con = self._idle_pop()
+        except IndexError:  # else a fresh connection will be needed
+            con = None
+        if self._maintainer and len(self._idle_cache) < self._mincached:
+            self._maintainer.wake()  # refill the idle cache in background
         return con
 
-    def dedicated_connection(self):
+    def _prepare(self, con=None):
+        """Check a reserved idle connection or open a fresh one.
+
+        This must be called without holding the lock, since opening
+        or pinging a connection may take a considerable amount of time.
+
+        """
+        if con is not None and (self._maxidletime or self._maxlifetime):
+            if self._expired(con):  # replace an expired connection
+                con.close()
+                con = None
+        if con is None:  # get a fresh connection
+            return self.steady_connection()
+        con._ping_check()  # check this connection
+        return con
+
+    def _expired(self, con, now=None):
+        """Check whether a connection exceeded maxidletime or maxlifetime."""
+        if now is None:
+            now = monotonic()
+        return bool(
+            self._maxlifetime and now - con._created >= self._maxlifetime
+            or self._maxidletime
+            and now - con._last_used >= self._maxidletime)
+
+    def _evict(self, lifetime=False):
+        """Remove expired connections from the idle cache.
+
+        Connections which exceeded maxidletime are removed from the side
+        of the idle cache where they have been unused for the longest time,
+        as long as more than mincached idle connections remain.  If lifetime
+        is set, all connections which exceeded maxlifetime are removed, too.
+        This must be called with the lock held, but the removed connections
+        are returned so that they can be closed after releasing the lock.
+
+        """
+        expired = []
+        idle = self._idle_cache
+        now = monotonic()
+        if self._maxidletime:
+            while (len(idle) > self._mincached
+                    and now - idle[0]._last_used >= self._maxidletime):
+                expired.append(idle.popleft())
+        if lifetime and self._maxlifetime:
+            alive = []
+            for con in idle:
+                if now - con._created >= self._maxlifetime:
+                    expired.append(con)
+                else:
+                    alive.append(con)
+            if len(alive) < len(idle):
+                idle.clear()
+                idle.extend(alive)
+        return expired
+
+    def _release(self, shared=False):
+        """Give back a connection slot that could not be filled."""
+        self._lock.acquire()
+        try:
+            self._connections -= 1
+            if shared:
+                self._shared_pending -= 1
+            self._notify()
+        finally:
+            self._lock.release()
+
+    def dedicated_connection(self, timeout=None, lazy=False):
         """Alias for connection(shareable=False)."""
-        return self.connection(False)
+        return self.connection(False, timeout, lazy)
 
     def unshare(self, con):
         """Decrease the share of a connection in the shared cache."""
@@ -343,50 +724,175 @@ class PooledDB:
         try:
             con.unshare()
             shared = con.shared
-            if not shared:  # connection is idle,
-                try:  # so try to remove it
+            try:
+                if shared:  # connection is still shared,
+                    self._shared_cache.update(con)  # so reorder it
+                else:  # connection is idle, so try to remove it
                     self._shared_cache.remove(con)  # from shared cache
-                except ValueError:
-                    pass  # pool has already been closed
+            except ValueError:
+                pass  # pool has already been closed
         finally:
             self._lock.release()
         if not shared:  # connection has become idle,
             self.cache(con.con)  # so add it to the idle cache
 
+    def update_shared(self, con):
+        """Reorder a shared connection after a change of transaction state.
+
+        If the connection is not in a transaction any more, this will
+        wake up all threads that are waiting for a connection to share.
+
+        """
+        self._lock.acquire()
+        try:
+            try:
+                self._shared_cache.update(con)
+            except ValueError:
+                pass  # pool has already been closed
+            if not con.con._transaction:
+                self._shared_lock.notify_all()
+        finally:
+            self._lock.release()
+
     def cache(self, con):
         """Put a dedicated connection back into the idle cache."""
+        if self._magazine:  # try to keep it in the magazine of this thread
+            try:
+                magazine = self._thread.magazine
+            except AttributeError:
+                magazine = self._thread.magazine = PooledDBMagazine(self)
+                self._magazines[id(magazine)] = magazine
+            if self._drain:  # other threads are waiting for connections
+                self._empty(magazine)
+            elif len(magazine) < self._magazine:
+                con._reset(force=self._reset)  # rollback possible transaction
+                magazine.append(con)  # the connection keeps its slot
+                if self._drain:  # threads started waiting in the meantime
+                    self._empty(magazine)
+                return
+        expired = None
         self._lock.acquire()
         try:
             if not self._maxcached or len(self._idle_cache) < self._maxcached:
                 con._reset(force=self._reset)  # rollback possible transaction
                 # the idle cache is not full, so put it there
                 self._idle_cache.append(con)  # append it to the idle cache
+                if self._maxidletime:  # shrink the idle cache if possible
+                    expired = self._evict()
             else:  # if the idle cache is already full,
                 con.close()  # then close the connection
             self._connections -= 1
-            self._lock.notify()
+            self._notify()
         finally:
             self._lock.release()
+        if expired:
+            for con in expired:
+                con.close()
+
+    def _spill(self, con):
+        """Give back a connection from a magazine to the idle cache."""
+        self._lock.acquire()
+        try:
+            if not self._maxcached or len(self._idle_cache) < self._maxcached:
+                self._idle_cache.append(con)
+            else:
+                con.close()
+            self._connections -= 1
+            self._notify()
+        finally:
+            self._lock.release()
+
+    def maintain(self):
+        """Keep the idle cache filled with ready connections.
+
+        Closes idle connections which exceeded maxidletime or maxlifetime,
+        opens new connections until there are at least mincached idle
+        connections in the pool (as far as maxconnections permits), and
+        renews idle connections which have reached the maxusage limit.
+        The last free slot below maxconnections is never used for this.
+        This is done by the maintenance thread, but can also be called
+        directly.  The lock is not held while connections are opened.
+
+        """
+        if self._maxidletime or self._maxlifetime:
+            self._lock.acquire()
+            try:
+                expired = self._evict(lifetime=True)
+            finally:
+                self._lock.release()
+            for con in expired:
+                con.close()
+        while True:
+            self._lock.acquire()
+            try:
+                if self._maxconnections and (
+                        self._connections + 1 >= self._maxconnections):
+                    # do not take the last free slot, since checkouts
+                    # would be refused while the connection is opened
+                    return
+                idle = self._idle_cache
+                con = None
+                if self._maxusage:  # look for a worn out idle connection
+                    for con in idle:
+                        if con._usage >= self._maxusage:
+                            idle.remove(con)
+                            break
+                    else:
+                        con = None
+                if con is None:  # check whether a new connection is needed
+                    if len(idle) >= self._mincached or (
+                            self._maxconnections and self._connections
+                            + len(idle) >= self._maxconnections):
+                        return
+                self._connections += 1  # reserve a slot for the connection
+            finally:
+                self._lock.release()
+            try:
+                if con is not None:
+                    con.close()
+                con = self.steady_connection()
+            except Exception:
+                self._release()
+                return
+            self._lock.acquire()
+            try:  # put the new connection into the idle cache
+                if not self._maxcached or len(idle) < self._maxcached:
+                    idle.append(con)
+                else:
+                    con.close()
+                self._connections -= 1
+                self._notify()
+            finally:
+                self._lock.release()
 
     def close(self):
         """Close all connections in the pool."""
+        if self._maintainer:
+            self._maintainer.stop()
+        if self._spares:
+            self._spares.stop()
+        if self._magazine:  # empty the magazines
+            self._drain = True
+            self._reclaim()
         self._lock.acquire()
         try:
             while self._idle_cache:  # close all idle connections
-                con = self._idle_cache.pop(0)
+                con = self._idle_cache.popleft()
                 try:
                     con.close()
                 except Exception:
                     pass
             if self._maxshared:  # close all shared connections
                 while self._shared_cache:
-                    con = self._shared_cache.pop(0).con
+                    con = self._shared_cache.pop().con
                     try:
                         con.close()
                     except Exception:
                         pass
                     self._connections -= 1
-            self._lock.notifyAll()
+            self._notify()
+            if self._maxshared:
+                self._shared_lock.notify_all()
         finally:
             self._lock.release()
 
@@ -397,11 +903,253 @@ class PooledDB:
         except Exception:
             pass
 
-    def _wait_lock(self):
-        """Wait until notified or report an error."""
-        if not self._blocking:
+    def _wait_lock(self, deadline=None):
+        """Wait in line until a connection slot has been handed over.
+
+        Report an error if the deadline has passed before (a deadline
+        of 0 means that waiting is not allowed at all).
+
+        """
+        if self._magazine:  # connections kept in magazines are needed
+            # stop filling magazines before reclaiming, so that
+            # connections being put into magazines cannot be missed
+            self._drain = True
+            self._reclaim()
+            if not self._waiters and (
+                    self._connections < self._maxconnections):
+                self._connections += 1  # take a slot that has been freed
+                self._drain = False
+                return
+        if deadline is not None and deadline <= monotonic():
             raise TooManyConnections
-        self._lock.wait()
+        waiter = Condition(self._lock)
+        waiters = self._waiters
+        waiters.append(waiter)
+        while waiter in waiters:  # no slot has been handed over yet
+            if deadline is None:
+                waiter.wait()
+            else:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    waiters.remove(waiter)
+                    raise TooManyConnections
+                waiter.wait(timeout)
+
+    def _wait_shared(self, deadline=None):
+        """Wait until a connection can be shared or report an error."""
+        if self._magazine:  # connections kept in magazines may be needed
+            self._drain = True  # stop filling magazines before reclaiming
+            if self._reclaim():
+                return  # check again whether a connection can be opened
+        if deadline is None:
+            self._shared_lock.wait()
+        else:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                raise TooManyConnections
+            self._shared_lock.wait(timeout)
+
+    def _reclaim(self):
+        """Give back the connections kept in the magazines of all threads.
+
+        Returns the number of connections that have been given back.
+
+        """
+        count = 0
+        for magazine in list(self._magazines.values()):
+            count += self._empty(magazine)
+        return count
+
+    def _empty(self, magazine):
+        """Give back the connections kept in the given magazine.
+
+        Returns the number of connections that have been given back.
+
+        """
+        count = 0
+        while magazine:
+            try:  # another thread may take it at the same time
+                con = magazine.pop()
+            except IndexError:
+                break
+            self._spill(con)
+            count += 1
+        return count
+
+    def _notify(self):
+        """Notify waiting threads that connection slots have become free.
+
+        The free slots are handed over directly to the threads which
+        have been waiting in line longest, so they cannot be taken away
+        by threads requesting a connection later.
+
+        """
+        waiters = self._waiters
+        while waiters and self._connections < self._maxconnections:
+            self._connections += 1
+            waiters.popleft().notify()
+        if self._magazine and not waiters:
+            self._drain = False
+        if self._maxshared:
+            self._shared_lock.notify()
+
+
+# Auxiliary class for the maintenance thread
+
+class PooledDBMaintainer(Thread):
+    """Auxiliary thread for the maintenance of a PooledDB instance."""
+
+    def __init__(self, pool, interval):
+        """Create a maintenance thread.
+
+        pool: the corresponding PooledDB instance
+        interval: the maximum time in seconds between maintenance runs
+
+        """
+        Thread.__init__(self, name='PooledDBMaintainer')
+        self.daemon = True
+        self._pool = ref(pool)  # do not keep the pool alive
+        self._interval = interval
+        self._event = Event()
+        self._stopped = False
+
+    def wake(self):
+        """Run the maintenance as soon as possible."""
+        self._event.set()
+
+    def stop(self):
+        """Stop the maintenance thread."""
+        self._stopped = True
+        self._event.set()
+
+    def run(self):
+        """Maintain the pool until stopped or the pool has been deleted."""
+        while not self._stopped:
+            self._event.wait(self._interval)
+            self._event.clear()
+            if self._stopped:
+                break
+            pool = self._pool()
+            if pool is None:
+                break
+            try:
+                pool.maintain()
+            except Exception:
+                pass
+            del pool
+
+
+# Auxiliary class for the hot spare connections
+
+class PooledDBSpares(Thread):
+    """Auxiliary thread keeping hot spare connections for a PooledDB."""
+
+    retry = 1  # time in seconds to wait after failing to connect
+
+    def __init__(self, pool, count):
+        """Create a thread providing hot spare connections.
+
+        pool: the corresponding PooledDB instance
+        count: the number of spare connections that shall be kept ready
+
+        """
+        Thread.__init__(self, name='PooledDBSpares')
+        self.daemon = True
+        self._pool = ref(pool)  # do not keep the pool alive
+        self._count = count
+        self._cache = deque()  # the steady spare connections
+        self._event = Event()
+        self._stopped = False
+
+    def take(self):
+        """Take the underlying connection of a spare that is still alive.
+
+        The spare is replaced in the background.  If there is no spare
+        connection that is alive, None is returned.
+
+        """
+        cache = self._cache
+        con = None
+        while cache:
+            try:
+                spare = cache.popleft()
+            except IndexError:  # taken by another thread
+                break
+            if spare._ping_check(spare._ping, False) is not False:
+                con = spare._con
+                spare._closed = True  # hand over the connection
+                break
+            spare.close()
+        self._event.set()
+        return con
+
+    def stop(self):
+        """Stop the thread and close the spare connections."""
+        self._stopped = True
+        self._event.set()
+        cache = self._cache
+        while cache:
+            try:
+                cache.popleft().close()
+            except Exception:
+                pass
+
+    def run(self):
+        """Keep spares ready until stopped or the pool has been deleted."""
+        cache = self._cache
+        while not self._stopped:
+            self._event.clear()
+            pool = self._pool()
+            if pool is None:
+                break
+            timeout = None
+            while len(cache) < self._count and not self._stopped:
+                try:
+                    cache.append(pool.steady_connection())
+                except Exception:
+                    timeout = self.retry
+                    break
+            del pool
+            if self._stopped:
+                self.stop()  # close a spare that may have been added
+                break
+            self._event.wait(timeout)
+
+
+# Auxiliary class for the magazines of the threads
+
+class PooledDBMagazine:
+    """Auxiliary magazine of connections kept by a thread for its own reuse.
+
+    When the thread terminates and the magazine is deleted,
+    its connections are given back to the pool.
+
+    """
+
+    __slots__ = ('_cons', '_finalizer', '__weakref__')
+
+    def __init__(self, pool):
+        """Create an empty magazine for the given PooledDB instance."""
+        self._cons = []
+        # do not keep the pool alive
+        self._finalizer = finalize(
+            self, _release_magazine, ref(pool), self._cons)
+
+    def __len__(self):
+        """Get the number of connections kept in the magazine."""
+        return len(self._cons)
+
+    def __iter__(self):
+        """Iterate over the connections kept in the magazine."""
+        return iter(self._cons)
+
+    def append(self, con):
+        """Keep a connection in the magazine."""
+        self._cons.append(con)
+
+    def pop(self):
+        """Take the connection that has been kept last."""
+        return self._cons.pop()
 
 
 # Auxiliary classes for pooled connections
@@ -409,27 +1157,52 @@ class PooledDB:
 class PooledDedicatedDBConnection:
     """Auxiliary proxy class for pooled dedicated connections."""
 
-    def __init__(self, pool, con):
+    __slots__ = (
+        '_pool', '_con', '_scope', '_since', '_finalizer', '__weakref__')
+
+    def __init__(self, pool, con, scope=None):
         """Create a pooled dedicated connection.
 
         pool: the corresponding PooledDB instance
         con: the underlying SteadyDB connection
+        scope: the reentrant scope the connection belongs to, if any
 
         """
-        # basic initialization to make finalizer work
         self._con = None
-        # proper initialization of the connection
+        self._since = None  # time of checkout if metrics are collected
         if not con.threadsafety():
             raise NotSupportedError("Database module is not thread-safe.")
         self._pool = pool
         self._con = con
+        self._scope = scope
+        # give back the connection if this proxy is leaked
+        if scope is None:
+            self._finalizer = finalize(
+                self, _release_leaked, pool.cache, con)
+        else:
+            self._finalizer = finalize(
+                self, _release_leaked, pool._leave, scope)
+
+    def __enter__(self):
+        """Enter the runtime context for the pooled connection."""
+        return self
+
+    def __exit__(self, *exc):
+        """Exit the runtime context, giving back the connection."""
+        self.close()
 
     def close(self):
         """Close the pooled dedicated connection."""
         # Instead of actually closing the connection,
         # return it to the pool for future reuse.
         if self._con:
-            self._pool.cache(self._con)
+            self._finalizer.detach()
+            if self._since is not None:
+                self._pool.metrics.hold(monotonic() - self._since)
+            if self._scope is None:
+                self._pool.cache(self._con)
+            else:
+                self._pool._leave(self._scope)
             self._con = None
 
     def __getattr__(self, name):
@@ -439,17 +1212,12 @@ class PooledDedicatedDBConnection:
         else:
             raise InvalidConnection
 
-    def __del__(self):
-        """Delete the pooled connection."""
-        try:
-            self.close()
-        except Exception:
-            pass
-
 
 class SharedDBConnection:
     """Auxiliary class for shared connections."""
 
+    __slots__ = ('con', 'shared', 'key', 'index')
+
     def __init__(self, con):
         """Create a shared connection.
 
@@ -458,6 +1226,8 @@ class SharedDBConnection:
         """
         self.con = con
         self.shared = 1
+        self.key = None  # the sort key in the shared cache
+        self.index = None  # the position in the shared cache
 
     def __lt__(self, other):
         if self.con._transaction == other.con._transaction:
@@ -493,9 +1263,130 @@ class SharedDBConnection:
         self.shared -= 1
 
 
+class SharedDBCache:
+    """Auxiliary class for the cache of shared connections.
+
+    This is a binary heap ordered like the shared connections, i.e.
+    connections which are not in a transaction and are least shared come
+    first, and among these the ones which have been used least recently.
+    Every shared connection remembers its sort key and position in
+    the heap, so it can be reordered or removed in logarithmic time.
+
+    """
+
+    def __init__(self):
+        """Create an empty cache of shared connections."""
+        self._heap = []
+        self._uses = 0  # serial number of the last use
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __getitem__(self, index):
+        return self._heap[index]
+
+    def top(self):
+        """Get the least shared connection without removing it."""
+        return self._heap[0]
+
+    def push(self, con):
+        """Add a shared connection to the cache."""
+        self._uses += 1
+        con.key = (con.con._transaction, con.shared, self._uses)
+        con.index = len(self._heap)
+        self._heap.append(con)
+        self._sift_up(con.index)
+
+    def pop(self):
+        """Remove and return an arbitrary shared connection."""
+        con = self._heap.pop()
+        con.index = None
+        return con
+
+    def remove(self, con):
+        """Remove a shared connection from the cache."""
+        heap, index = self._heap, con.index
+        if index is None or index >= len(heap) or heap[index] is not con:
+            raise ValueError("Connection is not in the shared cache.")
+        con.index = None
+        last = heap.pop()
+        if last is not con:
+            heap[index] = last
+            last.index = index
+            self._sift_down(index)
+            self._sift_up(last.index)
+
+    def update(self, con, used=False):
+        """Reorder a shared connection after its key has changed.
+
+        If used is set, the connection counts as being used most recently.
+
+        """
+        heap, index = self._heap, con.index
+        if index is None or index >= len(heap) or heap[index] is not con:
+            raise ValueError("Connection is not in the shared cache.")
+        key = con.key
+        if used:
+            self._uses += 1
+            uses = self._uses
+        else:
+            uses = key[2]
+        con.key = (con.con._transaction, con.shared, uses)
+        if con.key < key:
+            self._sift_up(index)
+        elif key < con.key:
+            self._sift_down(index)
+
+    def refresh(self):
+        """Update the keys of all connections and reorder the cache."""
+        heap = self._heap
+        for con in heap:
+            con.key = (con.con._transaction, con.shared, con.key[2])
+        for index in reversed(range(len(heap) // 2)):
+            self._sift_down(index)
+
+    def _sift_up(self, index):
+        """Move the connection at the given index up to its place."""
+        heap = self._heap
+        con = heap[index]
+        while index:
+            parent = (index - 1) >> 1
+            other = heap[parent]
+            if not con.key < other.key:
+                break
+            heap[index] = other
+            other.index = index
+            index = parent
+        heap[index] = con
+        con.index = index
+
+    def _sift_down(self, index):
+        """Move the connection at the given index down to its place."""
+        heap = self._heap
+        size = len(heap)
+        con = heap[index]
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1].key < heap[child].key:
+                child += 1
+            other = heap[child]
+            if not other.key < con.key:
+                break
+            heap[index] = other
+            other.index = index
+            index = child
+        heap[index] = con
+        con.index = index
+
+
 class PooledSharedDBConnection:
     """Auxiliary proxy class for pooled shared connections."""
 
+    __slots__ = (
+        '_pool', '_shared_con', '_con', '_since', '_finalizer', '__weakref__')
+
     def __init__(self, pool, shared_con):
         """Create a pooled shared connection.
 
@@ -503,24 +1394,62 @@ class PooledSharedDBConnection:
         con: the underlying SharedDBConnection
 
         """
-        # basic initialization to make finalizer work
         self._con = None
-        # proper initialization of the connection
+        self._since = None  # time of checkout if metrics are collected
         con = shared_con.con
         if not con.threadsafety() > 1:
             raise NotSupportedError("Database connection is not thread-safe.")
         self._pool = pool
         self._shared_con = shared_con
         self._con = con
+        # unshare the connection if this proxy is leaked
+        self._finalizer = finalize(
+            self, _release_leaked, pool.unshare, shared_con)
+
+    def __enter__(self):
+        """Enter the runtime context for the pooled connection."""
+        return self
+
+    def __exit__(self, *exc):
+        """Exit the runtime context, giving back the connection."""
+        self.close()
 
     def close(self):
         """Close the pooled shared connection."""
         # Instead of actually closing the connection,
         # unshare it and/or return it to the pool.
         if self._con:
+            self._finalizer.detach()
+            if self._since is not None:
+                self._pool.metrics.hold(monotonic() - self._since)
             self._pool.unshare(self._shared_con)
             self._shared_con = self._con = None
 
+    def begin(self, *args, **kwargs):
+        """Begin a transaction, preventing that the connection is shared."""
+        self._transaction_method('begin', *args, **kwargs)
+
+    def commit(self):
+        """Commit the transaction, allowing the connection to be shared."""
+        self._transaction_method('commit')
+
+    def rollback(self):
+        """Rollback the transaction, allowing the connection to be shared."""
+        self._transaction_method('rollback')
+
+    def cancel(self):
+        """Cancel the transaction, allowing the connection to be shared."""
+        self._transaction_method('cancel')
+
+    def _transaction_method(self, name, *args, **kwargs):
+        """Call a method changing the transaction state and tell the pool."""
+        if not self._con:
+            raise InvalidConnection
+        try:
+            getattr(self._con, name)(*args, **kwargs)
+        finally:
+            self._pool.update_shared(self._shared_con)
+
     def __getattr__(self, name):
         """Proxy all members of the class."""
         if self._con:
@@ -528,9 +1457,66 @@ class PooledSharedDBConnection:
         else:
             raise InvalidConnection
 
-    def __del__(self):
-        """Delete the pooled connection."""
-        try:
-            self.close()
-        except Exception:
-            pass
+
+class PooledLazyDBConnection:
+    """Auxiliary proxy class for lazily acquired pooled connections."""
+
+    __slots__ = ('_pool', '_shareable', '_timeout', '_con', '_closed')
+
+    def __init__(self, pool, shareable=True, timeout=None):
+        """Create a lazy pooled connection.
+
+        pool: the corresponding PooledDB instance
+        shareable, timeout: the parameters for getting the connection
+
+        """
+        self._pool = pool
+        self._shareable = shareable
+        self._timeout = timeout
+        self._con = None
+        self._closed = False
+
+    def __enter__(self):
+        """Enter the runtime context for the pooled connection."""
+        return self
+
+    def __exit__(self, *exc):
+        """Exit the runtime context, giving back the connection."""
+        self.close()
+
+    def _acquire(self):
+        """Get the connection from the pool if this has not been done."""
+        con = self._con
+        if con is None:
+            if self._closed:
+                raise InvalidConnection
+            con = self._con = self._pool.connection(
+                self._shareable, self._timeout)
+        return con
+
+    def close(self):
+        """Close the lazy pooled connection."""
+        # Give back the connection if it has been taken from the pool.
+        con = self._con
+        if con is not None:
+            self._con = None
+            con.close()
+        self._closed = True
+
+    def commit(self):
+        """Commit the transaction if the connection has been used."""
+        if self._con is not None:
+            self._con.commit()
+        elif self._closed:
+            raise InvalidConnection
+
+    def rollback(self):
+        """Rollback the transaction if the connection has been used."""
+        if self._con is not None:
+            self._con.rollback()
+        elif self._closed:
+            raise InvalidConnection
+
+    def __getattr__(self, name):
+        """Proxy all members of the class, getting the connection first."""
+        return getattr(self._acquire(), name)
@@ -47,6 +47,12 @@ an instance of PooledPg, passing the following parameters:
         the connection is automatically reset (closed and reopened).
     setsession: an optional list of SQL commands that may serve to
         prepare the session, e.g. ["set datestyle to german", ...]
+    metrics: whether usage statistics of the pool shall be collected
+        (the default value False means no statistics; if you set this
+        to True, they are collected in a PoolMetrics instance which is
+        available as the metrics attribute of the pool, but you can
+        also pass your own instance)
+        This parameter can only be passed as keyword argument.
 
     Additionally, you have to pass the parameters for the actual
     PostgreSQL connection which are passed via PyGreSQL,
@@ -63,6 +69,14 @@ database connections from that pool:
 
     db = pool.connection()
 
+If the maximum number of connections has been reached, you can
+specify how many seconds you are willing to wait for a connection:
+
+    db = pool.connection(timeout=5)
+
+If no connection becomes available in time, TooManyConnections will be
+raised.  Threads waiting for connections are served in order.
+
 You can use these connections just as if they were ordinary
 classic PyGreSQL API connections.  Actually what you get is a
 proxy class for the hardened SteadyPg version of the connection.
@@ -83,6 +97,18 @@ connection object stays alive as long as you are using it, like that:
     res = db.query(...).getresult()
     db.close()  # or del db
 
+You can also use the connection as a context manager, which gives it
+back to the pool as soon as the block is left:
+
+    with pool.connection() as db:
+        res = db.query(...).getresult()
+
+If you are not sure whether you will need the connection at all, you can
+ask for a lazy connection which takes a connection from the pool only
+when you begin a transaction, run a query or use any other method:
+
+    db = pool.connection(lazy=True)
+
 Note that you need to explicitly start transactions by calling the
 begin() method.  This ensures that the transparent reopening will be
 suspended until the end of the transaction, and that the connection will
@@ -94,7 +120,8 @@ Ideas for improvement:
 
 * Add a thread for monitoring, restarting (or closing) bad or expired
   connections (similar to DBConnectionPool/ResourcePool by Warren Smith).
-* Optionally log usage, bad connections and exceeding of limits.
+* Optionally log bad connections and exceeding of limits
+  in addition to counting them in the metrics of the pool.
 
 
 Copyright, credits and license:
@@ -108,11 +135,23 @@ Licensed under the MIT license.
 
 """
 
+from collections import deque
+from threading import Event, Lock
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+try:
+    from weakref import finalize
+except ImportError:  # Python 2
+    from DBUtils.Finalize import finalize
+
 try:
     from Queue import Queue, Empty, Full
 except ImportError:  # Python 3
     from queue import Queue, Empty, Full
 
+from DBUtils.PoolMetrics import PoolMetrics
 from DBUtils.SteadyPg import SteadyPgConnection
 
 __version__ = '1.3'
@@ -130,6 +169,14 @@ class TooManyConnections(PooledPgError):
     """Too many database connections were opened."""
 
 
+def _release_leaked(release, con):
+    """Give back a connection whose pooled proxy has been leaked."""
+    try:
+        release(con)
+    except Exception:
+        pass
+
+
 class PooledPg:
     """Pool for classic PyGreSQL connections.
 
@@ -164,11 +211,17 @@ class PooledPg:
             the session, e.g. ["set datestyle to ...", "set time zone ..."]
         reset: how connections should be reset when returned to the pool
             (0 or None to rollback transcations started with begin(),
-            1 to always issue a rollback, 2 for a complete reset)
+            1 to issue a rollback unless the session is known to be clean,
+            2 for a complete reset)
+        metrics: whether usage statistics shall be collected
+            (False by default; if True, a PoolMetrics instance is created,
+            but you can also pass your own instance)
         args, kwargs: the parameters that shall be used to establish
             the PostgreSQL connections using class PyGreSQL pg.DB()
 
         """
+        # this option can only be passed as a keyword argument
+        metrics = kwargs.pop('metrics', False)
         self._args, self._kwargs = args, kwargs
         self._maxusage = maxusage
         self._setsession = setsession
@@ -186,32 +239,66 @@ class PooledPg:
             if maxconnections < maxcached:
                 maxconnections = maxcached
             # Create semaphore for number of allowed connections generally:
-            from threading import Semaphore
-            self._connections = Semaphore(maxconnections)
+            self._connections = PooledPgSemaphore(maxconnections)
             self._blocking = blocking
         else:
             self._connections = None
         self._cache = Queue(maxcached)  # the actual connection pool
+        self.metrics = None  # do not record the initial connections
         # Establish an initial number of database connections:
         idle = [self.connection() for i in range(mincached)]
+        metrics = PoolMetrics() if metrics is True else metrics or None
         while idle:
-            idle.pop().close()
+            con = idle.pop()
+            con._con._metrics = metrics
+            con.close()
+        self.metrics = metrics
 
     def steady_connection(self):
         """Get a steady, unpooled PostgreSQL connection."""
-        return SteadyPgConnection(self._maxusage, self._setsession, True,
-                                  *self._args, **self._kwargs)
+        con = SteadyPgConnection(self._maxusage, self._setsession, True,
+                                 *self._args, **self._kwargs)
+        con._metrics = self.metrics
+        return con
+
+    def connection(self, timeout=None, lazy=False):
+        """Get a steady, cached PostgreSQL connection from the pool.
+
+        If the maximum number of connections has been reached, then
+        by default the call blocks or fails depending on the blocking
+        parameter of the pool.  If a timeout in seconds is given, the
+        call waits at most that long before TooManyConnections is raised.
+
+        If lazy is set, the connection will be taken from the pool only
+        when it is actually used for the first time.
 
-    def connection(self):
-        """Get a steady, cached PostgreSQL connection from the pool."""
+        """
+        if lazy:
+            return PooledLazyPgConnection(self, timeout)
+        metrics = self.metrics
+        if metrics:
+            start = monotonic()
         if self._connections:
-            if not self._connections.acquire(self._blocking):
+            if timeout is None:
+                acquired = self._connections.acquire(self._blocking)
+            else:
+                acquired = self._connections.acquire(True, timeout)
+            if not acquired:
+                if metrics:
+                    metrics.reject()
                 raise TooManyConnections
         try:
             con = self._cache.get(0)
+            fresh = False
         except Empty:
             con = self.steady_connection()
-        return PooledPgConnection(self, con)
+            fresh = True
+        con = PooledPgConnection(self, con)
+        if metrics:
+            now = monotonic()
+            metrics.checkout(now - start, fresh)
+            con._since = now
+        return con
 
     def cache(self, con):
         """Put a connection back into the pool cache."""
@@ -219,7 +306,7 @@ class PooledPg:
             if self._reset == 2:
                 con.reset()  # reset the connection completely
             else:
-                if self._reset or con._transaction:
+                if con._transaction or self._reset and con._in_transaction():
                     try:
                         con.rollback()  # rollback a possible transaction
                     except Exception:
@@ -252,11 +339,68 @@ class PooledPg:
             pass
 
 
+# Auxiliary class for limiting the number of connections
+
+class PooledPgSemaphore:
+    """Auxiliary semaphore serving waiting threads in arrival order.
+
+    Unlike threading.Semaphore, a released slot is handed over directly
+    to the thread that has been waiting longest, so that it cannot be
+    taken away by threads requesting a connection later.
+
+    """
+
+    def __init__(self, value):
+        """Create a semaphore with the given number of slots."""
+        self._lock = Lock()
+        self._value = value
+        self._waiters = deque()
+
+    def acquire(self, blocking=True, timeout=None):
+        """Acquire a slot, waiting at most timeout seconds if blocking."""
+        self._lock.acquire()
+        try:
+            if self._value > 0:
+                self._value -= 1
+                return True
+            if not blocking or timeout is not None and timeout <= 0:
+                return False
+            waiter = Event()
+            self._waiters.append(waiter)
+        finally:
+            self._lock.release()
+        # the waiter event will be set when a slot is handed over
+        if waiter.wait(timeout):
+            return True
+        self._lock.acquire()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:  # a slot has been handed over just in time
+            return True
+        else:
+            return False
+        finally:
+            self._lock.release()
+
+    def release(self):
+        """Release a slot, handing it over to the first waiting thread."""
+        self._lock.acquire()
+        try:
+            if self._waiters:
+                self._waiters.popleft().set()
+            else:
+                self._value += 1
+        finally:
+            self._lock.release()
+
+
 # Auxiliary class for pooled connections
 
 class PooledPgConnection:
     """Proxy class for pooled PostgreSQL connections."""
 
+    __slots__ = ('_pool', '_con', '_since', '_finalizer', '__weakref__')
+
     def __init__(self, pool, con):
         """Create a pooled DB-API 2 connection.
 
@@ -266,12 +410,26 @@ class PooledPgConnection:
         """
         self._pool = pool
         self._con = con
+        self._since = None  # time of checkout if metrics are collected
+        # give back the connection if this proxy is leaked
+        self._finalizer = finalize(self, _release_leaked, pool.cache, con)
+
+    def __enter__(self):
+        """Enter the runtime context for the pooled connection."""
+        return self
+
+    def __exit__(self, *exc):
+        """Exit the runtime context, giving back the connection."""
+        self.close()
 
     def close(self):
         """Close the pooled connection."""
         # Instead of actually closing the connection,
         # return it to the pool so it can be reused.
         if self._con:
+            self._finalizer.detach()
+            if self._since is not None:
+                self._pool.metrics.hold(monotonic() - self._since)
             self._pool.cache(self._con)
             self._con = None
 
@@ -283,7 +441,9 @@ class PooledPgConnection:
         if self._con:
             self._con.reopen()
         else:
-            self._con = self._pool.connection()
+            self._con = con = self._pool.connection()
+            self._finalizer = finalize(
+                self, _release_leaked, self._pool.cache, con)
 
     def __getattr__(self, name):
         """Proxy all members of the class."""
@@ -292,9 +452,73 @@ class PooledPgConnection:
         else:
             raise InvalidConnection
 
-    def __del__(self):
-        """Delete the pooled connection."""
-        try:
-            self.close()
-        except Exception:
-            pass
+
+class PooledLazyPgConnection:
+    """Proxy class for lazily acquired pooled PostgreSQL connections."""
+
+    __slots__ = ('_pool', '_timeout', '_con', '_closed')
+
+    def __init__(self, pool, timeout=None):
+        """Create a lazy pooled connection.
+
+        pool: the corresponding PooledPg instance
+        timeout: the timeout for getting the connection
+
+        """
+        self._pool = pool
+        self._timeout = timeout
+        self._con = None
+        self._closed = False
+
+    def __enter__(self):
+        """Enter the runtime context for the pooled connection."""
+        return self
+
+    def __exit__(self, *exc):
+        """Exit the runtime context, giving back the connection."""
+        self.close()
+
+    def _acquire(self):
+        """Get the connection from the pool if this has not been done."""
+        con = self._con
+        if con is None:
+            if self._closed:
+                raise InvalidConnection
+            con = self._con = self._pool.connection(self._timeout)
+        return con
+
+    def close(self):
+        """Close the lazy pooled connection."""
+        # Give back the connection if it has been taken from the pool.
+        con = self._con
+        if con is not None:
+            self._con = None
+            con.close()
+        self._closed = True
+
+    def reopen(self):
+        """Reopen the lazy pooled connection."""
+        # If the connection has not been taken from the pool yet,
+        # it will be taken when it is used for the first time.
+        if self._con is None:
+            self._closed = False
+        else:
+            self._con.reopen()
+
+    def commit(self, sql=None):
+        """Commit the transaction if the connection has been used."""
+        if self._con is not None:
+            return self._con.commit(sql)
+        elif self._closed:
+            raise InvalidConnection
+
+    def rollback(self, sql=None):
+        """Rollback the transaction if the connection has been used."""
+        if self._con is not None:
+            return self._con.rollback(sql)
+        elif self._closed:
+            raise InvalidConnection
+
+    def __getattr__(self, name):
+        """Proxy all members of the class, getting the connection first."""
+        return getattr(self._acquire(), name)
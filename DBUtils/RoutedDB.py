@@ -0,0 +1,581 @@
+"""RoutedDB - read/write splitting for pooled DB-API 2 connections.
+
+Implements a router that distributes the work over a pool of connections
+to a primary database and pools of connections to its replicas.
+
+Read-only work is done on connections from the replica pools, while
+transactions started with begin() and work flagged as a write go to the
+primary database.  Since all connections are taken from ordinary pools
+such as PooledDB or MultiPooledDB, they are hardened SteadyDB connections
+that are transparently reopened when they have been lost.
+
+
+Usage:
+
+First you need to set up the connection pools for the primary database
+and its replicas, and then create an instance of RoutedDB, passing the
+following parameters:
+
+    primary: the pool of connections to the primary database
+    replicas: a list of pools of connections to the replicas
+        (if there are no replicas, all work is done on the primary)
+    sticky: time in seconds during which a thread gets connections to
+        the primary database even for read-only work after it has done a
+        write, so that it can read its own writes even if the replicas
+        are lagging behind (the default of 0 or None means no such time)
+    lagquery: an optional SQL query returning the replication lag of a
+        replica in seconds, e.g. for PostgreSQL "select extract(epoch
+        from now() - pg_last_xact_replay_timestamp())"
+    maxlag: the maximum replication lag in seconds that is acceptable
+        for reading from a replica (must be set with the lagquery)
+    lagcheck: the interval in seconds for checking the replication lag
+        (the default is 5 seconds)
+
+For instance, if you are using pgdb as your DB-API 2 database module and
+have a primary database with two replicas:
+
+    import pgdb  # import used DB-API 2 module
+    from DBUtils.PooledDB import PooledDB
+    from DBUtils.RoutedDB import RoutedDB
+    primary = PooledDB(pgdb, 5, host='db0', database='mydb')
+    replicas = [PooledDB(pgdb, 5, host=host, database='mydb')
+        for host in ('db1', 'db2')]
+    router = RoutedDB(primary, replicas, sticky=5)
+
+You can then request connections from the router:
+
+    db = router.connection()
+
+This connection will be taken from one of the replica pools when it is
+used for the first time.  However, if you call db.begin(), then the
+transaction will be done on a connection to the primary database.
+Note that writes done without begin() must be flagged like this:
+
+    db = router.connection(write=True)
+
+If none of the replica pools can provide a connection, for instance
+because all replicas are down, the primary database is used instead.
+
+If you pass a lagquery, a background thread runs this query periodically
+on a dedicated steady connection to every replica, which is taken from
+its pool with the steady_connection() method.  Replicas with a lag above
+maxlag or where the query fails are skipped when distributing the reads.
+When they have caught up, they get an increasing share of the reads
+with every check until they are fully back in service.  The lags that
+have been measured last are available in the lags list of the router.
+
+As with the pools, you can also use the connections of the router
+as context managers or return them with db.close().
+
+For latency-critical reads, you can let the router run a query as a
+hedged request and fetch all of its rows:
+
+    rows = router.execute_hedged('select ...', params)
+
+The query is executed on one of the replicas first.  If it does not
+return within the 95th percentile of the latencies of the recent hedged
+queries, it is executed on a second replica as well.  The rows of the
+query that finishes first are returned, and the other query is cancelled
+with the cancel() method of its connection if the driver supports this.
+
+
+Copyright, credits and license:
+
+Licensed under the MIT license.
+
+"""
+
+from collections import deque
+from itertools import count
+from random import random
+from threading import Event, Lock, Thread, local
+from weakref import ref
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the futures backport
+    ThreadPoolExecutor = None
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+try:
+    from weakref import finalize
+except ImportError:  # Python 2
+    from DBUtils.Finalize import finalize
+
+try:
+    from Queue import Queue, Empty
+except ImportError:  # Python 3
+    from queue import Queue, Empty
+
+from DBUtils.PooledDB import InvalidConnection
+
+__version__ = '1.3'
+
+
+def _stop_threads(executor, monitor):
+    """Stop the hedging and monitoring threads of a deleted router."""
+    if monitor:
+        monitor.stop()
+    executor.shutdown(wait=False)
+
+
+class RoutedDB:
+    """Router for pooled DB-API 2 connections to primary and replicas.
+
+    After you have created the router, you can use connection()
+    to get connections to the primary database or its replicas.
+
+    """
+
+    version = __version__
+
+    def __init__(
+            self, primary, replicas=None, sticky=0,
+            lagquery=None, maxlag=None, lagcheck=5):
+        """Set up the router for the given connection pools.
+
+        primary: the pool of connections to the primary database
+        replicas: the list of pools of connections to the replicas
+        sticky: time in seconds during which threads use the primary
+            database for reading after they have written to it
+            (0 or None means that reads are always done on replicas)
+        lagquery: SQL query returning the replication lag in seconds
+            (None means that the lag of the replicas is not checked)
+        maxlag: the maximum acceptable replication lag in seconds
+        lagcheck: the interval in seconds for checking the lag
+
+        """
+        self.primary = primary
+        self.replicas = list(replicas or ())
+        self._sticky = sticky or 0
+        self._turn = count()
+        self._thread = local()  # holds the time of the last write
+        self._latencies = deque(maxlen=100)  # of recent hedged queries
+        # the worker threads of hedged queries are started on demand
+        if ThreadPoolExecutor is None:
+            self._executor = RoutedDBExecutor()
+        else:
+            try:
+                self._executor = ThreadPoolExecutor(
+                    thread_name_prefix='RoutedDBHedge')
+            except TypeError:  # Python < 3.6
+                self._executor = ThreadPoolExecutor()
+        self._monitor = None
+        if lagquery:
+            if not maxlag or maxlag < 0:
+                raise ValueError("'maxlag' must be a positive time.")
+            for pool in self.replicas:
+                if not callable(getattr(pool, 'steady_connection', None)):
+                    raise TypeError("Replica pools must provide"
+                                    " steady_connection() to check the lag.")
+            self._lagquery = lagquery
+            self._maxlag = maxlag
+            self._lagcons = [None] * len(self.replicas)
+            self.lags = [None] * len(self.replicas)
+            self._weights = [1] * len(self.replicas)
+            self.check_lag()
+            self._monitor = RoutedDBMonitor(self, lagcheck)
+            self._monitor.start()
+        else:
+            self._weights = None
+        # stop the threads when the router is deleted without closing it
+        finalize(self, _stop_threads, self._executor, self._monitor)
+
+    def connection(self, write=False, shareable=True, timeout=None):
+        """Get a connection to the primary database or a replica.
+
+        If write is set, the connection will be taken from the pool of
+        the primary database.  Otherwise, it will be taken from one of
+        the replica pools when it is used for the first time, unless
+        a transaction is started with begin() before.
+
+        """
+        return RoutedDBConnection(self, write, shareable, timeout)
+
+    def _choose(self):
+        """Get the order in which the replica pools shall be tried."""
+        replicas = self.replicas
+        weights = self._weights
+        if weights is not None:  # skip lagging replicas, draw the others
+            candidates = [i for i, weight in enumerate(weights) if weight]
+            replicas = []
+            while candidates:
+                draw = random() * sum(weights[i] for i in candidates)
+                for i in candidates:
+                    draw -= weights[i]
+                    if draw < 0:
+                        break
+                candidates.remove(i)
+                replicas.append(self.replicas[i])
+        elif len(replicas) > 1:
+            turn = next(self._turn) % len(replicas)
+            replicas = replicas[turn:] + replicas[:turn]
+        return replicas
+
+    def _readable(self):
+        """Get the replica pools that can be used for reading."""
+        sticky = self._sticky
+        if sticky and monotonic() - getattr(
+                self._thread, 'written', -sticky) < sticky:
+            return []  # the thread must read its own writes
+        return self._choose()
+
+    def _read(self, shareable, timeout):
+        """Get a connection for read-only work."""
+        for pool in self._readable():
+            try:
+                return pool.connection(shareable, timeout)
+            except Exception:  # try the next replica
+                pass
+        return self.primary.connection(shareable, timeout)
+
+    def _write(self, shareable, timeout):
+        """Get a connection for a write or transaction."""
+        return self.primary.connection(shareable, timeout)
+
+    def _written(self):
+        """Remember that the current thread has written."""
+        if self._sticky:
+            self._thread.written = monotonic()
+
+    def execute_hedged(self, sql, params=None, percentile=95, delay=0.05):
+        """Execute a read query hedged across two replicas.
+
+        The query is executed on one of the replicas.  If it does not
+        return within the given percentile of the latencies of recent
+        hedged queries, or within the given delay in seconds as long as
+        not enough latencies have been recorded, or if it fails, it is
+        executed on a second replica as well.  The rows of the query
+        that finishes first are returned, the other one is cancelled.
+        If both queries fail, the error of the first query is raised.
+
+        """
+        pools = self._readable()
+        if len(pools) < 2:  # nothing to hedge
+            db = self.connection()
+            try:
+                cursor = db.cursor()
+                try:
+                    if params is None:
+                        cursor.execute(sql)
+                    else:
+                        cursor.execute(sql, params)
+                    return cursor.fetchall()
+                finally:
+                    cursor.close()
+            finally:
+                db.close()
+        delay = self._hedge_delay(percentile, delay)
+        hedge = RoutedDBHedge(sql, params, self._executor)
+        hedge.start(0, pools[0])
+        running, hedged, errors = 1, False, [None, None]
+        while running:
+            try:
+                index, rows, error, latency = hedge.results.get(
+                    timeout=None if hedged else delay)
+            except Empty:  # the first query is too slow
+                pass
+            else:
+                running -= 1
+                if error is None:
+                    hedge.finish()  # cancel the other query
+                    self._latencies.append(latency)
+                    return rows
+                errors[index] = error
+            if not hedged:
+                hedge.start(1, pools[1])
+                running, hedged = running + 1, True
+        raise errors[0]  # the error of the first query
+
+    def _hedge_delay(self, percentile, delay):
+        """Get the delay after which a query shall be hedged."""
+        latencies = sorted(self._latencies)
+        if len(latencies) < 10:  # not enough latencies recorded
+            return delay
+        return latencies[min(
+            len(latencies) * percentile // 100, len(latencies) - 1)]
+
+    def check_lag(self):
+        """Check the replication lag of all replicas.
+
+        This is done periodically by the monitoring thread.
+
+        """
+        for index in range(len(self.replicas)):
+            try:
+                lag = self._measure(index)
+            except Exception:
+                lag = None
+            self._update(index, lag)
+
+    def _measure(self, index):
+        """Measure the replication lag of the given replica.
+
+        Returns None if the lag query returned no row or a NULL value.
+
+        """
+        con = self._lagcons[index]
+        if con is None:
+            con = self._lagcons[index] = self.replicas[
+                index].steady_connection()
+        cursor = con.cursor()
+        try:
+            cursor.execute(self._lagquery)
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        con._reset(True)  # do not keep a transaction open
+        if isinstance(row, (list, tuple)):
+            row = row[0] if row else None
+        return None if row is None else float(row)
+
+    def _update(self, index, lag):
+        """Update the weight of the given replica for the measured lag."""
+        self.lags[index] = lag
+        if lag is None or lag > self._maxlag:
+            self._weights[index] = 0  # skip this replica
+        else:  # let the replica gradually come back into service
+            weight = self._weights[index]
+            if weight < 1:
+                self._weights[index] = min(weight * 2, 1) if weight else 0.125
+
+    def close(self):
+        """Close all connections in the primary and replica pools."""
+        if self._monitor:
+            self._monitor.stop()
+            self._monitor = None
+            for con in self._lagcons:
+                if con is not None:
+                    con.close()
+        self._executor.shutdown(wait=False)
+        self.primary.close()
+        for pool in self.replicas:
+            pool.close()
+
+
+# Auxiliary classes for hedged queries
+
+class RoutedDBExecutor:
+    """Auxiliary executor starting a thread for every hedged query.
+
+    This is only used if the concurrent.futures module is not available.
+
+    """
+
+    def __init__(self):
+        """Create the executor."""
+        self._shutdown = False
+
+    def submit(self, func, *args):
+        """Run the function with the given arguments in a new thread."""
+        if self._shutdown:
+            raise RuntimeError("The executor has been shut down.")
+        thread = Thread(target=func, args=args, name='RoutedDBHedge')
+        thread.daemon = True
+        thread.start()
+
+    def shutdown(self, wait=True):
+        """Do not accept any further queries."""
+        self._shutdown = True
+
+
+class RoutedDBHedge:
+    """Auxiliary class running a read query on several replicas."""
+
+    def __init__(self, sql, params, executor):
+        """Create a hedged query.
+
+        sql: the SQL query that shall be executed
+        params: the parameters of the query or None
+        executor: the executor running the queries
+
+        """
+        self.sql, self.params = sql, params
+        self.results = Queue()  # of index, rows, error and latency
+        self._executor = executor
+        self._lock = Lock()
+        self._running = []  # connections of the running queries
+        self._finished = False
+
+    def start(self, index, pool):
+        """Run the query with the given index on the given pool."""
+        try:
+            self._executor.submit(self.run, index, pool)
+        except RuntimeError as error:  # the executor has been shut down
+            self.results.put((index, None, error, None))
+
+    def finish(self):
+        """Cancel all queries that are still running."""
+        with self._lock:
+            self._finished = True
+            for db in self._running:
+                try:
+                    db.cancel()
+                except Exception:
+                    pass
+
+    def run(self, index, pool):
+        """Run the query and put its result into the queue."""
+        start = monotonic()
+        try:
+            db = pool.connection(False)
+        except Exception as error:
+            self.results.put((index, None, error, None))
+            return
+        try:
+            with self._lock:
+                if self._finished:
+                    return
+                self._running.append(db)
+            try:  # a cancelled query is not executed again
+                cursor = db.cursor()
+                try:
+                    if self.params is None:
+                        cursor.execute(self.sql)
+                    else:
+                        cursor.execute(self.sql, self.params)
+                    result = (
+                        index, cursor.fetchall(), None, monotonic() - start)
+                finally:
+                    cursor.close()
+            except Exception as error:
+                result = index, None, error, None
+            with self._lock:
+                self._running.remove(db)
+            self.results.put(result)
+        finally:
+            db.close()
+
+
+# Auxiliary class for the lag monitoring thread
+
+class RoutedDBMonitor(Thread):
+    """Auxiliary thread checking the replication lag for a RoutedDB."""
+
+    def __init__(self, router, interval):
+        """Create a monitoring thread.
+
+        router: the corresponding RoutedDB instance
+        interval: the time in seconds between the lag checks
+
+        """
+        Thread.__init__(self, name='RoutedDBMonitor')
+        self.daemon = True
+        self._router = ref(router)  # do not keep the router alive
+        self._interval = interval
+        self._event = Event()
+        self._stopped = False
+
+    def stop(self):
+        """Stop the monitoring thread."""
+        self._stopped = True
+        self._event.set()
+
+    def run(self):
+        """Check the lag until stopped or the router has been deleted."""
+        while not self._stopped:
+            self._event.wait(self._interval)
+            if self._stopped:
+                break
+            router = self._router()
+            if router is None:
+                break
+            try:
+                router.check_lag()
+            except Exception:
+                pass
+            del router
+
+
+class RoutedDBConnection:
+    """Auxiliary proxy class for routed connections."""
+
+    __slots__ = (
+        '_router', '_shareable', '_timeout',
+        '_con', '_replica', '_primary', '_write', '_closed')
+
+    def __init__(self, router, write, shareable, timeout):
+        """Create a routed connection.
+
+        router: the corresponding RoutedDB instance
+        write: whether the connection shall be used for writing
+        shareable: whether the connection may be shared
+        timeout: how long to wait for a connection from the pools
+
+        """
+        self._router = router
+        self._shareable = shareable
+        self._timeout = timeout
+        self._replica = None
+        self._closed = False
+        if write:
+            self._con = self._primary = router._write(shareable, timeout)
+        else:
+            self._con = self._primary = None
+        self._write = bool(write)
+
+    def __enter__(self):
+        """Enter a runtime context for the connection."""
+        return self
+
+    def __exit__(self, *exc):
+        """Exit a runtime context for the connection."""
+        self.close()
+
+    def _acquire(self):
+        """Get the connection for all further work, if not yet done."""
+        con = self._con
+        if con is None:
+            if self._closed:
+                raise InvalidConnection
+            con = self._con = self._replica = self._router._read(
+                self._shareable, self._timeout)
+        return con
+
+    def begin(self, *args, **kwargs):
+        """Begin a transaction on the primary database."""
+        if self._closed:
+            raise InvalidConnection
+        con = self._primary
+        if con is None:
+            con = self._con = self._primary = self._router._write(
+                self._shareable, self._timeout)
+        self._write = True
+        con.begin(*args, **kwargs)
+
+    def commit(self):
+        """Commit the transaction if a connection has been acquired."""
+        if self._con is not None:
+            self._con.commit()
+        elif self._closed:
+            raise InvalidConnection
+
+    def rollback(self):
+        """Rollback the transaction if a connection has been acquired."""
+        if self._con is not None:
+            self._con.rollback()
+        elif self._closed:
+            raise InvalidConnection
+
+    def close(self):
+        """Close the routed connection.
+
+        The underlying connections will be returned to their pools.
+
+        """
+        if not self._closed:
+            self._closed = True
+            self._con = None
+            replica, self._replica = self._replica, None
+            if replica is not None:
+                replica.close()
+            primary, self._primary = self._primary, None
+            if primary is not None:
+                primary.close()
+                if self._write:
+                    self._router._written()
+
+    def __getattr__(self, name):
+        """Proxy all members of the class."""
+        return getattr(self._acquire(), name)
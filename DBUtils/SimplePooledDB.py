@@ -73,6 +73,11 @@ Licensed under the MIT license.
 
 """
 
+try:
+    from weakref import finalize
+except ImportError:  # Python 2
+    from DBUtils.Finalize import finalize
+
 __version__ = '1.3'
 
 
@@ -95,12 +100,21 @@ class PooledDBConnection:
     def __init__(self, pool, con):
         self._con = con
         self._pool = pool
+        # return the connection if this proxy is leaked
+        self._finalizer = finalize(self, pool.returnConnection, con)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def close(self):
         """Close the pooled connection."""
         # Instead of actually closing the connection,
         # return it to the pool so it can be reused.
         if self._con is not None:
+            self._finalizer.detach()
             self._pool.returnConnection(self._con)
             self._con = None
 
@@ -108,9 +122,6 @@ class PooledDBConnection:
         # All other members are the same.
         return getattr(self._con, name)
 
-    def __del__(self):
-        self.close()
-
 
 class PooledDB:
     """A very simple database connection pool.
@@ -68,6 +68,11 @@ Licensed under the MIT license.
 
 """
 
+try:
+    from weakref import finalize
+except ImportError:  # Python 2
+    from DBUtils.Finalize import finalize
+
 from pg import DB as PgConnection
 
 __version__ = '1.3'
@@ -84,12 +89,21 @@ class PooledPgConnection:
     def __init__(self, pool, con):
         self._con = con
         self._pool = pool
+        # return the connection if this proxy is leaked
+        self._finalizer = finalize(self, pool.cache, con)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def close(self):
         """Close the pooled connection."""
         # Instead of actually closing the connection,
         # return it to the pool so it can be reused.
         if self._con is not None:
+            self._finalizer.detach()
             self._pool.cache(self._con)
             self._con = None
 
@@ -97,9 +111,6 @@ class PooledPgConnection:
         # All other members are the same.
         return getattr(self._con, name)
 
-    def __del__(self):
-        self.close()
-
 
 class PooledPg:
     """A very simple PostgreSQL connection pool.
@@ -71,6 +71,27 @@ without further notice.
     ...
     db.close()
 
+When the database is down, every attempt to reopen a connection will
+hit the database server again.  In order to avoid such reconnect storms
+with many threads, you can pass a circuit breaker as the keyword
+argument breaker, either as an instance of SteadyDBBreaker or as the
+number of consecutive failures to connect after which the circuit
+breaker opens.  In the latter case, the circuit breaker is shared by
+all steady connections with the same creator and connection parameters,
+so that connections to different database hosts use different breakers.
+While it is open, any attempt to connect fails fast with a BreakerOpen
+error.  After a backoff time, one attempt is let through as a probe.
+If it succeeds, connecting is possible again, otherwise the backoff time
+is doubled.
+
+After a restart of the database, all connections may need to be
+reopened at the same time.  In order to limit the rate and number of
+concurrent attempts to connect, you can pass an instance of
+SteadyDBLimiter as the keyword argument limiter.  If you pass the same
+instance to all pools and connections, the limit is process-wide.
+Attempts beyond the limit wait in line, and if they cannot be made
+within the timeout of the limiter, a TooManyConnects error is raised.
+
 
 Ideas for improvement:
 
@@ -92,6 +113,29 @@ Licensed under the MIT license.
 
 import sys
 
+try:
+    from os import get_blocking, set_blocking
+except ImportError:  # Python 2 or Windows
+    get_blocking = set_blocking = None
+from random import random
+from select import select
+try:
+    from select import poll, POLLIN, POLLERR, POLLHUP, POLLNVAL
+except ImportError:  # poll() is not available on Windows
+    poll = None
+try:  # this tells whether the peer has closed the connection
+    from select import POLLRDHUP
+except ImportError:  # only available on Linux
+    POLLRDHUP = 0
+from socket import (
+    fromfd, getdefaulttimeout, AF_INET, SOCK_STREAM, MSG_PEEK)
+from threading import Condition, Lock
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+from weakref import WeakKeyDictionary
+
 __version__ = '1.3'
 
 try:
@@ -108,6 +152,259 @@ class InvalidCursor(SteadyDBError):
     """Database cursor is invalid."""
 
 
+class BreakerOpen(SteadyDBError):
+    """Connecting is refused while the circuit breaker is open."""
+
+
+class TooManyConnects(SteadyDBError):
+    """Too many attempts to connect are waiting for the limiter."""
+
+
+def _socket_alive(fd):
+    """Check whether the socket with the given file descriptor is alive.
+
+    This neither blocks nor needs a round trip to the database server,
+    but it only detects sockets that have been closed or reset.
+
+    """
+    if fd < 0:
+        return False
+    if poll is None:  # select() only takes file descriptors below 1024
+        if not select((fd,), (), (), 0)[0]:
+            return True  # nothing to read, so the socket is still open
+    else:  # poll() takes any file descriptor
+        poller = poll()
+        poller.register(fd, POLLIN | POLLRDHUP)
+        events = poller.poll(0)
+        if not events:
+            return True  # nothing to read, so the socket is still open
+        if events[0][1] & (POLLERR | POLLHUP | POLLNVAL | POLLRDHUP):
+            return False  # the socket has been closed or is not open
+        if POLLRDHUP:
+            return True  # there is only some pending data to read
+    # the duplicate socket shares the blocking mode with the original,
+    # and creating it changes that mode if a default timeout is set
+    blocking = None
+    if get_blocking:
+        try:
+            blocking = get_blocking(fd)
+        except OSError:  # not supported for sockets on Windows
+            pass
+    if blocking is None and getdefaulttimeout() is not None:
+        return True  # peeking would change the blocking mode
+    sock = fromfd(fd, AF_INET, SOCK_STREAM)
+    try:  # peek whether this is pending data or the end of the stream
+        return bool(sock.recv(1, MSG_PEEK))
+    finally:
+        sock.close()
+        if blocking is not None:
+            set_blocking(fd, blocking)
+
+
+class SteadyDBBreaker:
+    """Circuit breaker for the connections made with a creator.
+
+    The breaker is closed as long as connections can be made.  After the
+    given number of consecutive failures, it opens and attempts to connect
+    fail fast.  When the backoff time has passed, it becomes half-open and
+    lets one attempt through.  If this succeeds, the breaker is closed,
+    otherwise it is opened again with a doubled backoff time.
+
+    """
+
+    # the breakers shared by creators, by their connection parameters
+    _shared = WeakKeyDictionary()
+    _shared_strong = {}  # for creators that cannot be weakly referenced
+    _shared_lock = Lock()
+
+    def __init__(self, threshold=5, backoff=(1, 60), jitter=0.5):
+        """Create a closed circuit breaker.
+
+        threshold: number of consecutive failures to connect
+            after which the circuit breaker opens
+        backoff: time in seconds until the circuit breaker is half-open,
+            or a pair of times for a time that starts with the first one
+            and is doubled after every failed probe up to the second one
+        jitter: the fraction by which backoff times are randomly reduced,
+            so that probes of different processes are spread out
+
+        """
+        if not isinstance(threshold, baseint) or threshold < 1:
+            raise ValueError("'threshold' must be a positive number.")
+        if isinstance(backoff, tuple):
+            minimum, maximum = backoff
+        else:
+            minimum = maximum = backoff
+        if not 0 < minimum <= maximum:
+            raise ValueError("'backoff' must be a positive time"
+                             " or a pair of increasing positive times.")
+        if not 0 <= jitter <= 1:
+            raise ValueError("'jitter' must be between 0 and 1.")
+        self.threshold = threshold
+        self.backoff = minimum, maximum
+        self.jitter = jitter
+        self.state = 'closed'
+        self.failures = 0  # number of consecutive failures to connect
+        self._delay = minimum  # the next backoff time
+        self._until = 0  # the end of the current backoff time
+        self._lock = Lock()
+
+    @classmethod
+    def shared(cls, creator, threshold, args=(), kwargs=None):
+        """Get the circuit breaker shared by all users of the creator.
+
+        Different breakers are used for different connection parameters,
+        i.e. the args and kwargs passed to the creator, so that the
+        failures of one database host do not block the others.
+
+        If there is no such breaker yet, it is created with the given
+        threshold and the default backoff times.
+
+        """
+        params = tuple(args), tuple(sorted((kwargs or {}).items()))
+        try:
+            hash(params)
+        except TypeError:  # parameters that cannot be hashed
+            params = repr(params)
+        with cls._shared_lock:
+            try:
+                shared = cls._shared
+                breakers = shared.get(creator)
+            except TypeError:  # creator cannot be weakly referenced
+                shared = cls._shared_strong
+                breakers = shared.get(creator)
+            if breakers is None:
+                breakers = shared[creator] = {}
+            breaker = breakers.get(params)
+            if breaker is None:
+                breaker = breakers[params] = cls(threshold)
+            return breaker
+
+    def enter(self):
+        """Check whether an attempt to connect shall be made.
+
+        Raises BreakerOpen if this is not the case.
+
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'open' and monotonic() >= self._until:
+                self.state = 'half-open'  # let this attempt probe
+                return
+        raise BreakerOpen("Circuit breaker is open.")
+
+    def succeeded(self):
+        """Close the circuit breaker after a successful connection."""
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._delay = self.backoff[0]
+
+    def cancel(self):
+        """Let another attempt probe if a probe could not be made."""
+        with self._lock:
+            if self.state == 'half-open':
+                self.state = 'open'
+
+    def failed(self):
+        """Register a failure to connect."""
+        with self._lock:
+            self.failures += 1
+            state = self.state
+            if state == 'open' or (
+                    state == 'closed' and self.failures < self.threshold):
+                return
+            delay = self._delay
+            self._delay = min(2 * delay, self.backoff[1])
+            if self.jitter:
+                delay *= 1 - self.jitter * random()
+            self._until = monotonic() + delay
+            self.state = 'open'
+
+
+class SteadyDBLimiter:
+    """Limiter for the rate and concurrency of attempts to connect.
+
+    The rate is limited with a token bucket that allows bursts of
+    connections after idle periods.  Attempts beyond the limits wait
+    in line until they can be made or the timeout has passed.
+
+    """
+
+    def __init__(self, rate=None, burst=1, maxconnects=None, timeout=None):
+        """Create a limiter for attempts to connect.
+
+        rate: average number of attempts allowed per second
+            (0 or None means no rate limit)
+        burst: number of attempts that can be made at once after
+            an idle period, when the rate limit has not been used up
+        maxconnects: maximum number of concurrent attempts to connect
+            (0 or None means no limit)
+        timeout: maximum time in seconds an attempt waits in line
+            (None means it waits as long as necessary)
+
+        """
+        if rate and rate < 0:
+            raise ValueError("'rate' must be a positive number.")
+        if not isinstance(burst, baseint) or burst < 1:
+            raise ValueError("'burst' must be a positive number.")
+        if timeout is not None and timeout < 0:
+            raise ValueError("'timeout' must be a positive time.")
+        self.rate = rate or 0
+        self.burst = burst
+        self.maxconnects = maxconnects or 0
+        self.timeout = timeout
+        self.connecting = 0  # number of attempts currently made
+        self._tokens = burst
+        self._updated = monotonic()
+        self._condition = Condition()
+
+    def acquire(self):
+        """Wait until an attempt to connect can be made.
+
+        Raises TooManyConnects if the timeout has passed.
+
+        """
+        timeout = self.timeout
+        if timeout is not None:
+            deadline = monotonic() + timeout
+        condition = self._condition
+        with condition:
+            while True:
+                wait = None
+                now = monotonic()
+                if self.maxconnects and self.connecting >= self.maxconnects:
+                    pass  # wait until another attempt has been made
+                elif self.rate:
+                    tokens = min(self.burst, self._tokens + (
+                        now - self._updated) * self.rate)
+                    self._updated = now
+                    if tokens >= 1:
+                        self._tokens = tokens - 1
+                        break
+                    self._tokens = tokens
+                    wait = (1 - tokens) / self.rate  # for the next token
+                else:
+                    break
+                if timeout is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise TooManyConnects(
+                            "Too many attempts to connect.")
+                    if wait is None or wait > remaining:
+                        wait = remaining
+                condition.wait(wait)
+            self.connecting += 1
+
+    def release(self):
+        """Signal that an attempt to connect has been made."""
+        with self._condition:
+            self.connecting -= 1
+            self._condition.notify()
+
+
 def connect(
         creator, maxusage=None, setsession=None,
         failures=None, ping=1, closeable=True, *args, **kwargs):
@@ -130,6 +427,28 @@ def connect(
         7 = always, and all other bit combinations of these values)
     closeable: if this is set to false, then closing the connection will
         be silently ignored, but by default the connection can be closed
+    ping_interval: time in seconds during which a connection that has been
+        used or pinged successfully is trusted without pinging it again
+        (0 or None means that the connection is always pinged; if you pass
+        a pair of times, the interval starts with the first time and is
+        doubled after every successful ping until it reaches the second)
+        This can only be passed as a keyword argument.
+    probe: how the liveness of the connection is checked
+        (None = default = with ping() or, if the driver does not support
+        this, by polling the socket returned by the fileno() method,
+        'socket' = by polling the socket, which does not need a round trip
+        to the server, but only detects closed sockets, falling back to
+        ping(), or an SQL statement such as "select 1" that is used as a
+        validation query if the driver does not support ping())
+        This can only be passed as a keyword argument.
+    breaker: an optional circuit breaker that makes attempts to connect
+        fail fast after consecutive failures, either a SteadyDBBreaker
+        or the number of failures for a breaker shared by the creator
+        with the same connection parameters
+        This can only be passed as a keyword argument.
+    limiter: an optional SteadyDBLimiter limiting the rate and number of
+        concurrent attempts to connect (share it for a process-wide limit)
+        This can only be passed as a keyword argument.
     args, kwargs: the parameters that shall be passed to the creator
         function or the connection constructor of the DB-API 2 module
 
@@ -144,14 +463,36 @@ class SteadyDBConnection:
 
     version = __version__
 
+    __slots__ = (
+        '_con', '_closed', '_metrics', '_creator', '_dbapi', '_threadsafety',
+        '_maxusage', '_setsession_sql', '_failures', '_failure', '_ping',
+        '_closeable', '_args', '_kwargs', '_transaction', '_usage',
+        '_created', '_last_used', '_ping_interval', '_ping_limits',
+        '_probe', '_probes', '_dirty', '_breaker', '_limiter', '_spares',
+        '_cancelled')
+
     def __init__(
             self, creator, maxusage=None, setsession=None,
             failures=None, ping=1, closeable=True, *args, **kwargs):
         """Create a "tough" DB-API 2 connection."""
-        # basic initialization to make finalizer work
         self._con = None
         self._closed = True
-        # proper initialization of the connection
+        self._metrics = None
+        self._spares = None  # may provide hot spares for reconnecting
+        self._setup(
+            creator, maxusage, setsession,
+            failures, ping, closeable, *args, **kwargs)
+        self._store(self._create())
+
+    def _setup(
+            self, creator, maxusage=None, setsession=None,
+            failures=None, ping=1, closeable=True, *args, **kwargs):
+        """Check and store the parameters of the connection."""
+        # the following options can only be passed as keyword arguments
+        ping_interval = kwargs.pop('ping_interval', None)
+        probe = kwargs.pop('probe', None)
+        breaker = kwargs.pop('breaker', None)
+        limiter = kwargs.pop('limiter', None)
         try:
             self._creator = creator.connect
             self._dbapi = creator
@@ -187,9 +528,39 @@ class SteadyDBConnection:
             raise TypeError("'failures' must be a tuple of exceptions.")
         self._failures = failures
         self._ping = ping if isinstance(ping, int) else 0
+        if isinstance(ping_interval, tuple):
+            minimum, maximum = ping_interval
+        else:
+            minimum = maximum = ping_interval or 0
+        if minimum < 0 or maximum < minimum or (maximum and not minimum):
+            raise ValueError("'ping_interval' must be a positive time"
+                             " or a pair of increasing positive times.")
+        self._ping_interval = minimum
+        self._ping_limits = minimum, maximum
+        # the available probes, starting with the preferred one
+        cls = self.__class__
+        if not probe:
+            probes = cls._ping_probe, cls._socket_probe
+        elif probe == 'socket':
+            probes = cls._socket_probe, cls._ping_probe
+        elif isinstance(probe, str):
+            probes = cls._ping_probe, cls._query_probe
+        else:
+            raise TypeError("'probe' must be 'socket' or an SQL statement.")
+        self._probe, self._probes = probe, probes
+        if not breaker:
+            breaker = None
+        elif isinstance(breaker, baseint):
+            breaker = SteadyDBBreaker.shared(creator, breaker, args, kwargs)
+        elif not isinstance(breaker, SteadyDBBreaker):
+            raise TypeError("'breaker' must be a SteadyDBBreaker"
+                            " or a number of failures.")
+        self._breaker = breaker
+        if limiter is not None and not isinstance(limiter, SteadyDBLimiter):
+            raise TypeError("'limiter' must be a SteadyDBLimiter.")
+        self._limiter = limiter
         self._closeable = closeable
         self._args, self._kwargs = args, kwargs
-        self._store(self._create())
 
     def __enter__(self):
         """Enter the runtime context for the connection object."""
@@ -207,16 +578,82 @@ class SteadyDBConnection:
             self.rollback()
 
     def _create(self):
-        """Create a new connection using the creator function."""
-        con = self._creator(*self._args, **self._kwargs)
+        """Create a new connection using the creator function.
+
+        If hot spare connections are provided, e.g. by a pool, one of
+        these is taken instead if possible, except when the connection is
+        only recycled because it has reached its maximum usage, since the
+        spares are meant for replacing lost connections without delay.
+
+        """
+        spares = self._spares
+        if spares and not (self._maxusage and self._usage >= self._maxusage):
+            con = spares.take()
+            if con is not None:
+                return con
+        breaker, limiter = self._breaker, self._limiter
+        if breaker:
+            breaker.enter()  # fail fast while the breaker is open
+        if limiter:
+            try:  # wait in line until the attempt can be made
+                limiter.acquire()
+            except BaseException:
+                if breaker:
+                    breaker.cancel()
+                raise
+        try:
+            try:
+                con = self._creator(*self._args, **self._kwargs)
+            except BaseException:
+                if breaker:
+                    breaker.failed()
+                raise
+            if breaker:
+                breaker.succeeded()
+            try:
+                self._examine(con)
+                self._setsession(con)
+            except Exception as error:
+                # the database module could not be determined
+                # or the session could not be prepared
+                try:  # close the connection first
+                    con.close()
+                except Exception:
+                    pass
+                raise error  # re-raise the original error again
+        finally:
+            if limiter:
+                limiter.release()
+        return con
+
+    def _examine(self, con):
+        """Determine the DB-API 2 module and failures from a connection."""
         try:
+            if self._dbapi.connect != self._creator:
+                raise AttributeError
+        except AttributeError:
+            # try finding the DB-API 2 module via the connection itself
             try:
-                if self._dbapi.connect != self._creator:
-                    raise AttributeError
+                mod = con.__module__
             except AttributeError:
-                # try finding the DB-API 2 module via the connection itself
+                mod = None
+            while mod:
+                try:
+                    self._dbapi = sys.modules[mod]
+                    if not callable(self._dbapi.connect):
+                        raise AttributeError
+                except (AttributeError, KeyError):
+                    pass
+                else:
+                    break
+                i = mod.rfind('.')
+                if i < 0:
+                    mod = None
+                else:
+                    mod = mod[:i]
+            else:
                 try:
-                    mod = con.__module__
+                    mod = con.OperationalError.__module__
                 except AttributeError:
                     mod = None
                 while mod:
@@ -234,66 +671,37 @@ class SteadyDBConnection:
                     else:
                         mod = mod[:i]
                 else:
-                    try:
-                        mod = con.OperationalError.__module__
-                    except AttributeError:
-                        mod = None
-                    while mod:
-                        try:
-                            self._dbapi = sys.modules[mod]
-                            if not callable(self._dbapi.connect):
-                                raise AttributeError
-                        except (AttributeError, KeyError):
-                            pass
-                        else:
-                            break
-                        i = mod.rfind('.')
-                        if i < 0:
-                            mod = None
-                        else:
-                            mod = mod[:i]
-                    else:
-                        self._dbapi = None
-            if self._threadsafety is None:
+                    self._dbapi = None
+        if self._threadsafety is None:
+            try:
+                self._threadsafety = self._dbapi.threadsafety
+            except AttributeError:
                 try:
-                    self._threadsafety = self._dbapi.threadsafety
+                    self._threadsafety = con.threadsafety
                 except AttributeError:
-                    try:
-                        self._threadsafety = con.threadsafety
-                    except AttributeError:
-                        pass
-            if self._failures is None:
+                    pass
+        if self._failures is None:
+            try:
+                self._failures = (
+                    self._dbapi.OperationalError,
+                    self._dbapi.InternalError)
+            except AttributeError:
                 try:
                     self._failures = (
-                        self._dbapi.OperationalError,
-                        self._dbapi.InternalError)
+                        self._creator.OperationalError,
+                        self._creator.InternalError)
                 except AttributeError:
                     try:
                         self._failures = (
-                            self._creator.OperationalError,
-                            self._creator.InternalError)
+                            con.OperationalError, con.InternalError)
                     except AttributeError:
-                        try:
-                            self._failures = (
-                                con.OperationalError, con.InternalError)
-                        except AttributeError:
-                            raise AttributeError(
-                                "Could not determine failure exceptions"
-                                " (please set failures or creator.dbapi).")
-            if isinstance(self._failures, tuple):
-                self._failure = self._failures[0]
-            else:
-                self._failure = self._failures
-            self._setsession(con)
-        except Exception as error:
-            # the database module could not be determined
-            # or the session could not be prepared
-            try:  # close the connection first
-                con.close()
-            except Exception:
-                pass
-            raise error  # re-raise the original error again
-        return con
+                        raise AttributeError(
+                            "Could not determine failure exceptions"
+                            " (please set failures or creator.dbapi).")
+        if isinstance(self._failures, tuple):
+            self._failure = self._failures[0]
+        else:
+            self._failure = self._failures
 
     def _setsession(self, con=None):
         """Execute the SQL commands for session preparation."""
@@ -308,9 +716,23 @@ class SteadyDBConnection:
     def _store(self, con):
         """Store a database connection for subsequent use."""
         self._con = con
-        self._transaction = False
+        self._transaction = self._cancelled = False
+        # the session may already be dirty if it has been prepared
+        self._dirty = bool(self._setsession_sql)
         self._closed = False
         self._usage = 0
+        self._created = self._last_used = monotonic()
+
+    def _renew(self, con):
+        """Replace the underlying connection with a new one."""
+        metrics = self._metrics
+        if metrics:
+            if self._maxusage and self._usage >= self._maxusage:
+                metrics.recycle()
+            else:
+                metrics.failover()
+        self._close()
+        self._store(con)
 
     def _close(self):
         """Close the tough connection.
@@ -327,20 +749,80 @@ class SteadyDBConnection:
             self._transaction = False
             self._closed = True
 
+    def _in_transaction(self):
+        """Check whether the session may have uncommitted changes.
+
+        This uses the transaction status of the underlying connection
+        if the driver provides it and falls back to checking whether
+        anything has been executed since the last commit or rollback.
+
+        """
+        if not self._dirty:
+            return False
+        con = self._con
+        try:  # e.g. sqlite3
+            return bool(con.in_transaction)
+        except AttributeError:
+            pass
+        try:  # e.g. psycopg, where 0 means idle
+            return con.info.transaction_status != 0
+        except AttributeError:
+            pass
+        return True
+
     def _reset(self, force=False):
         """Reset a tough connection.
 
-        Rollback if forced or the connection was in a transaction.
+        Rollback if the connection was in a transaction, or if forced
+        and the session may have uncommitted changes.
 
         """
-        if not self._closed and (force or self._transaction):
+        self._cancelled = False  # the connection is used for something else
+        if not self._closed and (
+                self._transaction or force and self._in_transaction()):
             try:
                 self.rollback()
             except Exception:
                 pass
 
+    def _pinged(self, alive):
+        """Adapt the ping interval after the connection has been pinged."""
+        minimum, maximum = self._ping_limits
+        if alive:
+            self._last_used = monotonic()
+            interval = self._ping_interval * 2
+            self._ping_interval = interval if interval < maximum else maximum
+        else:
+            self._ping_interval = minimum
+
+    def _ping_probe(self):
+        """Check whether the connection is alive using ping()."""
+        try:  # pass a reconnect=False flag if this is supported
+            alive = self._con.ping(False)
+        except TypeError:  # the reconnect flag is not supported
+            alive = self._con.ping()
+        return True if alive is None else alive
+
+    def _socket_probe(self):
+        """Check whether the connection is alive by polling its socket."""
+        return _socket_alive(self._con.fileno())
+
+    def _query_probe(self):
+        """Check whether the connection is alive using a query."""
+        self._dirty = True  # the query may have started a transaction
+        cursor = self._con.cursor()
+        try:
+            cursor.execute(self._probe)
+            cursor.fetchone()
+        finally:
+            cursor.close()
+        return True
+
     def _ping_check(self, ping=1, reconnect=True):
-        """Check whether the connection is still alive using ping().
+        """Check whether the connection is still alive.
+
+        The cheapest available probe is used for this check, usually
+        ping(), but see the probe parameter for the alternatives.
 
         If the the underlying connection is not active and the ping
         parameter is set accordingly, the connection will be recreated
@@ -348,30 +830,35 @@ class SteadyDBConnection:
 
         """
         if ping & self._ping:
-            try:  # if possible, ping the connection
-                try:  # pass a reconnect=False flag if this is supported
-                    alive = self._con.ping(False)
-                except TypeError:  # the reconnect flag is not supported
-                    alive = self._con.ping()
-            except (AttributeError, IndexError, TypeError, ValueError):
-                self._ping = 0  # ping() is not available
-                alive = None
-                reconnect = False
-            except Exception:
-                alive = False
-            else:
-                if alive is None:
-                    alive = True
-                if alive:
+            interval = self._ping_interval
+            if interval and monotonic() - self._last_used < interval:
+                return True  # the connection has been used recently
+            probes = self._probes
+            while True:
+                try:  # if possible, probe the connection
+                    alive = probes[0](self)
+                except (AttributeError, IndexError, TypeError):
+                    probes = self._probes = probes[1:]  # not available
+                    if probes:
+                        continue  # try the next probe
+                    self._ping = 0  # no probe is available
+                    alive = None
                     reconnect = False
+                except Exception:
+                    alive = False
+                else:
+                    if alive:
+                        reconnect = False
+                break
+            if interval:
+                self._pinged(alive)
             if reconnect and not self._transaction:
                 try:  # try to reopen the connection
                     con = self._create()
                 except Exception:
                     pass
                 else:
-                    self._close()
-                    self._store(con)
+                    self._renew(con)
                     alive = True
             return alive
 
@@ -432,14 +919,15 @@ class SteadyDBConnection:
         self._transaction = False
         try:
             self._con.commit()
+            self._dirty = False
+            self._last_used = monotonic()
         except self._failures as error:  # cannot commit
             try:  # try to reopen the connection
                 con = self._create()
             except Exception:
                 pass
             else:
-                self._close()
-                self._store(con)
+                self._renew(con)
             raise error  # re-raise the original error
 
     def rollback(self):
@@ -447,20 +935,22 @@ class SteadyDBConnection:
         self._transaction = False
         try:
             self._con.rollback()
+            self._dirty = False
+            self._last_used = monotonic()
         except self._failures as error:  # cannot rollback
             try:  # try to reopen the connection
                 con = self._create()
             except Exception:
                 pass
             else:
-                self._close()
-                self._store(con)
+                self._renew(con)
             raise error  # re-raise the original error
 
     def cancel(self):
         """Cancel a long-running transaction.
 
         If the underlying driver supports this method, it will be called.
+        A query failing because it has been cancelled is not executed again.
 
         """
         self._transaction = False
@@ -469,6 +959,7 @@ class SteadyDBConnection:
         except AttributeError:
             pass
         else:
+            self._cancelled = True
             cancel()
 
     def ping(self, *args, **kwargs):
@@ -499,8 +990,7 @@ class SteadyDBConnection:
                 except Exception:
                     pass
                 else:
-                    self._close()
-                    self._store(con)
+                    self._renew(con)
                     if transaction:
                         raise error  # re-raise the original error again
                     return cursor
@@ -517,23 +1007,20 @@ class SteadyDBConnection:
         """Return a new Cursor Object using the connection."""
         return SteadyDBCursor(self, *args, **kwargs)
 
-    def __del__(self):
-        """Delete the steady connection."""
-        try:
-            self._close()  # make sure the connection is closed
-        except Exception:
-            pass
-
 
 class SteadyDBCursor:
     """A "tough" version of DB-API 2 cursors."""
 
+    __slots__ = (
+        '_con', '_closed', '_cursor', '_args', '_kwargs',
+        '_inputsizes', '_outputsizes')
+
+    _tough_methods = {}  # the wrappers of other execution methods
+
     def __init__(self, con, *args, **kwargs):
         """Create a "tough" DB-API 2 cursor."""
-        # basic initialization to make finalizer work
         self._cursor = None
         self._closed = True
-        # proper initialization of the cursor
         self._con = con
         self._args, self._kwargs = args, kwargs
         self._clearsizes()
@@ -589,123 +1076,152 @@ class SteadyDBCursor:
                 pass
             self._closed = True
 
-    def _get_tough_method(self, name):
+    def execute(self, *args, **kwargs):
+        """Prepare and execute a database operation ("tough" version)."""
+        return self._tough_call('execute', True, args, kwargs)
+
+    def executemany(self, *args, **kwargs):
+        """Execute an operation for a sequence ("tough" version)."""
+        return self._tough_call('executemany', True, args, kwargs)
+
+    def callproc(self, *args, **kwargs):
+        """Call a stored database procedure ("tough" version)."""
+        return self._tough_call('callproc', False, args, kwargs)
+
+    @classmethod
+    def _tough_method(cls, name):
         """Return a "tough" version of the given cursor method."""
-        def tough_method(*args, **kwargs):
-            execute = name.startswith('execute')
-            con = self._con
-            transaction = con._transaction
+        execute = name.startswith('execute')
+
+        def tough_method(self, *args, **kwargs):
+            return self._tough_call(name, execute, args, kwargs)
+
+        tough_method.__name__ = name
+        return tough_method
+
+    def _tough_call(self, name, execute, args, kwargs):
+        """Call the given cursor method in a "tough" way."""
+        con = self._con
+        transaction = con._transaction
+        if not transaction and con._ping & 4:
+            con._ping_check(4)
+        con._dirty = True
+        try:
+            if con._maxusage:
+                if con._usage >= con._maxusage:
+                    # the connection was used too often
+                    raise con._failure
+            if execute and (self._inputsizes or self._outputsizes):
+                self._setsizes()
+                result = getattr(self._cursor, name)(*args, **kwargs)
+                self._clearsizes()
+            else:  # try to execute
+                result = getattr(self._cursor, name)(*args, **kwargs)
+        except con._failures as error:  # execution error
+            if con._cancelled:  # do not execute a cancelled query again
+                con._cancelled = False
+                raise
             if not transaction:
-                con._ping_check(4)
-            try:
-                if con._maxusage:
-                    if con._usage >= con._maxusage:
-                        # the connection was used too often
-                        raise con._failure
-                if execute:
-                    self._setsizes()
-                method = getattr(self._cursor, name)
-                result = method(*args, **kwargs)  # try to execute
-                if execute:
-                    self._clearsizes()
-            except con._failures as error:  # execution error
-                if not transaction:
-                    try:
-                        cursor2 = con._cursor(
-                            *self._args, **self._kwargs)  # open new cursor
-                    except Exception:
-                        pass
-                    else:
-                        try:  # and try one more time to execute
-                            if execute:
-                                self._setsizes(cursor2)
-                            method = getattr(cursor2, name)
-                            result = method(*args, **kwargs)
-                            if execute:
-                                self._clearsizes()
-                        except Exception:
-                            pass
-                        else:
-                            self.close()
-                            self._cursor = cursor2
-                            con._usage += 1
-                            return result
-                        try:
-                            cursor2.close()
-                        except Exception:
-                            pass
-                try:  # try to reopen the connection
-                    con2 = con._create()
+                try:
+                    cursor2 = con._cursor(
+                        *self._args, **self._kwargs)  # open new cursor
                 except Exception:
                     pass
                 else:
-                    try:
-                        cursor2 = con2.cursor(
-                            *self._args, **self._kwargs)  # open new cursor
+                    try:  # and try one more time to execute
+                        if execute:
+                            self._setsizes(cursor2)
+                        method = getattr(cursor2, name)
+                        result = method(*args, **kwargs)
+                        if execute:
+                            self._clearsizes()
                     except Exception:
                         pass
                     else:
-                        if transaction:
-                            self.close()
-                            con._close()
-                            con._store(con2)
-                            self._cursor = cursor2
-                            raise error  # raise the original error again
-                        error2 = None
-                        try:  # try one more time to execute
-                            if execute:
-                                self._setsizes(cursor2)
-                            method2 = getattr(cursor2, name)
-                            result = method2(*args, **kwargs)
-                            if execute:
-                                self._clearsizes()
-                        except error.__class__:  # same execution error
-                            use2 = False
-                            error2 = error
-                        except Exception as error:  # other execution errors
-                            use2 = True
-                            error2 = error
-                        else:
-                            use2 = True
-                        if use2:
-                            self.close()
-                            con._close()
-                            con._store(con2)
-                            self._cursor = cursor2
-                            con._usage += 1
-                            if error2:
-                                raise error2  # raise the other error
-                            return result
-                        try:
-                            cursor2.close()
-                        except Exception:
-                            pass
+                        self.close()
+                        self._cursor = cursor2
+                        con._usage += 1
+                        con._last_used = monotonic()
+                        return result
                     try:
-                        con2.close()
+                        cursor2.close()
                     except Exception:
                         pass
-                if transaction:
-                    self._transaction = False
-                raise error  # re-raise the original error again
+            try:  # try to reopen the connection
+                con2 = con._create()
+            except Exception:
+                pass
             else:
-                con._usage += 1
-                return result
-        return tough_method
+                try:
+                    cursor2 = con2.cursor(
+                        *self._args, **self._kwargs)  # open new cursor
+                except Exception:
+                    pass
+                else:
+                    if transaction:
+                        self.close()
+                        con._renew(con2)
+                        self._cursor = cursor2
+                        raise error  # raise the original error again
+                    error2 = None
+                    try:  # try one more time to execute
+                        if execute:
+                            self._setsizes(cursor2)
+                        method2 = getattr(cursor2, name)
+                        result = method2(*args, **kwargs)
+                        if execute:
+                            self._clearsizes()
+                    except error.__class__:  # same execution error
+                        use2 = False
+                        error2 = error
+                    except Exception as error:  # other execution errors
+                        use2 = True
+                        error2 = error
+                    else:
+                        use2 = True
+                    if use2:
+                        self.close()
+                        con._renew(con2)
+                        con._dirty = True
+                        self._cursor = cursor2
+                        con._usage += 1
+                        con._last_used = monotonic()
+                        if error2:
+                            raise error2  # raise the other error
+                        return result
+                    try:
+                        cursor2.close()
+                    except Exception:
+                        pass
+                try:
+                    con2.close()
+                except Exception:
+                    pass
+            if transaction:
+                con._transaction = False
+            raise error  # re-raise the original error again
+        else:
+            con._cancelled = False  # it has been cancelled too late
+            con._usage += 1
+            con._last_used = monotonic()
+            return result
 
     def __getattr__(self, name):
         """Inherit methods and attributes of underlying cursor."""
         if self._cursor:
             if name.startswith(('execute', 'call')):
-                # make execution methods "tough"
-                return self._get_tough_method(name)
+                # make other execution methods "tough" as well,
+                # building their wrappers only once per class, but
+                # without adding them to the class, since they are
+                # not available with all drivers
+                getattr(self._cursor, name)
+                methods = self._tough_methods
+                try:
+                    method = methods[name]
+                except KeyError:
+                    method = methods[name] = self._tough_method(name)
+                return method.__get__(self)
             else:
                 return getattr(self._cursor, name)
         else:
             raise InvalidCursor
-
-    def __del__(self):
-        """Delete the steady cursor."""
-        try:
-            self.close()  # make sure the cursor is closed
-        except Exception:
-            pass
@@ -103,6 +103,12 @@ class SteadyPgConnection:
 
     version = __version__
 
+    __slots__ = (
+        '_con', '_closed', '_metrics', '_maxusage', '_setsession_sql',
+        '_closeable', '_transaction', '_usage', '_dirty')
+
+    _tough_methods = {}  # the wrappers of the get_ methods
+
     def __init__(
             self, maxusage=None, setsession=None, closeable=True,
             *args, **kwargs):
@@ -119,10 +125,9 @@ class SteadyPgConnection:
             the PostgreSQL connections with PyGreSQL using pg.DB()
 
         """
-        # basic initialization to make finalizer work
         self._con = None
         self._closed = True
-        # proper initialization of the connection
+        self._metrics = None
         if maxusage is None:
             maxusage = 0
         if not isinstance(maxusage, baseint):
@@ -150,10 +155,27 @@ class SteadyPgConnection:
 
     def _setsession(self):
         """Execute the SQL commands for session preparation."""
+        # the session may already be dirty if it has been prepared
+        self._dirty = bool(self._setsession_sql)
         if self._setsession_sql:
             for sql in self._setsession_sql:
                 self._con.query(sql)
 
+    def _in_transaction(self):
+        """Check whether the session may have uncommitted changes.
+
+        This uses the transaction status of the PyGreSQL connection
+        if available and falls back to checking whether anything
+        has been executed since the last commit or rollback.
+
+        """
+        if not self._dirty:
+            return False
+        try:  # 0 means idle (TRANS_IDLE)
+            return self._con.transaction() != 0
+        except Exception:
+            return True
+
     def _close(self):
         """Close the tough connection.
 
@@ -247,12 +269,14 @@ class SteadyPgConnection:
         try:
             end = self._con.end
         except AttributeError:
-            return self._con.query(sql or 'end')
+            result = self._con.query(sql or 'end')
         else:
             if sql:
-                return end(sql=sql)
+                result = end(sql=sql)
             else:
-                return end()
+                result = end()
+        self._dirty = False
+        return result
 
     def commit(self, sql=None):
         """Commit the current transaction."""
@@ -260,12 +284,14 @@ class SteadyPgConnection:
         try:
             commit = self._con.commit
         except AttributeError:
-            return self._con.query(sql or 'commit')
+            result = self._con.query(sql or 'commit')
         else:
             if sql:
-                return commit(sql=sql)
+                result = commit(sql=sql)
             else:
-                return commit()
+                result = commit()
+        self._dirty = False
+        return result
 
     def rollback(self, sql=None):
         """Rollback the current transaction."""
@@ -273,46 +299,86 @@ class SteadyPgConnection:
         try:
             rollback = self._con.rollback
         except AttributeError:
-            return self._con.query(sql or 'rollback')
+            result = self._con.query(sql or 'rollback')
         else:
             if sql:
-                return rollback(sql=sql)
+                result = rollback(sql=sql)
             else:
-                return rollback()
+                result = rollback()
+        self._dirty = False
+        return result
 
-    def _get_tough_method(self, method):
-        """Return a "tough" version of a connection class method.
+    def query(self, *args, **kwargs):
+        """Execute a SQL command ("tough" version)."""
+        return self._tough_call('query', args, kwargs)
+
+    def get(self, *args, **kwargs):
+        """Get a row from a database table ("tough" version)."""
+        return self._tough_call('get', args, kwargs)
+
+    def insert(self, *args, **kwargs):
+        """Insert a row into a database table ("tough" version)."""
+        return self._tough_call('insert', args, kwargs)
+
+    def update(self, *args, **kwargs):
+        """Update a row in a database table ("tough" version)."""
+        return self._tough_call('update', args, kwargs)
+
+    def delete(self, *args, **kwargs):
+        """Delete a row from a database table ("tough" version)."""
+        return self._tough_call('delete', args, kwargs)
+
+    @classmethod
+    def _tough_method(cls, name):
+        """Return a "tough" version of a connection class method."""
+        def tough_method(self, *args, **kwargs):
+            return self._tough_call(name, args, kwargs)
+
+        tough_method.__name__ = name
+        return tough_method
+
+    def _tough_call(self, name, args, kwargs):
+        """Call a connection class method in a "tough" way.
 
         The tough version checks whether the connection is bad (lost)
         and automatically and transparently tries to reset the connection
         if this is the case (for instance, the database has been restarted).
 
         """
-        def tough_method(*args, **kwargs):
-            transaction = self._transaction
-            if not transaction:
-                try:  # check whether connection status is bad
-                    if not self._con.db.status:
+        transaction = self._transaction
+        if not transaction:
+            metrics = self._metrics
+            try:  # check whether connection status is bad
+                if not self._con.db.status:
+                    raise AttributeError
+                if self._maxusage:  # or connection used too often
+                    if self._usage >= self._maxusage:
+                        if metrics:
+                            metrics.recycle()
+                            metrics = None
                         raise AttributeError
-                    if self._maxusage:  # or connection used too often
-                        if self._usage >= self._maxusage:
-                            raise AttributeError
-                except Exception:
-                    self.reset()  # then reset the connection
-            try:
-                result = method(*args, **kwargs)  # try connection method
-            except Exception:  # error in query
-                if transaction:  # inside a transaction
-                    self._transaction = False
-                    raise  # propagate the error
-                elif self._con.db.status:  # if it was not a connection problem
-                    raise  # then propagate the error
-                else:  # otherwise
-                    self.reset()  # reset the connection
-                    result = method(*args, **kwargs)  # and try one more time
-            self._usage += 1
-            return result
-        return tough_method
+            except Exception:
+                if metrics:
+                    metrics.failover()
+                self.reset()  # then reset the connection
+        self._dirty = True
+        method = getattr(self._con, name)
+        try:
+            result = method(*args, **kwargs)  # try connection method
+        except Exception:  # error in query
+            if transaction:  # inside a transaction
+                self._transaction = False
+                raise  # propagate the error
+            elif self._con.db.status:  # if it was not a connection problem
+                raise  # then propagate the error
+            else:  # otherwise
+                if self._metrics:
+                    self._metrics.failover()
+                self.reset()  # reset the connection
+                self._dirty = True
+                result = method(*args, **kwargs)  # and try one more time
+        self._usage += 1
+        return result
 
     def __getattr__(self, name):
         """Inherit the members of the standard connection class.
@@ -322,16 +388,19 @@ class SteadyPgConnection:
         """
         if self._con:
             attr = getattr(self._con, name)
-            if (name in ('query', 'get', 'insert', 'update', 'delete')
-                    or name.startswith('get_')):
-                attr = self._get_tough_method(attr)
+            if name.startswith('get_'):
+                # make these methods "tough" as well,
+                # building their wrappers only once per class, but
+                # without adding them to the class, since they are
+                # not available with all versions of PyGreSQL
+                methods = self._tough_methods
+                try:
+                    method = methods[name]
+                except KeyError:
+                    method = methods[name] = self._tough_method(name)
+                attr = method.__get__(self)
+            else:  # untracked methods may change the session
+                self._dirty = True
             return attr
         else:
             raise InvalidConnection
-
-    def __del__(self):
-        """Delete the steady connection."""
-        try:
-            self._close()  # make sure the connection is closed
-        except Exception:
-            pass
@@ -0,0 +1,111 @@
+"""Benchmark the memory footprint of steady connections and pool proxies.
+
+Note:
+This is not a test, but a benchmark using the mock database modules.
+It compares the slotted classes with copies of them that are defined
+without __slots__ and therefore store their attributes in a per-instance
+__dict__, as they did before they got slots.
+The memory retained per connection, checkout or cursor is measured with
+tracemalloc, and the time for checking out and returning a connection
+or opening and closing a cursor is measured as an indicator of the
+allocator churn.
+
+Run it with "python -m DBUtils.Tests.BenchMemory [number]".
+
+"""
+
+import sys
+import tracemalloc
+
+from timeit import repeat
+
+import DBUtils.Tests.mock_db as dbapi
+import DBUtils.Tests.mock_pg as pg  # noqa: F401 (sets up the pg module)
+
+from DBUtils import PooledDB, PooledPg, SteadyDB, SteadyPg
+
+__version__ = '1.3'
+
+# the slotted classes that are replaced in their modules for comparison
+slotted = {
+    PooledDB: ('PooledDedicatedDBConnection', 'PooledSharedDBConnection',
+               'SharedDBConnection'),
+    PooledPg: ('PooledPgConnection', 'SteadyPgConnection'),
+    SteadyDB: ('SteadyDBConnection', 'SteadyDBCursor'),
+    SteadyPg: ('SteadyPgConnection',)}
+
+
+def unslotted(cls):
+    """Get a copy of the given class that has been defined without slots."""
+    slots = set(cls.__slots__) | {'__slots__', '__dict__', '__weakref__'}
+    namespace = {name: value for name, value in vars(cls).items()
+                 if name not in slots}
+    return type(cls.__name__, cls.__bases__, namespace)
+
+
+def retained(make, number):
+    """Get the memory retained by one of the objects made in bytes."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [make() for i in range(number)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del objects
+    return (after - before) / number
+
+
+def best(stmt, number):
+    """Get the best time per call in microseconds."""
+    return min(repeat(stmt, number=number, repeat=5)) * 1e6 / number
+
+
+def measure(number):
+    """Measure the connections, checkouts and cursors."""
+    dbapi.threadsafety = 2
+    results = [
+        retained(lambda: SteadyDB.connect(dbapi), number),
+        retained(lambda: SteadyPg.SteadyPgConnection(), number)]
+    pool = PooledDB.PooledDB(dbapi, number)
+    dedicated = pool.connection
+    results.append(retained(lambda: dedicated(False), number))
+    results.append(best(lambda: dedicated(False).close(), number))
+    pool = PooledDB.PooledDB(dbapi, 1, maxshared=1)
+    shared = pool.connection
+    results.append(retained(shared, number))
+    results.append(best(lambda: shared().close(), number))
+    pgpool = PooledPg.PooledPg(number)
+    results.append(retained(pgpool.connection, number))
+    results.append(best(lambda: pgpool.connection().close(), number))
+    cursor = pool.connection(False).cursor
+    results.append(retained(cursor, number))
+    results.append(best(lambda: cursor().close(), number))
+    return results
+
+
+def main(number=10000):
+    with_slots = measure(number)
+    originals = {}
+    try:  # use copies with a per-instance __dict__ instead
+        for module, names in slotted.items():
+            for name in names:
+                cls = originals[module, name] = getattr(module, name)
+                setattr(module, name, unslotted(cls))
+        with_dict = measure(number)
+    finally:
+        for (module, name), cls in originals.items():
+            setattr(module, name, cls)
+    print('Retained bytes and time in microseconds per object:')
+    print('%-32s %8s %8s' % ('', 'slots', '__dict__'))
+    for i, name in enumerate((
+            'steady DB-API 2 connection', 'steady PyGreSQL connection',
+            'dedicated PooledDB checkout', 'time for checkout and return',
+            'shared PooledDB checkout', 'time for checkout and return',
+            'PooledPg checkout', 'time for checkout and return',
+            'steady cursor', 'time for opening and closing')):
+        print('%-32s %8.1f %8.1f' % (name, with_slots[i], with_dict[i]))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,86 @@
+"""Benchmark the "tough" methods of SteadyDB cursors and SteadyPg connections.
+
+Note:
+This is not a test, but a microbenchmark using the mock database modules.
+It compares calls of the tough methods with direct calls of the mock
+drivers, and calls of the cached wrappers of methods that are provided
+by some drivers only with calls of wrappers that are built anew on every
+lookup, as it was done before these wrappers were cached.
+
+Run it with "python -m DBUtils.Tests.BenchToughMethods [number]".
+
+"""
+
+import sys
+
+from timeit import repeat
+
+import DBUtils.Tests.mock_db as dbapi
+import DBUtils.Tests.mock_pg as pg  # noqa: F401 (sets up the pg module)
+
+from DBUtils.SteadyDB import connect as SteadyDBconnect, SteadyDBCursor
+from DBUtils.SteadyPg import SteadyPgConnection
+
+__version__ = '1.3'
+
+
+class FormerCursor(SteadyDBCursor):
+    """Cursor building a new wrapper on every lookup."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        if name.startswith(('execute', 'call')):
+            getattr(self._cursor, name)
+            return self._tough_method(name).__get__(self)
+        return getattr(self._cursor, name)
+
+
+class FormerPgConnection(SteadyPgConnection):
+    """Connection building a new wrapper on every lookup."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        attr = getattr(self._con, name)
+        if name.startswith('get_'):
+            attr = self._tough_method(name).__get__(self)
+        return attr
+
+
+def best(stmt, number):
+    """Get the best time per call in microseconds."""
+    return min(repeat(stmt, number=number, repeat=5)) * 1e6 / number
+
+
+def main(number=100000):
+    db = SteadyDBconnect(dbapi)
+    cursor, former = db.cursor(), FormerCursor(db)
+    raw = cursor._cursor
+    for c in cursor, former:  # an execution method of some drivers
+        c._cursor.executescript = c._cursor.execute
+    pgdb = SteadyPgConnection(dbname='bench')
+    pgformer = FormerPgConnection(dbname='bench')
+
+    print('Time per call in microseconds:')
+    for name, stmt in (
+            ('mock cursor execute', lambda: raw.execute('select test')),
+            ('steady cursor execute', lambda: cursor.execute('select test')),
+            ('cached executescript',
+             lambda: cursor.executescript('select test')),
+            ('executescript built per call',
+             lambda: former.executescript('select test')),
+            ('mock pg query', lambda: pgdb._con.query('select test')),
+            ('steady pg query', lambda: pgdb.query('select test')),
+            ('cached pg get_tables', lambda: pgdb.get_tables()),
+            ('pg get_tables built per call', lambda: pgformer.get_tables())):
+        print('%-30s %6.3f' % (name, best(stmt, number)))
+    cursor.close()
+    former.close()
+    db.close()
+    pgdb.close()
+    pgformer.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
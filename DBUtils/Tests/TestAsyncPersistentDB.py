@@ -0,0 +1,106 @@
+"""Test the AsyncPersistentDB module.
+
+Note:
+We don't test performance here, so the test does not predicate
+whether AsyncPersistentDB actually will help in improving throughput or not.
+We also assume that the underlying PersistentDB connections are tested.
+
+"""
+
+import asyncio
+import gc
+import unittest
+
+from threading import current_thread
+
+import DBUtils.Tests.mock_db as dbapi
+
+from DBUtils.AsyncPersistentDB import AsyncPersistentDB
+from DBUtils.AsyncPooledDB import TooManyConnections
+
+__version__ = '1.3'
+
+
+class TestAsyncPersistentDB(unittest.TestCase):
+
+    def setUp(self):
+        dbapi.threadsafety = 1
+
+    def test0_CheckVersion(self):
+        from DBUtils import __version__ as DBUtilsVersion
+        self.assertEqual(DBUtilsVersion, __version__)
+        from DBUtils.AsyncPersistentDB import (
+            __version__ as AsyncPersistentDBVersion)
+        self.assertEqual(AsyncPersistentDBVersion, __version__)
+        self.assertEqual(AsyncPersistentDB.version, __version__)
+
+    def test1_PersistentConnections(self):
+        persist = AsyncPersistentDB(dbapi, threads=2)
+        self.assertEqual(len(persist._workers), 2)
+
+        async def task(i):
+            async with persist.connection() as db:
+                cursor = await db.cursor()
+                await cursor.execute('select test%d' % i)
+                self.assertEqual(await cursor.fetchone(), 'test%d' % i)
+                await cursor.close()
+                thread = await db._run(current_thread)
+                return thread, db._con
+
+        async def run():
+            results = await asyncio.gather(*(task(i) for i in range(6)))
+            threads = {}
+            for thread, con in results:
+                # each thread always uses the same connection
+                self.assertTrue(threads.setdefault(thread, con) is con)
+            self.assertEqual(len(threads), 2)
+            self.assertEqual(len(persist._workers), 2)
+            self.assertEqual(
+                sum(con._con.num_queries for con in threads.values()), 6)
+            await persist.close()
+
+        asyncio.run(run())
+
+    def test2_TooManyConnections(self):
+        persist = AsyncPersistentDB(dbapi, threads=1)
+
+        async def run():
+            db = await persist.connection()
+            with self.assertRaises(TooManyConnections):
+                await persist.connection(timeout=0)
+            with self.assertRaises(TooManyConnections):
+                await persist.connection(timeout=0.01)
+            self.assertEqual(len(persist._waiters), 0)
+            task = asyncio.ensure_future(persist.connection())
+            await asyncio.sleep(0.01)
+            self.assertTrue(not task.done())
+            await db.close()
+            db2 = await task
+            self.assertTrue(db2._con is db._con or db._con is None)
+            await db2.close()
+            self.assertEqual(len(persist._workers), 1)
+            await persist.close()
+
+        asyncio.run(run())
+
+    def test3_LeakedConnection(self):
+        persist = AsyncPersistentDB(dbapi, threads=1)
+
+        async def run():
+            db = await persist.connection()
+            con = db._con
+            self.assertEqual(len(persist._workers), 0)
+            del db  # leak the connection without closing it
+            gc.collect()
+            await asyncio.sleep(0)
+            self.assertEqual(len(persist._workers), 1)
+            db = await persist.connection(timeout=0)
+            self.assertTrue(db._con is con)
+            await db.close()
+            await persist.close()
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
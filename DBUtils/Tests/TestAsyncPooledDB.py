@@ -0,0 +1,351 @@
+"""Test the AsyncPooledDB module.
+
+Note:
+We don't test performance here, so the test does not predicate
+whether AsyncPooledDB actually will help in improving throughput or not.
+We also assume that the underlying PooledDB connections are tested.
+
+"""
+
+import asyncio
+import gc
+import unittest
+
+import DBUtils.Tests.mock_db as dbapi
+import DBUtils.Tests.mock_async_db as async_dbapi
+
+from DBUtils.AsyncPooledDB import (
+    AsyncPooledDB, AsyncSteadyPooledDB, AsyncDBConnection, AsyncDBCursor,
+    AsyncPooledDedicatedDBConnection, InvalidConnection, TooManyConnections)
+from DBUtils.AsyncSteadyDB import AsyncSteadyDBConnection, AsyncSteadyDBCursor
+from DBUtils.SteadyDB import SteadyDBLimiter, TooManyConnects
+
+__version__ = '1.3'
+
+
+class TestAsyncPooledDB(unittest.TestCase):
+
+    def setUp(self):
+        dbapi.threadsafety = 2
+
+    def test0_CheckVersion(self):
+        from DBUtils import __version__ as DBUtilsVersion
+        self.assertEqual(DBUtilsVersion, __version__)
+        from DBUtils.AsyncPooledDB import __version__ as AsyncPooledDBVersion
+        self.assertEqual(AsyncPooledDBVersion, __version__)
+        self.assertEqual(AsyncPooledDB.version, __version__)
+
+    def test1_CreateConnection(self):
+        pool = AsyncPooledDB(
+            dbapi, 1, maxconnections=2, database='AsyncPooledDBTestDB')
+        self.assertEqual(pool._executor._max_workers, 2)
+        self.assertEqual(len(pool._pool._idle_cache), 1)
+
+        async def run():
+            db = await pool.connection()
+            self.assertTrue(isinstance(db, AsyncDBConnection))
+            self.assertEqual(pool._connections, 1)
+            self.assertEqual(len(pool._pool._idle_cache), 0)
+            self.assertEqual(db._con._con._con.database, 'AsyncPooledDBTestDB')
+            self.assertEqual(db.threadsafety(), 2)
+            cursor = await db.cursor()
+            self.assertTrue(isinstance(cursor, AsyncDBCursor))
+            await cursor.execute('select test')
+            self.assertEqual(await cursor.fetchone(), 'test')
+            await cursor.close()
+            await db.commit()
+            await db.close()
+            self.assertEqual(pool._connections, 0)
+            self.assertEqual(len(pool._pool._idle_cache), 1)
+            with self.assertRaises(InvalidConnection):
+                await db.cursor()
+            await db.close()
+            self.assertEqual(pool._connections, 0)
+
+        asyncio.run(run())
+
+    def test2_ContextManager(self):
+        pool = AsyncPooledDB(dbapi, 0, maxconnections=1)
+
+        async def run():
+            async with pool.connection() as db:
+                self.assertEqual(pool._connections, 1)
+                async with await db.cursor() as cursor:
+                    await cursor.execute('select test')
+                    self.assertEqual(await cursor.fetchone(), 'test')
+                self.assertEqual(db._con._con._con.open_cursors, 0)
+            self.assertEqual(pool._connections, 0)
+            self.assertEqual(len(pool._pool._idle_cache), 1)
+            with self.assertRaises(dbapi.ProgrammingError):
+                async with pool.connection() as db:
+                    cursor = await db.cursor()
+                    await cursor.execute('error')
+            self.assertEqual(pool._connections, 0)
+            await pool.close()
+            self.assertEqual(len(pool._pool._idle_cache), 0)
+
+        asyncio.run(run())
+
+    def test3_TooManyConnections(self):
+        pool = AsyncPooledDB(dbapi, 0, maxconnections=1)
+
+        async def run():
+            db = await pool.connection()
+            with self.assertRaises(TooManyConnections):
+                await pool.connection()
+            with self.assertRaises(TooManyConnections):
+                await pool.connection(timeout=0.01)
+            self.assertEqual(len(pool._waiters), 0)
+            await db.close()
+            db = await pool.connection(timeout=0.01)
+            await db.close()
+            self.assertEqual(pool._connections, 0)
+
+        asyncio.run(run())
+
+    def test4_WaitingTasks(self):
+        pool = AsyncPooledDB(dbapi, 0, maxconnections=2, blocking=True)
+        order = []
+
+        async def task(i):
+            async with pool.connection() as db:
+                order.append(i)
+                cursor = await db.cursor()
+                await cursor.execute('select %d' % i)
+                result = await cursor.fetchone()
+                await asyncio.sleep(0.01)
+                return result
+
+        async def run():
+            results = await asyncio.gather(*(task(i) for i in range(10)))
+            self.assertEqual(results, [str(i) for i in range(10)])
+            self.assertEqual(order, list(range(10)))
+            self.assertEqual(pool._connections, 0)
+            self.assertEqual(len(pool._pool._idle_cache), 2)
+
+        asyncio.run(run())
+
+    def test5_CancelWaitingTask(self):
+        pool = AsyncPooledDB(dbapi, 0, maxconnections=1, blocking=True)
+
+        async def run():
+            db = await pool.connection()
+            task = asyncio.ensure_future(pool.connection())
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(pool._waiters), 1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(len(pool._waiters), 0)
+            await db.close()
+            self.assertEqual(pool._connections, 0)
+
+        asyncio.run(run())
+
+    def test6_LeakedConnections(self):
+        pool = AsyncPooledDB(dbapi, 0, maxconnections=2)
+
+        async def run():
+            db1 = await pool.connection()
+            db2 = await pool.connection()
+            self.assertEqual(pool._connections, 2)
+            self.assertEqual(pool._pool._connections, 2)
+            del db1, db2  # leak the connections without closing them
+            gc.collect()
+            await asyncio.sleep(0)
+            self.assertEqual(pool._connections, 0)
+            self.assertEqual(pool._pool._connections, 0)
+            self.assertEqual(len(pool._pool._idle_cache), 2)
+            db = await pool.connection()
+            await db.close()
+            self.assertEqual(pool._connections, 0)
+
+        asyncio.run(run())
+
+
+class TestAsyncSteadyPooledDB(unittest.TestCase):
+
+    def test0_CheckVersion(self):
+        self.assertEqual(AsyncSteadyPooledDB.version, __version__)
+
+    def test1_CreateConnection(self):
+        pool = AsyncSteadyPooledDB(
+            async_dbapi, 2, 3, 0, 4, database='AsyncPooledDBTestDB')
+        self.assertEqual(pool._maxconnections, 4)
+        self.assertEqual(len(pool._idle_cache), 0)
+        self.assertTrue(not hasattr(pool, '_executor'))
+
+        async def run():
+            await pool.open()
+            self.assertEqual(len(pool._idle_cache), 2)
+            db = await pool.connection()
+            self.assertTrue(isinstance(db, AsyncPooledDedicatedDBConnection))
+            self.assertTrue(isinstance(db._con, AsyncSteadyDBConnection))
+            self.assertEqual(db._con._con.database, 'AsyncPooledDBTestDB')
+            self.assertEqual(pool._connections, 1)
+            self.assertEqual(len(pool._idle_cache), 1)
+            cursor = await db.cursor()
+            self.assertTrue(isinstance(cursor, AsyncSteadyDBCursor))
+            await cursor.execute('select test')
+            self.assertEqual(await cursor.fetchone(), 'test')
+            await cursor.close()
+            await db.commit()
+            await db.close()
+            self.assertEqual(pool._connections, 0)
+            self.assertEqual(len(pool._idle_cache), 2)
+            with self.assertRaises(InvalidConnection):
+                await db.cursor()
+            await pool.close()
+            self.assertEqual(len(pool._idle_cache), 0)
+
+        asyncio.run(run())
+
+    def test2_OpenOnFirstRequest(self):
+        pool = AsyncSteadyPooledDB(async_dbapi, 3)
+
+        async def run():
+            async with pool.connection() as db:
+                self.assertEqual(len(pool._idle_cache), 2)
+                self.assertEqual(pool._connections, 1)
+                con = db._con
+            self.assertEqual(len(pool._idle_cache), 3)
+            self.assertTrue(pool._idle_cache[-1] is con)
+            self.assertEqual(con._con.session, [])
+
+        asyncio.run(run())
+
+    def test3_MaxCachedAndReset(self):
+        pool = AsyncSteadyPooledDB(async_dbapi, 0, 1, reset=False)
+
+        async def run():
+            db1 = await pool.connection()
+            db2 = await pool.connection()
+            con1, con2 = db1._con, db2._con
+            await db1.begin()
+            await db1.close()
+            self.assertEqual(con1._con.session, ['rollback'])
+            await db2.close()
+            self.assertEqual(list(pool._idle_cache), [con1])
+            self.assertTrue(con2._closed)
+            self.assertEqual(pool._connections, 0)
+
+        asyncio.run(run())
+
+    def test4_Failover(self):
+        pool = AsyncSteadyPooledDB(async_dbapi, 1, maxusage=2)
+
+        async def run():
+            async with pool.connection() as db:
+                cursor = await db.cursor()
+                for i in range(5):
+                    await cursor.execute('select test%d' % i)
+                    self.assertEqual(await cursor.fetchone(), 'test%d' % i)
+                    self.assertEqual(db._usage, i % 2 + 1)
+                con = db._con._con
+                con.valid = cursor._cursor.valid = False
+                await cursor.execute('select test')
+                self.assertEqual(await cursor.fetchone(), 'test')
+                self.assertTrue(db._con._con is not con)
+                self.assertTrue(db._con._con.valid)
+                await cursor.close()
+
+        asyncio.run(run())
+
+    def test5_PingCheckFromPool(self):
+        Connection = async_dbapi.Connection
+        Connection.has_ping = True
+        Connection.num_pings = 0
+        pool = AsyncSteadyPooledDB(async_dbapi, 1)
+
+        async def run():
+            await pool.open()
+            con = pool._idle_cache[0]._con
+            con.valid = False
+            async with pool.connection() as db:
+                self.assertEqual(Connection.num_pings, 1)
+                self.assertTrue(db._con._con is not con)
+                self.assertTrue(db._con._con.valid)
+
+        try:
+            asyncio.run(run())
+        finally:
+            Connection.has_ping = False
+            Connection.num_pings = 0
+
+    def test6_TooManyConnections(self):
+        pool = AsyncSteadyPooledDB(async_dbapi, 0, 0, 0, 1)
+
+        async def run():
+            db = await pool.connection()
+            with self.assertRaises(TooManyConnections):
+                await pool.connection()
+            with self.assertRaises(TooManyConnections):
+                await pool.connection(timeout=0.01)
+            await db.close()
+            db = await pool.connection()
+            await db.close()
+
+        asyncio.run(run())
+
+    def test7_WaitingTasks(self):
+        pool = AsyncSteadyPooledDB(async_dbapi, 0, 0, 0, 2, True)
+        order = []
+
+        async def task(i):
+            async with pool.connection() as db:
+                order.append(i)
+                cursor = await db.cursor()
+                await cursor.execute('select %d' % i)
+                result = await cursor.fetchone()
+                await asyncio.sleep(0.01)
+                await cursor.close()
+                return result
+
+        async def run():
+            results = await asyncio.gather(*(task(i) for i in range(10)))
+            self.assertEqual(results, [str(i) for i in range(10)])
+            self.assertEqual(order, list(range(10)))
+            self.assertEqual(pool._connections, 0)
+            self.assertEqual(len(pool._idle_cache), 2)
+
+        asyncio.run(run())
+
+    def test8_LostConnection(self):
+        pool = AsyncSteadyPooledDB(async_dbapi, 0, 0, 0, 1)
+
+        async def run():
+            db = await pool.connection()
+            self.assertEqual(pool._connections, 1)
+            con = db._con._con
+            del db  # the slot is freed in the event loop
+            gc.collect()
+            await asyncio.sleep(0)
+            self.assertEqual(pool._connections, 0)
+            await asyncio.sleep(0)
+            self.assertFalse(con.valid)
+
+        asyncio.run(run())
+
+    def test9_Limiter(self):
+        limiter = SteadyDBLimiter(1, 2, timeout=0)
+        pool = AsyncSteadyPooledDB(async_dbapi, 2, limiter=limiter)
+
+        async def run():
+            await pool.open()
+            self.assertEqual(len(pool._idle_cache), 2)
+            self.assertTrue(pool._idle_cache[0]._limiter is limiter)
+            db1 = await pool.connection()
+            db2 = await pool.connection()
+            with self.assertRaises(TooManyConnects):
+                await pool.connection()
+            self.assertEqual(pool._connections, 2)
+            self.assertEqual(limiter.connecting, 0)
+            await db1.close()
+            await db2.close()
+            await pool.close()
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
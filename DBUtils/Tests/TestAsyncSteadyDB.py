@@ -0,0 +1,422 @@
+"""Test the AsyncSteadyDB module.
+
+Note:
+We do not test any real asynchronous database module, but we just
+mock the basic asynchronous DB-API 2 connection functionality.
+
+"""
+
+import asyncio
+import gc
+import unittest
+
+import DBUtils.Tests.mock_async_db as dbapi
+
+from DBUtils.AsyncSteadyDB import (
+    connect as AsyncSteadyDBconnect,
+    AsyncSteadyDBConnection, AsyncSteadyDBCursor)
+from DBUtils.SteadyDB import SteadyDBBreaker, SteadyDBLimiter, TooManyConnects
+
+__version__ = '1.3'
+
+
+def run(coro):
+    """Run a coroutine in a new event loop."""
+    return asyncio.run(coro)
+
+
+class TestAsyncSteadyDB(unittest.TestCase):
+
+    def test00_CheckVersion(self):
+        from DBUtils import __version__ as DBUtilsVersion
+        self.assertEqual(DBUtilsVersion, __version__)
+        from DBUtils.AsyncSteadyDB import __version__ as AsyncSteadyDBVersion
+        self.assertEqual(AsyncSteadyDBVersion, __version__)
+        self.assertEqual(AsyncSteadyDBConnection.version, __version__)
+
+    def test01_Connection(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(
+                dbapi, 0, None, None, None, True,
+                'AsyncSteadyDBTestDB', user='AsyncSteadyDBTestUser')
+            self.assertTrue(isinstance(db, AsyncSteadyDBConnection))
+            self.assertTrue(isinstance(db._con, dbapi.Connection))
+            self.assertEqual(db._con.database, 'AsyncSteadyDBTestDB')
+            self.assertEqual(db._con.user, 'AsyncSteadyDBTestUser')
+            self.assertEqual(db.dbapi(), dbapi)
+            self.assertEqual(db.threadsafety(), 2)
+            self.assertEqual(
+                db._failures, (dbapi.OperationalError, dbapi.InternalError))
+            cursor = await db.cursor()
+            self.assertTrue(isinstance(cursor, AsyncSteadyDBCursor))
+            self.assertEqual(db._con.open_cursors, 1)
+            for i in range(3):
+                self.assertEqual(db._usage, i)
+                await cursor.execute('select test%d' % i)
+                self.assertEqual(await cursor.fetchone(), 'test%d' % i)
+            for i in range(4):
+                await cursor.callproc('test')
+            self.assertEqual(db._usage, 7)
+            self.assertEqual(db._con.num_uses, 7)
+            self.assertEqual(db._con.num_queries, 3)
+            await cursor.close()
+            self.assertEqual(db._con.open_cursors, 0)
+            # a closed cursor is transparently reopened
+            await cursor.execute('select test8')
+            self.assertEqual(db._con.open_cursors, 1)
+            self.assertEqual(await cursor.fetchone(), 'test8')
+            self.assertEqual(db._usage, 8)
+            await cursor.close()
+            self.assertEqual(db._con.open_cursors, 0)
+            # a closed connection is transparently reopened
+            await db.close()
+            self.assertTrue(db._closed)
+            cursor = await db.cursor()
+            self.assertTrue(not db._closed)
+            self.assertEqual(db._usage, 0)
+            await cursor.execute('select test9')
+            self.assertEqual(await cursor.fetchone(), 'test9')
+            self.assertEqual(db._usage, 1)
+            # a lost connection is transparently reopened
+            db._con.valid = cursor._cursor.valid = False
+            await cursor.execute('select test10')
+            self.assertEqual(await cursor.fetchone(), 'test10')
+            self.assertEqual(db._usage, 1)
+            self.assertTrue(db._con.valid)
+            await db.close()
+            self.assertTrue(not db._con.valid)
+            await db.close()
+
+        run(test())
+
+    def test02_BrokenConnection(self):
+        async def test():
+            with self.assertRaises(TypeError):
+                await AsyncSteadyDBconnect('wrong')
+            db = await AsyncSteadyDBconnect(dbapi, database='ok')
+            with self.assertRaises(dbapi.OperationalError):
+                await db.cursor('error')
+            with self.assertRaises(dbapi.OperationalError):
+                await AsyncSteadyDBconnect(dbapi, database='error')
+            with self.assertRaises(TypeError):
+                with db:
+                    pass
+
+        run(test())
+
+    def test03_ContextHandlers(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi)
+            async with db:
+                async with await db.cursor() as cursor:
+                    await cursor.execute('select test')
+                    self.assertEqual(await cursor.fetchone(), 'test')
+                self.assertEqual(db._con.open_cursors, 0)
+            self.assertEqual(db._con.session, ['commit'])
+            with self.assertRaises(dbapi.ProgrammingError):
+                async with db:
+                    cursor = await db.cursor()
+                    await cursor.execute('error')
+            self.assertEqual(db._con.session, ['commit', 'rollback'])
+
+        run(test())
+
+    def test04_ConnectionCreatorFunction(self):
+        async def test():
+            async def connect(database=None, user=None):
+                return await dbapi.connect(database, user)
+            db = await AsyncSteadyDBconnect(connect, database='ok')
+            self.assertEqual(db.dbapi(), dbapi)
+            self.assertEqual(db._con.database, 'ok')
+            cursor = await db.cursor()
+            await cursor.execute('select test')
+            self.assertEqual(await cursor.fetchone(), 'test')
+            await db.close()
+
+        run(test())
+
+    def test05_ConnectionMaxUsage(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi, 10)
+            cursor = await db.cursor()
+            for i in range(25):
+                await cursor.execute('select test%d' % i)
+                self.assertEqual(await cursor.fetchone(), 'test%d' % i)
+                j = i % 10 + 1
+                self.assertEqual(db._usage, j)
+                self.assertEqual(db._con.num_uses, j)
+            self.assertEqual(db._con.open_cursors, 1)
+
+        run(test())
+
+    def test06_ConnectionSetSession(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(
+                dbapi, 3, ('set time zone', 'set datestyle'))
+            self.assertEqual(db._con.session, ['time zone', 'datestyle'])
+            self.assertEqual(db._con.open_cursors, 0)
+            cursor = await db.cursor()
+            for i in range(3):
+                await cursor.execute('select test')
+            self.assertEqual(db._usage, 3)
+            await cursor.execute('select test')
+            self.assertEqual(db._usage, 1)
+            self.assertEqual(db._con.session, ['time zone', 'datestyle'])
+            await db.commit()
+            self.assertEqual(
+                db._con.session, ['time zone', 'datestyle', 'commit'])
+            await db.close()
+            await cursor.execute('select test')
+            self.assertEqual(db._con.session, ['time zone', 'datestyle'])
+
+        run(test())
+
+    def test07_ConnectionFailures(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi)
+            await db.close()
+            await db.cursor()
+            db = await AsyncSteadyDBconnect(dbapi, failures=dbapi.InternalError)
+            await db.close()
+            await db.cursor()
+            db = await AsyncSteadyDBconnect(
+                dbapi, failures=dbapi.OperationalError)
+            await db.close()
+            with self.assertRaises(dbapi.InternalError):
+                await db.cursor()
+
+        run(test())
+
+    def test08_ConnectionPingCheck(self):
+        Connection = dbapi.Connection
+        Connection.has_ping = False
+        Connection.num_pings = 0
+
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi)
+            self.assertTrue(await db._ping_check() is None)
+            self.assertEqual(Connection.num_pings, 1)
+            self.assertEqual(db._ping, 0)
+            Connection.has_ping = True
+            db = await AsyncSteadyDBconnect(dbapi, ping=1)
+            await (await db.cursor()).execute('select test')
+            self.assertEqual(Connection.num_pings, 1)
+            con = db._con
+            await db.close()
+            self.assertTrue(await db._ping_check())
+            self.assertEqual(Connection.num_pings, 2)
+            self.assertTrue(db._con is not con)
+            db = await AsyncSteadyDBconnect(dbapi, ping=7)
+            cursor = await db.cursor()
+            self.assertEqual(Connection.num_pings, 3)
+            await cursor.execute('select test')
+            self.assertEqual(Connection.num_pings, 4)
+            await db.begin()
+            await cursor.execute('select test')
+            self.assertEqual(Connection.num_pings, 4)
+            con = db._con
+            con.valid = False
+            self.assertEqual(await db._ping_check(), False)
+            self.assertTrue(db._con is con)
+
+        try:
+            run(test())
+        finally:
+            Connection.has_ping = False
+            Connection.num_pings = 0
+
+    def test09_BeginTransaction(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi, database='ok')
+            cursor = await db.cursor()
+            await cursor.close()
+            await cursor.execute('select test12')
+            self.assertEqual(await cursor.fetchone(), 'test12')
+            await db.begin()
+            cursor = await db.cursor()
+            await cursor.close()
+            with self.assertRaises(dbapi.InternalError):
+                await cursor.execute('select test12')
+            await cursor.execute('select test12')
+            self.assertEqual(await cursor.fetchone(), 'test12')
+            await db.close()
+            await db.begin()
+            with self.assertRaises(dbapi.InternalError):
+                await cursor.execute('select test12')
+            self.assertTrue(not db._transaction)
+            await cursor.execute('select test12')
+            self.assertEqual(await cursor.fetchone(), 'test12')
+            await db.begin()
+            with self.assertRaises(dbapi.ProgrammingError):
+                await cursor.execute('error')
+            self.assertTrue(db._transaction)
+            await cursor.close()
+            with self.assertRaises(dbapi.InternalError):
+                await cursor.execute('select test12')
+            self.assertTrue(not db._transaction)
+            await cursor.execute('select test12')
+            self.assertEqual(await cursor.fetchone(), 'test12')
+
+        run(test())
+
+    def test10_CommitAndRollbackErrors(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi, database='ok')
+            await db.begin()
+            con = db._con
+            con.valid = False
+            with self.assertRaises(dbapi.InternalError):
+                await db.commit()
+            self.assertTrue(not db._transaction)
+            self.assertTrue(db._con is not con)
+            self.assertTrue(db._con.valid)
+            await db.rollback()
+            self.assertEqual(db._con.session, ['rollback'])
+            db._con.valid = False
+            with self.assertRaises(dbapi.InternalError):
+                await db.rollback()
+            self.assertTrue(db._con.valid)
+            await db.begin()
+            self.assertTrue(db._transaction)
+            await db._reset()
+            self.assertTrue(not db._transaction)
+            self.assertEqual(db._con.session, ['rollback'])
+            await db.cancel()
+
+        run(test())
+
+    def test11_Probes(self):
+        Connection = dbapi.Connection
+        Connection.num_pings = 0
+
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi, probe='select 1')
+            con = db._con
+            self.assertTrue(await db._ping_check())
+            self.assertEqual(Connection.num_pings, 1)
+            self.assertEqual(con.num_queries, 1)
+            con.valid = False
+            self.assertTrue(await db._ping_check())
+            self.assertTrue(db._con is not con)
+            Connection.has_socket = True
+            db = await AsyncSteadyDBconnect(dbapi, probe='socket')
+            con = db._con
+            self.assertTrue(await db._ping_check())
+            self.assertEqual(con.num_queries, 0)
+            con.peer.close()
+            self.assertTrue(await db._ping_check())
+            self.assertTrue(db._con is not con)
+            Connection.has_ping = True
+            db = await AsyncSteadyDBconnect(dbapi, probe='select 1')
+            self.assertTrue(await db._ping_check())
+            self.assertEqual(Connection.num_pings, 2)
+            self.assertEqual(db._con.num_queries, 0)
+
+            async def probe(db):
+                raise ValueError
+
+            db._probes = (probe,)
+            con = db._con
+            self.assertTrue(await db._ping_check())
+            self.assertTrue(db._con is not con)
+            self.assertEqual(db._ping, 1)
+            self.assertEqual(db._probes, (probe,))
+
+        try:
+            run(test())
+        finally:
+            Connection.has_ping = Connection.has_socket = False
+            Connection.num_pings = 0
+
+    def test12_Limiter(self):
+        self.assertRaises(
+            TypeError, AsyncSteadyDBConnection, dbapi, limiter=1)
+        limiter = SteadyDBLimiter(maxconnects=1, timeout=0)
+        entered = []
+
+        async def test():
+            proceed = asyncio.Event()
+
+            async def creator(database=None):
+                entered.append(database)
+                await proceed.wait()
+                return await dbapi.connect(database)
+
+            creator.dbapi = dbapi
+            task = asyncio.ensure_future(
+                AsyncSteadyDBconnect(creator, limiter=limiter))
+            for i in range(50):
+                if entered:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(limiter.connecting, 1)
+            with self.assertRaises(TooManyConnects):
+                await AsyncSteadyDBconnect(creator, limiter=limiter)
+            proceed.set()
+            db = await task
+            self.assertTrue(db._limiter is limiter)
+            self.assertEqual(limiter.connecting, 0)
+            with self.assertRaises(dbapi.OperationalError):
+                await AsyncSteadyDBconnect(
+                    dbapi, limiter=limiter, database='error')
+            self.assertEqual(limiter.connecting, 0)
+            breaker = SteadyDBBreaker(1, jitter=0)
+            breaker.failed()
+            breaker._until -= 1
+            limiter.connecting = 1
+            with self.assertRaises(TooManyConnects):
+                await AsyncSteadyDBconnect(
+                    dbapi, breaker=breaker, limiter=limiter)
+            self.assertEqual(breaker.state, 'open')
+            limiter.timeout = 5
+            task = asyncio.ensure_future(
+                AsyncSteadyDBconnect(dbapi, limiter=limiter))
+            await asyncio.sleep(0.05)
+            task.cancel()  # cancel the attempt waiting in line
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            limiter.release()  # the cancelled attempt is granted now
+            for i in range(50):
+                if not limiter.connecting:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(limiter.connecting, 0)
+
+        run(test())
+        self.assertEqual(entered, [None])
+
+    def test13_LeakedConnection(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi, database='ok')
+            con = db._con
+            await db.cursor()  # leak a cursor as well
+            del db  # leak the connection without closing it
+            gc.collect()
+            await asyncio.sleep(0)
+            self.assertFalse(con.valid)
+
+        run(test())
+
+    def test14_CancelBeforeExecute(self):
+        async def test():
+            db = await AsyncSteadyDBconnect(dbapi, database='ok')
+            con = db._con
+            con.cancel = lambda: None
+            cursor = await db.cursor()
+            await db.cancel()  # the query is cancelled when it is started
+            con.valid = False
+            with self.assertRaises(dbapi.InternalError):
+                await cursor.execute('select test')
+            self.assertTrue(db._con is con)  # it has not been executed again
+            self.assertFalse(db._cancelled)
+            await cursor.execute('select test')  # but this is executed again
+            self.assertTrue(db._con is not con)
+            await db.cancel()
+            await db._reset()
+            self.assertFalse(db._cancelled)
+
+        run(test())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""Test the MultiPooledDB module.
+
+Note:
+We don't test performance here, so the test does not predicate
+whether MultiPooledDB actually will help in improving performance or not.
+We also assume that the underlying SteadyDB and PooledDB modules have
+been tested already.
+
+"""
+
+import unittest
+
+import DBUtils.Tests.mock_db as dbapi
+
+from DBUtils.MultiPooledDB import MultiPooledDB
+from DBUtils.PooledDB import TooManyConnections
+
+__version__ = '1.3'
+
+
+dead = set()  # the databases that cannot be reached
+
+
+def creator(database=None, user=None):
+    if database in dead:
+        raise dbapi.OperationalError
+    return dbapi.connect(database, user)
+
+
+creator.dbapi = dbapi
+
+
+class TestMultiPooledDB(unittest.TestCase):
+
+    hosts = [dict(database='db1'), dict(database='db2')]
+
+    def tearDown(self):
+        dead.clear()
+
+    def test0_CheckVersion(self):
+        from DBUtils import __version__ as DBUtilsVersion
+        self.assertEqual(DBUtilsVersion, __version__)
+        from DBUtils.MultiPooledDB import __version__ as MultiPooledDBVersion
+        self.assertEqual(MultiPooledDBVersion, __version__)
+        self.assertEqual(MultiPooledDB.version, __version__)
+
+    def test1_CreatePools(self):
+        self.assertRaises(ValueError, MultiPooledDB, dbapi, [])
+        self.assertRaises(
+            ValueError, MultiPooledDB, dbapi, self.hosts, balance='random')
+        pool = MultiPooledDB(dbapi, self.hosts, 1, user='test')
+        self.assertEqual(len(pool.pools), 2)
+        for pool, database in zip(pool.pools, ('db1', 'db2')):
+            con = pool._idle_cache[0]
+            self.assertEqual(con._con.database, database)
+            self.assertEqual(con._con.user, 'test')
+            self.assertTrue(con.dbapi() is dbapi)
+            self.assertEqual(con.threadsafety(), dbapi.threadsafety)
+        pool = MultiPooledDB(creator, self.hosts, 1)
+        con = pool.pools[1]._idle_cache[0]
+        self.assertEqual(con._con.database, 'db2')
+        self.assertTrue(con.dbapi() is dbapi)
+
+    def test2_RoundRobin(self):
+        pool = MultiPooledDB(dbapi, self.hosts)
+        databases = []
+        for i in range(4):
+            db = pool.connection()
+            databases.append(db._con._con.database)
+            db.close()
+        self.assertEqual(databases, ['db1', 'db2', 'db1', 'db2'])
+
+    def test3_LeastOutstanding(self):
+        pool = MultiPooledDB(
+            dbapi, self.hosts, balance='least-outstanding')
+        db1 = pool.connection()
+        db2 = pool.connection()
+        db3 = pool.connection()
+        self.assertEqual(db1._con._con.database, 'db1')
+        self.assertEqual(db2._con._con.database, 'db2')
+        self.assertEqual(db3._con._con.database, 'db1')
+        db1.close()
+        db3.close()
+        db4 = pool.connection()
+        self.assertEqual(db4._con._con.database, 'db1')
+        db5 = pool.connection()
+        self.assertEqual(db5._con._con.database, 'db1')
+
+    def test4_Latency(self):
+        pool = MultiPooledDB(dbapi, self.hosts, balance='latency')
+        latency = pool._hosts.latency
+        db = pool.connection()
+        self.assertEqual(db._con._con.database, 'db1')
+        self.assertTrue(latency[0] > 0)
+        self.assertEqual(latency[1], 0)
+        db.close()
+        latency[0] = 2
+        latency[1] = 3
+        db = pool.connection()
+        self.assertEqual(db._con._con.database, 'db1')
+        self.assertTrue(1.6 < latency[0] < 2)
+        db2 = pool.connection()
+        self.assertEqual(db2._con._con.database, 'db2')
+        db2.close()
+        db.close()
+        self.assertTrue(0 < latency[1] < 3)
+        latency[1] = 3
+        pool._hosts.measure(1, 8)
+        self.assertEqual(latency[1], 4)
+
+    def test5_Failover(self):
+        pool = MultiPooledDB(creator, self.hosts, 1, 1)
+        hosts = pool._hosts
+        db = pool.connection()
+        con = db._con._con
+        self.assertEqual(con.database, 'db1')
+        cursor = db.cursor()
+        dead.add('db1')
+        con.valid = False
+        cursor.execute('select test')
+        self.assertEqual(cursor.fetchone(), 'test')
+        self.assertTrue(db._con._con is not con)
+        self.assertEqual(db._con._con.database, 'db2')
+        self.assertTrue(hosts.ejected[0])
+        self.assertFalse(hosts.ejected[1])
+        db.close()
+        for i in range(3):
+            db = pool.connection()
+            self.assertEqual(pool.pools[1]._connections, 1)
+            self.assertEqual(db._con._con.database, 'db2')
+            db.close()
+        self.assertEqual(hosts.healthy(), [1])
+        dead.clear()
+        hosts.ejected[0] -= hosts.ejecttime
+        self.assertEqual(hosts.healthy(), [0, 1])
+        db = pool.dedicated_connection()
+        self.assertEqual(db._con._con.database, 'db2')
+        db = pool.dedicated_connection()
+        db._con._con.valid = False
+        db.cursor().execute('select test')
+        self.assertEqual(db._con._con.database, 'db1')
+        self.assertFalse(hosts.ejected[0])
+
+    def test6_AllHostsDown(self):
+        pool = MultiPooledDB(creator, self.hosts)
+        dead.update(('db1', 'db2'))
+        self.assertRaises(dbapi.OperationalError, pool.connection)
+        hosts = pool._hosts
+        self.assertTrue(hosts.ejected[0] and hosts.ejected[1])
+        self.assertEqual(sorted(hosts.healthy()), [0, 1])
+        dead.remove('db2')
+        db = pool.connection()
+        self.assertEqual(db._con._con.database, 'db2')
+        self.assertEqual(hosts.healthy(), [1])
+
+    def test7_TooManyConnections(self):
+        pool = MultiPooledDB(dbapi, self.hosts, 0, 1, 0, 1)
+        db1 = pool.connection()
+        db2 = pool.connection()
+        self.assertEqual(db1._con._con.database, 'db1')
+        self.assertEqual(db2._con._con.database, 'db2')
+        self.assertRaises(TooManyConnections, pool.connection)
+        db1.close()
+        db3 = pool.connection()
+        self.assertEqual(db3._con._con.database, 'db1')
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Test the PoolMetrics module.
+
+Note:
+The recording of the metrics by the pools is tested
+together with the pools in TestPooledDB and TestPooledPg.
+
+"""
+
+import unittest
+
+from threading import Thread
+
+from DBUtils.PoolMetrics import PoolMetrics
+
+__version__ = '1.3'
+
+
+class TestPoolMetrics(unittest.TestCase):
+
+    def test0_CheckVersion(self):
+        from DBUtils import __version__ as DBUtilsVersion
+        self.assertEqual(DBUtilsVersion, __version__)
+        from DBUtils.PoolMetrics import __version__ as PoolMetricsVersion
+        self.assertEqual(PoolMetricsVersion, __version__)
+        self.assertEqual(PoolMetrics.version, __version__)
+
+    def test1_EmptySnapshot(self):
+        metrics = PoolMetrics()
+        stats = metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 0)
+        for key in ('hits', 'misses', 'failovers', 'recycles', 'rejects'):
+            self.assertEqual(stats[key], 0)
+        for key in ('wait', 'hold'):
+            hist = stats[key]
+            self.assertEqual(hist['count'], 0)
+            self.assertEqual(hist['total'], 0)
+            self.assertEqual(hist['max'], 0)
+            self.assertEqual(
+                hist['buckets'],
+                [(bound, 0) for bound in PoolMetrics.buckets] + [(None, 0)])
+
+    def test2_Record(self):
+        metrics = PoolMetrics([1, 0.1])
+        self.assertEqual(metrics.buckets, (0.1, 1))
+        metrics.checkout(0.05, True)
+        metrics.checkout(0.5)
+        metrics.checkout(0.1)
+        metrics.checkout(5)
+        metrics.hold(2)
+        metrics.failover()
+        metrics.recycle()
+        metrics.recycle()
+        metrics.reject()
+        stats = metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 4)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['failovers'], 1)
+        self.assertEqual(stats['recycles'], 2)
+        self.assertEqual(stats['rejects'], 1)
+        wait = stats['wait']
+        self.assertEqual(wait['count'], 4)
+        self.assertAlmostEqual(wait['total'], 5.65)
+        self.assertEqual(wait['max'], 5)
+        self.assertEqual(wait['buckets'], [(0.1, 2), (1, 1), (None, 1)])
+        hold = stats['hold']
+        self.assertEqual(hold['count'], 1)
+        self.assertEqual(hold['buckets'], [(0.1, 0), (1, 0), (None, 1)])
+        metrics.reset()
+        stats = metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 0)
+        self.assertEqual(stats['wait']['count'], 0)
+
+    def test3_Threads(self):
+        metrics = PoolMetrics()
+
+        def record():
+            for i in range(100):
+                metrics.checkout(0.001, i % 2)
+                metrics.hold(0.01)
+
+        threads = [Thread(target=record) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        record()
+        self.assertTrue(1 <= len(metrics._counters) <= 6)
+        for thread in threads:
+            thread.join(5)
+            self.assertTrue(not thread.is_alive())
+        stats = metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 600)
+        self.assertEqual(stats['hits'], 300)
+        self.assertEqual(stats['misses'], 300)
+        self.assertEqual(stats['hold']['count'], 600)
+        # the counters of the terminated threads have been merged
+        self.assertEqual(len(metrics._counters), 1)
+        self.assertEqual(metrics._retired.hits, 250)
+        self.assertEqual(metrics.snapshot(), stats)
+        metrics.reset()
+        self.assertEqual(metrics.snapshot()['checkouts'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,10 +13,15 @@ Copyright and credit info:
 
 import unittest
 
+from time import sleep
+
 import DBUtils.Tests.mock_db as dbapi
 
 from DBUtils.PooledDB import (
-    PooledDB, SharedDBConnection, InvalidConnection, TooManyConnections)
+    PooledDB, SharedDBConnection, SharedDBCache,
+    InvalidConnection, TooManyConnections)
+from DBUtils.SteadyDB import (
+    BreakerOpen, SteadyDBBreaker, SteadyDBLimiter, TooManyConnects)
 
 __version__ = '1.3'
 
@@ -115,7 +120,7 @@ class TestPooledDB(unittest.TestCase):
             self.assertEqual(db_con.num_queries, 1)
             self.assertEqual(db._usage, 2)
             self.assertEqual(
-                db_con.session, ['rollback', 'sessiontest'])
+                db_con.session, ['sessiontest'])
             pool = PooledDB(dbapi, 1, 1, 1)
             self.assertEqual(len(pool._idle_cache), 1)
             if shareable:
@@ -294,7 +299,7 @@ class TestPooledDB(unittest.TestCase):
                 cache = []
                 for i in range(5):
                     cache.append(pool.connection())
-                pool._shared_cache[3].con.close = close_shared
+                pool._shared_cache[3].con._con.close = close_shared
             else:
                 pool._idle_cache[7]._con.close = close_shared
             pool._idle_cache[3]._con.close = close_idle
@@ -593,11 +598,10 @@ class TestPooledDB(unittest.TestCase):
                 cache[3] = cache[8] = cache[33] = None
                 cache[12] = cache[17] = cache[34] = None
                 self.assertEqual(len(pool._shared_cache), 5)
-                self.assertEqual(pool._shared_cache[0].shared, 7)
-                self.assertEqual(pool._shared_cache[1].shared, 7)
-                self.assertEqual(pool._shared_cache[2].shared, 5)
-                self.assertEqual(pool._shared_cache[3].shared, 4)
-                self.assertEqual(pool._shared_cache[4].shared, 6)
+                self.assertEqual(pool._shared_cache.top().shared, 4)
+                self.assertEqual(sorted(
+                    con.shared for con in pool._shared_cache),
+                    [4, 5, 6, 7, 7])
                 for db in cache:
                     if db:
                         db.cursor().callproc('test4')
@@ -649,7 +653,7 @@ class TestPooledDB(unittest.TestCase):
             db.close()
             self.assertEqual(session, [
                 'doit1', 'commit', 'dont1', 'rollback',
-                'doit2', 'commit', 'rollback'])
+                'doit2', 'commit'])
 
     def test13_MaxConnections(self):
         for threadsafety in (1, 2):
@@ -835,16 +839,16 @@ class TestPooledDB(unittest.TestCase):
             thread = Thread(target=connection)
             thread.start()
             thread.join(0.1)
-            self.assertTrue(thread.isAlive())
+            self.assertTrue(thread.is_alive())
             self.assertEqual(pool._connections, 1)
             self.assertEqual(len(pool._idle_cache), 0)
             if shareable:
                 self.assertEqual(len(pool._shared_cache), 0)
             session = db._con._con.session
-            self.assertEqual(session, ['rollback'])
+            self.assertEqual(session, [])  # clean sessions are not rolled back
             del db
             thread.join(0.1)
-            self.assertTrue(not thread.isAlive())
+            self.assertTrue(not thread.is_alive())
             self.assertEqual(pool._connections, 0)
             self.assertEqual(len(pool._idle_cache), 1)
             if shareable:
@@ -852,8 +856,7 @@ class TestPooledDB(unittest.TestCase):
             db = pool.connection(False)
             self.assertEqual(pool._connections, 1)
             self.assertEqual(len(pool._idle_cache), 0)
-            self.assertEqual(
-                session, ['rollback', 'rollback', 'thread', 'rollback'])
+            self.assertEqual(session, ['thread', 'rollback'])
             del db
 
     def test14_MaxUsage(self):
@@ -1170,11 +1173,11 @@ class TestPooledDB(unittest.TestCase):
         db.begin()
         con = db._con
         self.assertTrue(con._transaction)
-        self.assertEqual(con._con.session, ['rollback'])
+        self.assertEqual(con._con.session, [])
         db.close()
         self.assertTrue(pool.connection()._con is con)
         self.assertTrue(not con._transaction)
-        self.assertEqual(con._con.session, ['rollback'] * 3)
+        self.assertEqual(con._con.session, ['rollback'])
         pool = PooledDB(dbapi, 1, 1, 0, reset=False)
         db = pool.connection()
         db.begin()
@@ -1186,6 +1189,762 @@ class TestPooledDB(unittest.TestCase):
         self.assertTrue(not con._transaction)
         self.assertEqual(con._con.session, ['rollback'])
 
+    def test22_ConnectOutsideLock(self):
+        dbapi.threadsafety = 2
+        from threading import Event, Thread
+        connecting, proceed = Event(), Event()
+        calls = []
+
+        def creator():
+            calls.append(1)
+            if len(calls) > 1:  # block when opening the second connection
+                connecting.set()
+                proceed.wait(5)
+            return dbapi.connect()
+
+        for maxshared in (0, 2):
+            del calls[:]
+            connecting.clear()
+            proceed.clear()
+            pool = PooledDB(creator, 1, 1, maxshared)
+            db = pool.connection(False)
+            con = db._con
+            thread = Thread(target=pool.connection)
+            thread.start()
+            self.assertTrue(connecting.wait(5))
+            # the pool must be usable while the connection is being opened
+            db.close()
+            self.assertEqual(pool._connections, 1)
+            db = pool.connection(False)
+            self.assertTrue(db._con is con)
+            self.assertEqual(pool._connections, 2)
+            proceed.set()
+            thread.join(5)
+            self.assertTrue(not thread.is_alive())
+            self.assertEqual(len(calls), 2)
+            db.close()
+            self.assertEqual(pool._connections, 0)
+
+    def test23_FailedConnect(self):
+        dbapi.threadsafety = 2
+        for maxshared in (0, 1):
+            pool = PooledDB(
+                dbapi, 0, 0, maxshared, 1, False, None, None, True, None, 1,
+                'error')
+            self.assertRaises(dbapi.OperationalError, pool.connection)
+            self.assertEqual(pool._connections, 0)
+            if maxshared:
+                self.assertEqual(pool._shared_pending, 0)
+                self.assertEqual(len(pool._shared_cache), 0)
+            pool._kwargs['database'] = 'ok'
+            pool._args = ()
+            db = pool.connection()
+            self.assertEqual(pool._connections, 1)
+            db.close()
+
+
+    def test24_IdlePolicy(self):
+        dbapi.threadsafety = 2
+        self.assertRaises(ValueError, PooledDB, dbapi, policy='random')
+        for policy in ('fifo', 'lifo'):
+            pool = PooledDB(dbapi, 3, policy=policy)
+            cons = list(pool._idle_cache)
+            self.assertEqual(len(cons), 3)
+            db = pool.connection()
+            if policy == 'fifo':
+                self.assertTrue(db._con is cons[0])
+            else:
+                self.assertTrue(db._con is cons[2])
+            db.close()
+            self.assertTrue(pool._idle_cache[-1] is cons[
+                0 if policy == 'fifo' else 2])
+            db = pool.connection()
+            if policy == 'fifo':
+                self.assertTrue(db._con is cons[1])
+            else:
+                self.assertTrue(db._con is cons[2])
+            db.close()
+
+
+    def test25_SharedInTransactionBlocking(self):
+        dbapi.threadsafety = 2
+        from threading import Thread
+        pool = PooledDB(dbapi, 0, 0, 1, 1, True)
+        db = pool.connection()
+        db.begin()
+        result = []
+        thread = Thread(target=lambda: result.append(pool.connection()))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(result, [])
+        db.commit()
+        thread.join(5)
+        self.assertTrue(not thread.is_alive())
+        self.assertTrue(result[0]._con is db._con)
+        self.assertEqual(db._shared_con.shared, 2)
+
+
+    def test26_Maintenance(self):
+        dbapi.threadsafety = 2
+        from time import sleep
+
+        def wait_for(condition):
+            for i in range(500):
+                if condition():
+                    return True
+                sleep(0.01)
+            return False
+
+        pool = PooledDB(dbapi, 2)
+        self.assertTrue(pool._maintainer is None)
+        cons = [pool.connection(False) for i in range(2)]
+        self.assertEqual(len(pool._idle_cache), 0)
+        pool.maintain()
+        self.assertEqual(len(pool._idle_cache), 2)
+        del cons
+        pool = PooledDB(dbapi, 2, maintenance=60)
+        maintainer = pool._maintainer
+        self.assertTrue(maintainer.is_alive())
+        self.assertEqual(len(pool._idle_cache), 2)
+        idle = pool._idle_cache
+        db1 = pool.connection(False)
+        db2 = pool.connection(False)
+        self.assertTrue(wait_for(lambda: len(idle) == 2))
+        self.assertEqual(pool._connections, 2)
+        db1.close()
+        db2.close()
+        self.assertEqual(len(pool._idle_cache), 4)
+        pool.close()
+        maintainer.join(5)
+        self.assertTrue(not maintainer.is_alive())
+        pool = PooledDB(dbapi, 3, 0, 0, 4, maintenance=60)
+        idle = pool._idle_cache
+        cons = [pool.connection(False) for i in range(2)]
+        self.assertTrue(wait_for(lambda: len(idle) == 2))
+        sleep(0.05)
+        self.assertEqual(len(pool._idle_cache), 2)
+        self.assertEqual(pool._connections, 2)
+        del cons
+        maintainer = pool._maintainer
+        del pool
+        maintainer.wake()
+        maintainer.join(5)
+        self.assertTrue(not maintainer.is_alive())
+        pool = PooledDB(dbapi, 2, 0, 0, 3)
+        cons = [pool.connection(False) for i in range(2)]
+        pool.maintain()  # must not take the last free slot
+        self.assertEqual(len(pool._idle_cache), 0)
+        self.assertEqual(pool._connections, 2)
+        db = pool.connection(False)
+        self.assertEqual(pool._connections, 3)
+        db.close()
+        pool.maintain()
+        self.assertEqual(len(pool._idle_cache), 1)
+
+    def test27_MaintenanceRenewsWornOut(self):
+        dbapi.threadsafety = 2
+        pool = PooledDB(dbapi, 1, maxusage=2)
+        db = pool.connection()
+        con = db._con
+        db_con = con._con
+        db.cursor().execute('select test')
+        db.cursor().execute('select test')
+        db.close()
+        self.assertEqual(con._usage, 2)
+        self.assertTrue(pool._idle_cache[0] is con)
+        pool.maintain()
+        self.assertEqual(len(pool._idle_cache), 1)
+        self.assertTrue(pool._idle_cache[0] is not con)
+        self.assertEqual(pool._idle_cache[0]._usage, 0)
+        self.assertTrue(not db_con.valid)
+        self.assertEqual(pool._connections, 0)
+
+
+    def test28_MaxIdleTime(self):
+        dbapi.threadsafety = 2
+        pool = PooledDB(dbapi, 1, maxidletime=60)
+        cons = [pool.connection(False) for i in range(4)]
+        steady_cons = [db._con for db in cons]
+        for db in cons:
+            db.close()
+        self.assertEqual(len(pool._idle_cache), 4)
+        for con in steady_cons[:3]:
+            con._last_used -= 120
+        db = pool.connection(False)  # replaces the expired connection
+        con = db._con
+        self.assertTrue(con not in steady_cons)
+        self.assertTrue(steady_cons[0]._closed)
+        db.close()  # evicts the two connections unused for the longest time
+        self.assertEqual(list(pool._idle_cache), [steady_cons[3], con])
+        self.assertTrue(steady_cons[1]._closed)
+        self.assertTrue(steady_cons[2]._closed)
+        for con in pool._idle_cache:
+            con._last_used -= 120
+        pool.maintain()
+        self.assertEqual(len(pool._idle_cache), 1)  # keep mincached
+        con = pool._idle_cache[0]
+        db_con = con._con
+        db = pool.connection(False)  # replaces the expired connection
+        self.assertTrue(db._con is not con)
+        self.assertTrue(not db_con.valid)
+        db.close()
+
+    def test29_MaxLifetime(self):
+        dbapi.threadsafety = 2
+        pool = PooledDB(dbapi, 3, maxlifetime=60)
+        steady_cons = list(pool._idle_cache)
+        steady_cons[1]._created -= 120
+        pool.maintain()  # replaces the expired connection
+        self.assertEqual(len(pool._idle_cache), 3)
+        self.assertTrue(steady_cons[1] not in pool._idle_cache)
+        self.assertTrue(steady_cons[1]._closed)
+        pool._idle_cache[0]._created -= 120
+        con = pool._idle_cache[0]
+        db = pool.connection(False)
+        self.assertTrue(db._con is not con)
+        self.assertTrue(con._closed)
+        self.assertEqual(pool._connections, 1)
+        db.close()
+
+
+    def test30_Timeout(self):
+        from time import time
+        for threadsafety in (1, 2):
+            dbapi.threadsafety = threadsafety
+            for blocking in (False, True):
+                pool = PooledDB(dbapi, 0, 0, 1, 1, blocking)
+                db = pool.connection()
+                if threadsafety > 1:
+                    db.begin()
+                start = time()
+                self.assertRaises(TooManyConnections, pool.connection, 1, 0.05)
+                self.assertTrue(time() - start >= 0.05)
+                start = time()
+                self.assertRaises(
+                    TooManyConnections, pool.dedicated_connection, 0.05)
+                self.assertTrue(time() - start >= 0.05)
+                self.assertRaises(TooManyConnections, pool.connection, 1, 0)
+                self.assertEqual(len(pool._waiters), 0)
+                self.assertEqual(pool._connections, 1)
+                db.close()
+                db = pool.connection(timeout=0.05)
+                self.assertEqual(pool._connections, 1)
+                db.close()
+
+    def test31_FairWaiting(self):
+        dbapi.threadsafety = 2
+        from threading import Thread
+        from time import sleep
+        pool = PooledDB(dbapi, 0, 0, 0, 1, True)
+        db = pool.connection()
+        order = []
+
+        def connection(i):
+            db = pool.connection()
+            order.append(i)
+            sleep(0.01)
+            db.close()
+
+        threads = []
+        for i in range(5):
+            thread = Thread(target=connection, args=(i,))
+            thread.start()
+            threads.append(thread)
+            while len(pool._waiters) <= i:
+                sleep(0.001)
+        db.close()
+        # the free slot has been handed over to the first waiting thread
+        self.assertRaises(TooManyConnections, pool.connection, 0, 0)
+        for thread in threads:
+            thread.join(5)
+            self.assertTrue(not thread.is_alive())
+        self.assertEqual(order, list(range(5)))
+        self.assertEqual(pool._connections, 0)
+
+
+    def test32_Magazine(self):
+        dbapi.threadsafety = 2
+        pool = PooledDB(dbapi, 2, magazine=1)
+        self.assertEqual(len(pool._idle_cache), 2)
+        db = pool.connection()
+        con = db._con
+        db.close()
+        self.assertEqual(len(pool._idle_cache), 1)
+        self.assertEqual(pool._connections, 1)
+        self.assertEqual(list(pool._thread.magazine), [con])
+        lock = pool._lock
+
+        class Lock:
+
+            def acquire(self):
+                raise AssertionError('Lock acquired')
+
+        pool._lock = Lock()
+        for i in range(3):
+            db = pool.connection()
+            self.assertTrue(db._con is con)
+            db.close()
+        pool._lock = lock
+        db1 = pool.connection()
+        db2 = pool.connection()
+        self.assertTrue(db1._con is con)
+        self.assertEqual(pool._connections, 2)
+        self.assertEqual(len(pool._idle_cache), 0)
+        con2 = db2._con
+        db2.close()
+        db1.close()  # the magazine is full, so return to the pool
+        self.assertEqual(list(pool._thread.magazine), [con2])
+        self.assertEqual(len(pool._idle_cache), 1)
+        self.assertTrue(pool._idle_cache[0] is con)
+        self.assertEqual(pool._connections, 1)
+        pool.close()
+        self.assertEqual(list(pool._thread.magazine), [])
+        self.assertEqual(pool._connections, 0)
+
+    def test33_MagazineThreadExit(self):
+        dbapi.threadsafety = 2
+        from threading import Thread
+        pool = PooledDB(dbapi, 0, magazine=2)
+
+        def connection():
+            db1 = pool.connection()
+            db2 = pool.connection()
+            db1.close()
+            db2.close()
+
+        thread = Thread(target=connection)
+        thread.start()
+        thread.join(5)
+        import gc
+        gc.collect()
+        self.assertEqual(len(pool._idle_cache), 2)
+        self.assertEqual(pool._connections, 0)
+
+    def test34_MagazineDrain(self):
+        dbapi.threadsafety = 2
+        from threading import Thread
+        pool = PooledDB(dbapi, 0, 0, 0, 1, True, magazine=1)
+        db = pool.connection()
+        con = db._con
+        db.close()
+        self.assertEqual(pool._connections, 1)
+        result = []
+        thread = Thread(target=lambda: result.append(pool.connection()))
+        thread.start()
+        thread.join(5)  # the connection is taken from the magazine
+        self.assertTrue(not thread.is_alive())
+        db = result.pop()
+        self.assertTrue(db._con is con)
+        self.assertEqual(list(pool._thread.magazine), [])
+        self.assertEqual(pool._connections, 1)
+        thread = Thread(target=lambda: result.append(pool.connection()))
+        thread.start()
+        while not pool._waiters:
+            thread.join(0.001)
+        self.assertTrue(pool._drain)
+        db.close()  # the connection is given back, not kept
+        thread.join(5)
+        self.assertTrue(not thread.is_alive())
+        self.assertTrue(result[0]._con is con)
+        self.assertTrue(not pool._drain)
+        self.assertEqual(list(pool._thread.magazine), [])
+
+    def test35_Metrics(self):
+        from DBUtils.PooledDB import TooManyConnections
+        from DBUtils.PoolMetrics import PoolMetrics
+        dbapi.threadsafety = 2
+        pool = PooledDB(dbapi, 1, 0, 0, 2, maxusage=2, metrics=True)
+        self.assertTrue(isinstance(pool.metrics, PoolMetrics))
+        stats = pool.metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 0)
+        db1 = pool.connection()
+        db2 = pool.connection()
+        self.assertRaises(TooManyConnections, pool.connection)
+        stats = pool.metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['rejects'], 1)
+        self.assertEqual(stats['wait']['count'], 2)
+        self.assertEqual(stats['hold']['count'], 0)
+        cursor = db1.cursor()
+        for i in range(5):
+            cursor.execute('select test')
+        cursor.close()
+        db1._con._con.valid = False
+        cursor = db1.cursor()
+        cursor.execute('select test')
+        cursor.close()
+        db1.close()
+        db2.close()
+        stats = pool.metrics.snapshot()
+        self.assertEqual(stats['recycles'], 2)
+        self.assertEqual(stats['failovers'], 1)
+        self.assertEqual(stats['hold']['count'], 2)
+        self.assertTrue(stats['hold']['max'] >= stats['hold']['total'] / 2)
+        metrics = PoolMetrics()
+        pool = PooledDB(dbapi, 0, 0, 1, metrics=metrics)
+        self.assertTrue(pool.metrics is metrics)
+        db1 = pool.connection()
+        db2 = pool.connection()
+        db1.close()
+        db2.close()
+        stats = metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hold']['count'], 2)
+        pool = PooledDB(dbapi, 1, metrics=False)
+        self.assertTrue(pool.metrics is None)
+        db = pool.connection()
+        self.assertTrue(db._since is None)
+        self.assertTrue(db._con._metrics is None)
+        db.close()
+        pool = PooledDB(dbapi, 1)
+        self.assertTrue(pool.metrics is None)
+
+    def test36_ContextManager(self):
+        for threadsafety in (1, 2):
+            dbapi.threadsafety = threadsafety
+            shareable = threadsafety > 1
+            pool = PooledDB(dbapi, 0, 1, 1)
+            with pool.connection() as db:
+                con = db._con
+                cursor = db.cursor()
+                cursor.execute('select test')
+                self.assertEqual(cursor.fetchone(), 'test')
+                cursor.close()
+                self.assertEqual(pool._connections, 1)
+            self.assertRaises(InvalidConnection, getattr, db, 'cursor')
+            self.assertEqual(pool._connections, 0)
+            if shareable:
+                self.assertEqual(len(pool._shared_cache), 0)
+            self.assertEqual(list(pool._idle_cache), [con])
+
+    def test37_LeakedConnection(self):
+        import gc
+        for threadsafety in (1, 2):
+            dbapi.threadsafety = threadsafety
+            shareable = threadsafety > 1
+            pool = PooledDB(dbapi, 0, 1, 1)
+            db = pool.connection()
+            con = db._con
+            del db
+            self.assertEqual(pool._connections, 0)
+            self.assertEqual(list(pool._idle_cache), [con])
+            db = pool.connection()
+            self.assertTrue(db._con is con)
+            cycle = [db]
+            cycle.append(cycle)
+            del db, cycle
+            gc.collect()
+            self.assertEqual(pool._connections, 0)
+            if shareable:
+                self.assertEqual(len(pool._shared_cache), 0)
+            self.assertEqual(list(pool._idle_cache), [con])
+            db = pool.connection()
+            db.close()
+            del db
+            self.assertEqual(list(pool._idle_cache), [con])
+
+    def test38_LazyConnection(self):
+        from DBUtils.PooledDB import PooledLazyDBConnection
+        for threadsafety in (1, 2):
+            dbapi.threadsafety = threadsafety
+            pool = PooledDB(dbapi, 1, 1, 1, 1)
+            con = pool._idle_cache[0]
+            db = pool.connection(lazy=True)
+            self.assertTrue(isinstance(db, PooledLazyDBConnection))
+            db.commit()
+            db.rollback()
+            self.assertEqual(pool._connections, 0)
+            self.assertTrue(db._con is None)
+            db.close()
+            self.assertRaises(InvalidConnection, getattr, db, 'cursor')
+            self.assertRaises(InvalidConnection, db.commit)
+            with pool.connection(lazy=True) as db:
+                self.assertEqual(pool._connections, 0)
+                cursor = db.cursor()
+                self.assertEqual(pool._connections, 1)
+                self.assertTrue(db._con._con is con)
+                cursor.execute('select test')
+                self.assertEqual(cursor.fetchone(), 'test')
+                cursor.close()
+                db.commit()
+            self.assertEqual(pool._connections, 0)
+            self.assertEqual(list(pool._idle_cache), [con])
+            db = pool.dedicated_connection(lazy=True)
+            db.begin()
+            self.assertTrue(db._con._con is con)
+            self.assertTrue(con._transaction)
+            db.rollback()
+            db.close()
+            self.assertEqual(list(pool._idle_cache), [con])
+
+    def test39_Reentrant(self):
+        from DBUtils.PooledDB import TooManyConnections
+        from threading import Thread
+        dbapi.threadsafety = 1
+        pool = PooledDB(dbapi, 0, 1, 0, 1, reentrant=True, metrics=True)
+        db1 = pool.connection()
+        con = db1._con
+        db2 = pool.connection()
+        self.assertTrue(db2._con is con)
+        with pool.connection() as db3:
+            self.assertTrue(db3._con is con)
+        self.assertEqual(pool._connections, 1)
+        stats = pool.metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 1)
+        result = []
+
+        def connection():
+            try:
+                result.append(pool.connection(timeout=0))
+            except TooManyConnections:
+                result.append(None)
+
+        thread = Thread(target=connection)
+        thread.start()
+        thread.join(5)
+        self.assertEqual(result, [None])
+        db1.close()
+        self.assertEqual(len(pool._idle_cache), 0)
+        self.assertEqual(pool._connections, 1)
+        db2.close()
+        db2.close()
+        self.assertEqual(list(pool._idle_cache), [con])
+        self.assertEqual(pool._connections, 0)
+        db1 = pool.connection()
+        self.assertTrue(db1._con is con)
+        db2 = pool.connection()
+        del db2
+        self.assertEqual(pool._connections, 1)
+        db1.close()
+        self.assertEqual(list(pool._idle_cache), [con])
+        self.assertEqual(pool._connections, 0)
+        pool = PooledDB(dbapi, 0, 2, 0, 2)
+        db1 = pool.connection()
+        db2 = pool.connection()
+        self.assertTrue(db2._con is not db1._con)
+
+    def test40_PingInterval(self):
+        Connection = dbapi.Connection
+        Connection.has_ping = True
+        Connection.num_pings = 0
+        dbapi.threadsafety = 1
+        pool = PooledDB(dbapi, 1, ping_interval=(1, 8))
+        for i in range(3):
+            pool.connection().close()
+        self.assertEqual(Connection.num_pings, 0)
+        con = pool._idle_cache[0]
+        self.assertEqual(con._ping_limits, (1, 8))
+        con._last_used -= 1
+        pool.connection().close()
+        self.assertEqual(Connection.num_pings, 1)
+        self.assertEqual(con._ping_interval, 2)
+        Connection.has_ping = False
+        Connection.num_pings = 0
+
+    def test41_SkipCleanRollback(self):
+        pool = PooledDB(dbapi, 1, 1, 0)
+        con = pool._idle_cache[0]
+        session = con._con.session
+        pool.connection().close()
+        self.assertEqual(session, [])
+        db = pool.connection()
+        db.cursor().execute('select test')
+        db.close()
+        self.assertEqual(session, ['rollback'])
+        db = pool.connection()
+        db.cursor().execute('select test')
+        db.commit()
+        db.close()
+        self.assertEqual(session, ['rollback', 'commit'])
+        con._con.in_transaction = False
+        db = pool.connection()
+        db.cursor().execute('select test')
+        db.close()
+        self.assertEqual(session, ['rollback', 'commit'])
+        con._con.in_transaction = True
+        db = pool.connection()
+        db.close()
+        self.assertEqual(session, ['rollback', 'commit', 'rollback'])
+
+    def test42_Probe(self):
+        dbapi.threadsafety = 1
+        pool = PooledDB(dbapi, 1, probe='select 1')
+        con = pool._idle_cache[0]
+        self.assertEqual(con._probe, 'select 1')
+        pool.connection().close()
+        self.assertEqual(con._con.num_queries, 1)
+        con._con.valid = False
+        db = pool.connection()
+        self.assertTrue(db._con is con)
+        self.assertTrue(con._con.valid)
+        self.assertEqual(con._con.num_queries, 0)
+
+    def test43_CircuitBreaker(self):
+        dbapi.threadsafety = 1
+        breaker = SteadyDBBreaker(2, jitter=0)
+        pool = PooledDB(dbapi, breaker=breaker, database='error')
+        self.assertRaises(dbapi.OperationalError, pool.connection)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertRaises(dbapi.OperationalError, pool.connection)
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(pool._connections, 0)
+        self.assertRaises(BreakerOpen, pool.connection)
+        pool = PooledDB(dbapi, 2, breaker=2)
+        cons = pool._idle_cache
+        self.assertTrue(cons[0]._breaker is cons[1]._breaker)
+        self.assertTrue(cons[0]._breaker is SteadyDBBreaker.shared(dbapi, 5))
+        self.assertEqual(cons[0]._breaker.threshold, 2)
+        self.assertEqual(cons[0]._breaker.state, 'closed')
+        breaker = cons[0]._breaker
+        pool = PooledDB(dbapi, breaker=3, database='error')
+        for i in range(3):
+            self.assertRaises(dbapi.OperationalError, pool.connection)
+        self.assertRaises(BreakerOpen, pool.connection)
+        pool = PooledDB(dbapi, breaker=3, database='up')  # other host
+        db = pool.connection()
+        self.assertEqual(db._con._breaker.state, 'closed')
+        self.assertTrue(db._con._breaker is not breaker)
+
+    def test44_Limiter(self):
+        dbapi.threadsafety = 1
+        limiter = SteadyDBLimiter(1, 2, timeout=0)
+        pool = PooledDB(dbapi, 2, limiter=limiter)
+        self.assertEqual(len(pool._idle_cache), 2)
+        self.assertTrue(pool._idle_cache[0]._limiter is limiter)
+        db1 = pool.connection(False)
+        db2 = pool.connection(False)
+        self.assertRaises(TooManyConnects, pool.connection, False)
+        self.assertEqual(pool._connections, 2)
+        self.assertEqual(limiter.connecting, 0)
+        db1.close()
+        db2.close()
+        self.assertEqual(len(pool._idle_cache), 2)
+
+    def test45_HotSpares(self):
+        dbapi.threadsafety = 1
+        pool = PooledDB(dbapi, 1, spares=2)
+        spares = pool._spares
+        self.assertTrue(spares.is_alive())
+        cache = spares._cache
+        for i in range(100):
+            if len(cache) == 2:
+                break
+            sleep(0.01)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(pool._connections, 0)
+        db = pool.connection()
+        self.assertTrue(db._con._spares is spares)
+        con = db._con._con
+        spare = cache[0]._con
+        con.valid = False
+        cursor = db.cursor()
+        cursor.execute('select test')
+        self.assertEqual(cursor.fetchone(), 'test')
+        self.assertTrue(db._con._con is spare)
+        for i in range(100):
+            if len(cache) == 2:
+                break
+            sleep(0.01)
+        self.assertEqual(len(cache), 2)
+        dbapi.Connection.has_ping = True
+        try:
+            cache[0]._con.valid = False
+            spare = cache[1]._con
+            db._con._con.valid = False
+            db.cursor().execute('select test')
+            self.assertTrue(db._con._con is spare)
+        finally:
+            dbapi.Connection.has_ping = False
+        db.close()
+        pool.close()
+        spares.join(1)
+        self.assertFalse(spares.is_alive())
+        self.assertEqual(len(cache), 0)
+        self.assertFalse(spare.valid)
+        pool = PooledDB(dbapi, 1, maxusage=2, spares=1)
+        spares = pool._spares
+        cache = spares._cache
+        for i in range(100):
+            if cache:
+                break
+            sleep(0.01)
+        self.assertEqual(len(cache), 1)
+        spare = cache[0]._con
+        db = pool.connection()
+        con = db._con._con
+        cursor = db.cursor()
+        for i in range(3):  # the third query recycles the connection
+            cursor.execute('select test')
+        self.assertTrue(db._con._con is not con)
+        self.assertTrue(db._con._con is not spare)
+        self.assertTrue(cache[0]._con is spare)  # the spare is kept
+        db.close()
+        pool.close()
+
+    def test46_MagazineIdleOwner(self):
+        dbapi.threadsafety = 2
+        from threading import Event, Thread
+        for blocking in (False, True):
+            pool = PooledDB(dbapi, 0, 0, 0, 1, blocking, magazine=1)
+            cons, idle, done = [], Event(), Event()
+
+            def owner():
+                db = pool.connection(False)
+                cons.append(db._con)
+                db.close()  # the connection is kept in the magazine
+                idle.set()
+                done.wait(5)  # the thread stays alive, but idle
+
+            thread = Thread(target=owner)
+            thread.start()
+            self.assertTrue(idle.wait(5))
+            self.assertEqual(pool._connections, 1)
+            self.assertEqual(len(pool._idle_cache), 0)
+            db = pool.connection(False, timeout=None if blocking else 2)
+            self.assertTrue(db._con is cons[0])
+            self.assertEqual(pool._connections, 1)
+            self.assertRaises(TooManyConnections, pool.connection, timeout=0)
+            db.close()
+            done.set()
+            thread.join(5)
+            self.assertTrue(not thread.is_alive())
+
+    def test47_MagazineWaiterDuringReset(self):
+        dbapi.threadsafety = 2
+        from threading import Thread
+        pool = PooledDB(dbapi, 0, 0, 0, 1, True, magazine=1)
+        db = pool.connection(False)
+        db.cursor().execute('select test')  # the rollback cannot be skipped
+        con = db._con
+        result = []
+
+        def waiter():
+            result.append(pool.connection(False, timeout=2))
+
+        thread = Thread(target=waiter)
+        rollback = con._con.rollback
+
+        def slow_rollback():  # another thread starts waiting meanwhile
+            thread.start()
+            while not pool._waiters:
+                thread.join(0.001)
+            rollback()
+
+        con._con.rollback = slow_rollback
+        db.close()  # the connection must not be kept in the magazine
+        thread.join(5)
+        self.assertTrue(not thread.is_alive())
+        self.assertEqual(len(result), 1)
+        self.assertTrue(result[0]._con is con)
+        self.assertEqual(list(pool._thread.magazine), [])
+        self.assertEqual(pool._connections, 1)
+        result[0].close()
+
 
 class TestSharedDBConnection(unittest.TestCase):
 
@@ -1234,5 +1993,55 @@ class TestSharedDBConnection(unittest.TestCase):
         self.assertTrue(con1 > con2)
 
 
+class TestSharedDBCache(unittest.TestCase):
+
+    def test01_PushAndTop(self):
+        cache = SharedDBCache()
+        self.assertEqual(len(cache), 0)
+        cons = []
+        for shared in (3, 1, 4, 1, 5, 9, 2, 6):
+            con = SharedDBConnection(dbapi.connect())
+            con.con._transaction = False
+            con.shared = shared
+            cache.push(con)
+            cons.append(con)
+        self.assertEqual(len(cache), 8)
+        self.assertTrue(cache.top() is cons[1])
+        for index, con in enumerate(cache):
+            self.assertTrue(cache[con.index] is con)
+            self.assertEqual(con.index, index)
+
+    def test02_UpdateAndRemove(self):
+        cache = SharedDBCache()
+        cons = []
+        for i in range(10):
+            con = SharedDBConnection(dbapi.connect())
+            con.con._transaction = False
+            cache.push(con)
+            cons.append(con)
+        self.assertTrue(cache.top() is cons[0])
+        cons[0].share()
+        cache.update(cons[0], True)
+        self.assertTrue(cache.top() is cons[1])
+        cons[1].con._transaction = True
+        cache.update(cons[1])
+        self.assertTrue(cache.top() is cons[2])
+        cache.remove(cons[2])
+        self.assertEqual(cons[2].index, None)
+        self.assertRaises(ValueError, cache.remove, cons[2])
+        self.assertRaises(ValueError, cache.update, cons[2])
+        self.assertTrue(cache.top() is cons[3])
+        for con in cons[3:]:
+            con.con._transaction = True
+        cache.refresh()
+        self.assertTrue(cache.top() is cons[0])
+        order = []
+        while len(cache):
+            con = cache.top()
+            order.append(con)
+            cache.remove(con)
+        self.assertEqual(order, [cons[0]] + [cons[1]] + cons[3:])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -192,13 +192,13 @@ class TestPooledPg(unittest.TestCase):
         thread = Thread(target=connection)
         thread.start()
         thread.join(0.1)
-        self.assertTrue(thread.isAlive())
+        self.assertTrue(thread.is_alive())
         self.assertEqual(pool._cache.qsize(), 0)
         session = db._con.session
         self.assertEqual(session, [])
         del db
         thread.join(0.1)
-        self.assertTrue(not thread.isAlive())
+        self.assertTrue(not thread.is_alive())
         self.assertEqual(pool._cache.qsize(), 1)
         db = pool.connection()
         self.assertEqual(pool._cache.qsize(), 0)
@@ -286,14 +286,13 @@ class TestPooledPg(unittest.TestCase):
         db.begin()
         con = db._con
         self.assertTrue(con._transaction)
-        self.assertEqual(con.session, ['rollback', 'begin'])
+        self.assertEqual(con.session, ['begin'])
         db.query('select test')
         self.assertEqual(con.num_queries, 1)
         db.close()
         self.assertTrue(pool.connection()._con is con)
         self.assertTrue(not con._transaction)
-        self.assertEqual(
-            con.session, ['rollback', 'begin', 'rollback', 'rollback'])
+        self.assertEqual(con.session, ['begin', 'rollback'])
         self.assertEqual(con.num_queries, 1)
         pool = PooledPg(1, reset=2)
         db = pool.connection()
@@ -310,5 +309,181 @@ class TestPooledPg(unittest.TestCase):
         self.assertEqual(con.num_queries, 0)
 
 
+    def test8_Timeout(self):
+        from DBUtils.PooledPg import TooManyConnections
+        from time import time
+        for blocking in (False, True):
+            pool = PooledPg(0, 1, 1, blocking)
+            db = pool.connection()
+            start = time()
+            self.assertRaises(TooManyConnections, pool.connection, 0.05)
+            self.assertTrue(time() - start >= 0.05)
+            self.assertRaises(TooManyConnections, pool.connection, 0)
+            db.close()
+            db = pool.connection(0.05)
+            self.assertTrue(db._con is not None)
+            db.close()
+
+    def test9_FairWaiting(self):
+        pool = PooledPg(0, 1, 1, True)
+        db = pool.connection()
+        from threading import Thread
+        from time import sleep
+        order = []
+
+        def connection(i):
+            db = pool.connection()
+            order.append(i)
+            sleep(0.01)
+            db.close()
+
+        threads = []
+        for i in range(5):
+            thread = Thread(target=connection, args=(i,))
+            thread.start()
+            threads.append(thread)
+            while len(pool._connections._waiters) <= i:
+                sleep(0.001)
+        db.close()
+        for thread in threads:
+            thread.join(5)
+            self.assertTrue(not thread.is_alive())
+        self.assertEqual(order, list(range(5)))
+
+    def test10_Metrics(self):
+        from DBUtils.PooledPg import TooManyConnections
+        pool = PooledPg(1, 0, 2, maxusage=2, metrics=True)
+        stats = pool.metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 0)
+        db1 = pool.connection()
+        db2 = pool.connection()
+        self.assertRaises(TooManyConnections, pool.connection)
+        for i in range(3):
+            db1.query('select test')
+        db1.db.status = False
+        db1.query('select test')
+        db1.close()
+        db2.close()
+        stats = pool.metrics.snapshot()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['rejects'], 1)
+        self.assertEqual(stats['recycles'], 1)
+        self.assertEqual(stats['failovers'], 1)
+        self.assertEqual(stats['wait']['count'], 2)
+        self.assertEqual(stats['hold']['count'], 2)
+        pool = PooledPg(1, metrics=False)
+        self.assertTrue(pool.metrics is None)
+        db = pool.connection()
+        self.assertTrue(db._con._metrics is None)
+        db.close()
+        pool = PooledPg(1)
+        self.assertTrue(pool.metrics is None)
+
+    def test11_ContextManager(self):
+        pool = PooledPg(0, 1, 1)
+        with pool.connection() as db:
+            con = db._con
+            db.query('select test')
+            self.assertEqual(pool._cache.qsize(), 0)
+        self.assertRaises(InvalidConnection, getattr, db, 'query')
+        self.assertEqual(pool._cache.qsize(), 1)
+        self.assertTrue(pool._cache.get(0) is con)
+
+    def test12_LeakedConnection(self):
+        import gc
+        pool = PooledPg(0, 1, 1)
+        db = pool.connection()
+        con = db._con
+        cycle = [db]
+        cycle.append(cycle)
+        del db, cycle
+        gc.collect()
+        self.assertEqual(pool._cache.qsize(), 1)
+        self.assertTrue(pool._cache.get(0) is con)
+
+    def test13_LazyConnection(self):
+        from DBUtils.PooledPg import PooledLazyPgConnection
+        pool = PooledPg(1, 1, 1)
+        con = pool._cache.queue[0]
+        db = pool.connection(lazy=True)
+        self.assertTrue(isinstance(db, PooledLazyPgConnection))
+        db.commit()
+        db.rollback()
+        self.assertTrue(db._con is None)
+        self.assertEqual(pool._cache.qsize(), 1)
+        db.close()
+        self.assertRaises(InvalidConnection, getattr, db, 'query')
+        db.reopen()
+        self.assertEqual(pool._cache.qsize(), 1)
+        self.assertEqual(db.query('select test'), 'test')
+        self.assertEqual(pool._cache.qsize(), 0)
+        self.assertTrue(db._con._con is con)
+        db.close()
+        self.assertEqual(pool._cache.qsize(), 1)
+        with pool.connection(lazy=True) as db:
+            self.assertEqual(pool._cache.qsize(), 1)
+            db.begin()
+            self.assertEqual(pool._cache.qsize(), 0)
+            db.commit()
+        self.assertEqual(pool._cache.qsize(), 1)
+
+    def test14_SkipCleanRollback(self):
+        pool = PooledPg(1, 1, reset=1)
+        con = pool._cache.queue[0]
+        session = con._con.session
+        pool.connection().close()
+        self.assertEqual(session, [])
+        db = pool.connection()
+        db.query('select test')
+        db.close()
+        self.assertEqual(session, ['rollback'])
+        db = pool.connection()
+        db.query('select test')
+        db.commit()
+        db.close()
+        self.assertEqual(session, ['rollback', 'commit'])
+        db = pool.connection()
+        db.get_tables()
+        db.close()
+        self.assertEqual(session, ['rollback', 'commit', 'rollback'])
+
+
+class TestPooledPgSemaphore(unittest.TestCase):
+
+    def test0_AcquireAndRelease(self):
+        from DBUtils.PooledPg import PooledPgSemaphore
+        semaphore = PooledPgSemaphore(2)
+        self.assertTrue(semaphore.acquire())
+        self.assertTrue(semaphore.acquire(False))
+        self.assertTrue(not semaphore.acquire(False))
+        self.assertTrue(not semaphore.acquire(True, 0))
+        self.assertTrue(not semaphore.acquire(True, 0.01))
+        self.assertEqual(len(semaphore._waiters), 0)
+        semaphore.release()
+        self.assertTrue(semaphore.acquire(True, 0.01))
+        semaphore.release()
+        semaphore.release()
+        self.assertEqual(semaphore._value, 2)
+
+    def test1_HandOver(self):
+        from DBUtils.PooledPg import PooledPgSemaphore
+        from threading import Thread
+        semaphore = PooledPgSemaphore(1)
+        self.assertTrue(semaphore.acquire())
+        result = []
+        thread = Thread(target=lambda: result.append(semaphore.acquire()))
+        thread.start()
+        while not semaphore._waiters:
+            thread.join(0.001)
+        semaphore.release()
+        # the slot belongs to the waiting thread now
+        self.assertTrue(not semaphore.acquire(False))
+        thread.join(5)
+        self.assertEqual(result, [True])
+        self.assertEqual(semaphore._value, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
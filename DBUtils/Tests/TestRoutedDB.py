@@ -0,0 +1,317 @@
+"""Test the RoutedDB module.
+
+Note:
+We don't test performance here, so the test does not predicate
+whether RoutedDB actually will help in improving performance or not.
+We also assume that the underlying PooledDB module has been tested.
+
+"""
+
+import unittest
+
+from threading import Event, Thread
+from time import sleep
+
+import DBUtils.Tests.mock_db as dbapi
+
+from DBUtils.PooledDB import PooledDB, InvalidConnection, TooManyConnections
+from DBUtils.RoutedDB import RoutedDB, RoutedDBConnection
+
+__version__ = '1.3'
+
+
+class SlowConnection(dbapi.Connection):
+    """Connection to a replica with slow queries that can be cancelled."""
+
+    delays = {}  # the delays of the queries for every database
+    opened = 0  # the number of connections that have been opened
+
+    OperationalError = dbapi.OperationalError
+    InternalError = dbapi.InternalError
+
+    def __init__(self, database=None, user=None):
+        dbapi.Connection.__init__(self, database, user)
+        SlowConnection.opened += 1
+        self.delay = self.delays.get(database, 0)
+        self.cancelled = Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def cursor(self, name=None):
+        if not self.valid:
+            raise dbapi.InternalError
+        return SlowCursor(self, name)
+
+
+class SlowCursor(dbapi.Cursor):
+
+    def execute(self, operation):
+        if self.con.cancelled.wait(self.con.delay):
+            self.con.cancelled.clear()
+            raise dbapi.OperationalError  # the query has been cancelled
+        dbapi.Cursor.execute(self, operation)
+
+
+def slow_connect(database=None, user=None):
+    if database == 'error':
+        raise dbapi.OperationalError
+    return SlowConnection(database, user)
+
+
+class TestRoutedDB(unittest.TestCase):
+
+    def setUp(self):
+        self.primary = PooledDB(dbapi, database='primary')
+        self.replicas = [
+            PooledDB(dbapi, database='replica%d' % i) for i in (1, 2)]
+
+    def test0_CheckVersion(self):
+        from DBUtils import __version__ as DBUtilsVersion
+        self.assertEqual(DBUtilsVersion, __version__)
+        from DBUtils.RoutedDB import __version__ as RoutedDBVersion
+        self.assertEqual(RoutedDBVersion, __version__)
+        self.assertEqual(RoutedDB.version, __version__)
+
+    def test1_ReadFromReplicas(self):
+        router = RoutedDB(self.primary, self.replicas)
+        databases = []
+        for i in range(4):
+            db = router.connection()
+            self.assertTrue(isinstance(db, RoutedDBConnection))
+            self.assertTrue(db._con is None)
+            cursor = db.cursor()
+            cursor.execute('select test')
+            self.assertEqual(cursor.fetchone(), 'test')
+            databases.append(db._con._con._con.database)
+            cursor.close()
+            db.close()
+        self.assertEqual(
+            databases, ['replica1', 'replica2', 'replica1', 'replica2'])
+        self.assertEqual(self.primary._connections, 0)
+        self.assertRaises(InvalidConnection, getattr, db, 'cursor')
+        router = RoutedDB(self.primary)
+        with router.connection() as db:
+            db.cursor()
+            self.assertEqual(db._con._con._con.database, 'primary')
+
+    def test2_WriteToPrimary(self):
+        router = RoutedDB(self.primary, self.replicas)
+        db = router.connection(write=True)
+        self.assertEqual(self.primary._connections, 1)
+        self.assertEqual(db._con._con._con.database, 'primary')
+        db.close()
+        self.assertEqual(self.primary._connections, 0)
+        db = router.connection()
+        db.begin()
+        self.assertEqual(db._con._con._con.database, 'primary')
+        self.assertTrue(db._con._con._transaction)
+        db.cursor().execute('select test')
+        db.commit()
+        db.close()
+        self.assertEqual(self.primary._connections, 0)
+        db = router.connection()
+        db.cursor().execute('select test')
+        replica = db._replica
+        self.assertEqual(replica._con._con.database, 'replica1')
+        db.begin()
+        self.assertEqual(db._con._con._con.database, 'primary')
+        self.assertEqual(self.replicas[0]._connections, 1)
+        self.assertEqual(self.primary._connections, 1)
+        db.close()
+        self.assertEqual(self.replicas[0]._connections, 0)
+        self.assertEqual(self.primary._connections, 0)
+        self.assertRaises(InvalidConnection, db.begin)
+        db = router.connection()
+        db.commit()  # nothing to commit, no connection is acquired
+        db.rollback()
+        self.assertTrue(db._con is None)
+        self.assertEqual(self.primary._connections, 0)
+        self.assertEqual(self.replicas[0]._connections, 0)
+        db.close()
+        self.assertRaises(InvalidConnection, db.commit)
+        self.assertRaises(InvalidConnection, db.rollback)
+
+    def test3_StickyPrimary(self):
+        router = RoutedDB(self.primary, self.replicas, sticky=10)
+        db = router.connection()
+        db.cursor()
+        self.assertEqual(db._con._con._con.database, 'replica1')
+        db.close()
+        router.connection(write=True).close()
+        db = router.connection()
+        db.cursor()
+        self.assertEqual(db._con._con._con.database, 'primary')
+        db.close()
+        databases = []
+
+        def read():
+            db = router.connection()
+            db.cursor()
+            databases.append(db._con._con._con.database)
+            db.close()
+
+        thread = Thread(target=read)
+        thread.start()
+        thread.join()
+        self.assertEqual(databases, ['replica2'])
+        router._thread.written -= 10
+        db = router.connection()
+        db.cursor()
+        self.assertEqual(db._con._con._con.database, 'replica1')
+        db.close()
+
+    def test4_FallbackToPrimary(self):
+        replicas = [PooledDB(dbapi, 0, 1, 0, 1, database='replica')]
+        router = RoutedDB(self.primary, replicas)
+        db1 = router.connection()
+        db1.cursor()
+        self.assertEqual(db1._con._con._con.database, 'replica')
+        db2 = router.connection()
+        db2.cursor()
+        self.assertEqual(db2._con._con._con.database, 'primary')
+        self.assertRaises(TooManyConnections, replicas[0].connection)
+        router.close()
+
+    def test5_ReplicationLag(self):
+        self.assertRaises(
+            ValueError, RoutedDB, self.primary, self.replicas,
+            lagquery='select 2')
+        self.assertRaises(
+            TypeError, RoutedDB, self.primary, [object()],
+            lagquery='select 2', maxlag=5)
+        router = RoutedDB(
+            self.primary, self.replicas,
+            lagquery='select 2', maxlag=5, lagcheck=60)
+        try:
+            self.assertTrue(router._monitor.is_alive())
+            self.assertEqual(router.lags, [2, 2])
+            self.assertEqual(router._weights, [1, 1])
+            for con in router._lagcons:
+                self.assertEqual(con._con.num_queries, 1)
+            self.assertEqual(self.replicas[0]._connections, 0)
+            router._update(0, 10)
+            self.assertEqual(router._weights, [0, 1])
+            for i in range(4):
+                db = router.connection()
+                db.cursor()
+                self.assertEqual(db._con._con._con.database, 'replica2')
+                db.close()
+            router._update(1, None)
+            db = router.connection()
+            db.cursor()
+            self.assertEqual(db._con._con._con.database, 'primary')
+            db.close()
+            for weight in (0.125, 0.25, 0.5, 1, 1):
+                router.check_lag()
+                self.assertEqual(router._weights, [weight, weight])
+            self.assertEqual(router._lagcons[0]._con.num_queries, 6)
+            router._lagquery = 'bad query'
+            router.check_lag()
+            self.assertEqual(router.lags, [None, None])
+            self.assertEqual(router._weights, [0, 0])
+            router._lagquery = 'select 0'
+            router.check_lag()
+            self.assertEqual(router.lags, [0, 0])
+            router._lagquery = 'set lag'  # no row
+            router.check_lag()
+            self.assertEqual(router.lags, [None, None])
+            self.assertEqual(router._weights, [0, 0])
+
+            class LagConnection:  # returns the given rows
+                def __init__(self, row):
+                    self.row = row
+
+                def cursor(self):
+                    return self
+
+                def execute(self, sql):
+                    pass
+
+                def fetchone(self):
+                    return self.row
+
+                def close(self):
+                    pass
+
+                def _reset(self, force=False):
+                    pass
+
+            lagcons = router._lagcons
+            try:
+                router._lagcons = [
+                    LagConnection(row) for row in ((None,), ('3',))]
+                self.assertEqual(router._measure(0), None)
+                self.assertEqual(router._measure(1), 3)
+                router._lagcons[1].row = ()
+                self.assertEqual(router._measure(1), None)
+            finally:
+                router._lagcons = lagcons
+        finally:
+            router.close()
+        self.assertFalse(router._monitor)
+
+    def test6_HedgedQueries(self):
+        SlowConnection.delays = dict(slow=5)
+        SlowConnection.opened = 0
+        replicas = [PooledDB(slow_connect, database=database)
+                    for database in ('slow', 'fast', 'error')]
+        router = RoutedDB(self.primary, replicas[:2])
+        rows = router.execute_hedged('select test', delay=0.01)
+        self.assertEqual(rows, ['test'])
+        for i in range(50):
+            if not replicas[0]._connections:
+                break
+            sleep(0.01)
+        self.assertEqual(replicas[0]._connections, 0)
+        con = replicas[0]._idle_cache[0]
+        self.assertFalse(con._con.cancelled.is_set())
+        self.assertEqual(con._con.num_queries, 0)
+        self.assertEqual(con._con.num_uses, 0)
+        self.assertFalse(con._transaction)
+        self.assertEqual(SlowConnection.opened, 2)  # no reconnect
+        self.assertEqual(replicas[1]._idle_cache[0]._con.num_queries, 1)
+        self.assertEqual(len(router._latencies), 1)
+        SlowConnection.delays = {}
+        replicas[0].close()
+        for i in range(8):
+            self.assertEqual(
+                router.execute_hedged('select test%d' % i), ['test%d' % i])
+        self.assertEqual(len(router._latencies), 9)
+        self.assertEqual(
+            replicas[0]._idle_cache[0]._con.num_queries
+            + replicas[1]._idle_cache[0]._con.num_queries, 9)
+        self.assertEqual(router._hedge_delay(95, 0.5), 0.5)
+        router._latencies.extend(range(1, 92))
+        self.assertEqual(len(router._latencies), 100)
+        self.assertEqual(router._hedge_delay(95, 0.5), 87)
+        self.assertEqual(router._hedge_delay(100, 0.5), 91)
+        con = replicas[1]._idle_cache[0]._con
+        num_queries = con.num_queries
+        router = RoutedDB(self.primary, replicas[1:])
+        for i in range(2):
+            self.assertEqual(router.execute_hedged('select test'), ['test'])
+        self.assertEqual(con.num_queries, num_queries + 2)
+        self.assertRaises(
+            dbapi.ProgrammingError, router.execute_hedged, 'bad query')
+        router = RoutedDB(self.primary, replicas[1:2])
+        self.assertEqual(router.execute_hedged('select test'), ['test'])
+        self.assertEqual(con.num_queries, num_queries + 3)
+        router = RoutedDB(self.primary, replicas, sticky=10)
+        router._written()
+        self.assertEqual(router.execute_hedged('select test'), ['test'])
+        self.assertEqual(self.primary._idle_cache[0]._con.num_queries, 1)
+        SlowConnection.delays = dict(slow=0.2)
+        replicas[0] = PooledDB(slow_connect, database='slow')
+        router = RoutedDB(self.primary, [replicas[0], replicas[2]])
+        self.assertRaises(  # the error of the first query is raised
+            dbapi.ProgrammingError, router.execute_hedged,
+            'bad query', delay=0.01)
+        SlowConnection.delays = {}
+        router.close()
+        self.assertRaises(
+            RuntimeError, router.execute_hedged, 'select test')
+
+
+if __name__ == '__main__':
+    unittest.main()
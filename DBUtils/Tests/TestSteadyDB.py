@@ -10,12 +10,23 @@ Copyright and credit info:
 
 """
 
+import os
+import sys
 import unittest
 
+from socket import socketpair
+from threading import Event, Thread
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
 import DBUtils.Tests.mock_db as dbapi
 
 from DBUtils.SteadyDB import (
-    connect as SteadyDBconnect, SteadyDBConnection, SteadyDBCursor)
+    connect as SteadyDBconnect, SteadyDBConnection, SteadyDBCursor,
+    SteadyDBBreaker, BreakerOpen, SteadyDBLimiter, TooManyConnects,
+    _socket_alive)
 
 __version__ = '1.3'
 
@@ -654,5 +665,394 @@ class TestSteadyDB(unittest.TestCase):
         self.assertTrue(db._con.valid)
 
 
+    def test21_Timestamps(self):
+        db = SteadyDBconnect(dbapi, database='ok')
+        created, last_used = db._created, db._last_used
+        self.assertEqual(created, last_used)
+        db._created -= 10
+        db._last_used -= 10
+        cursor = db.cursor()
+        self.assertEqual(db._last_used, last_used - 10)
+        cursor.execute('select test')
+        self.assertTrue(db._last_used >= last_used)
+        self.assertEqual(db._created, created - 10)
+        db._last_used -= 10
+        db.commit()
+        self.assertTrue(db._last_used >= last_used)
+        db._con.valid = False
+        cursor.execute('select test')
+        self.assertTrue(db._created >= created)
+
+    def test22_ToughMethodsCached(self):
+        db = SteadyDBconnect(dbapi, database='ok')
+        cursor = db.cursor()
+        self.assertTrue('execute' in SteadyDBCursor.__dict__)
+        self.assertTrue('callproc' in SteadyDBCursor.__dict__)
+        self.assertTrue(
+            cursor.execute.__func__ is SteadyDBCursor.__dict__['execute'])
+        self.assertRaises(AttributeError, getattr, cursor, 'executeerror')
+        self.assertTrue('executeerror' not in SteadyDBCursor._tough_methods)
+        cursor.execute('select test')
+        self.assertEqual(cursor.fetchone(), 'test')
+        cursor._cursor.executescript = cursor._cursor.execute
+        cursor.executescript('select script')
+        self.assertEqual(cursor.fetchone(), 'script')
+        method = SteadyDBCursor._tough_methods['executescript']
+        self.assertTrue(cursor.executescript.__func__ is method)
+        self.assertTrue('executescript' not in SteadyDBCursor.__dict__)
+        cursor2 = db.cursor()  # a cursor without this method
+        self.assertFalse(hasattr(cursor2, 'executescript'))
+        cursor2.close()
+        cursor.close()
+        db.close()
+
+    @unittest.skipIf(sys.version_info[0] < 3,
+                     "Python 2 ignores the slots of classic classes")
+    def test23_Slots(self):
+        db = SteadyDBconnect(dbapi, database='ok')
+        cursor = db.cursor()
+        for obj in db, cursor:
+            self.assertRaises(AttributeError, setattr, obj, 'foo', 1)
+        cursor.close()
+        db.close()
+
+    def test24_PingInterval(self):
+        Connection = dbapi.Connection
+        Connection.has_ping = True
+        Connection.num_pings = 0
+        for interval in (-1, (2, 1), (0, 1)):
+            self.assertRaises(
+                ValueError, SteadyDBconnect, dbapi, ping_interval=interval)
+        db = SteadyDBconnect(dbapi, ping_interval=10)
+        self.assertTrue(db._ping_check())
+        self.assertEqual(Connection.num_pings, 0)
+        db._last_used -= 10
+        self.assertTrue(db._ping_check())
+        self.assertEqual(Connection.num_pings, 1)
+        self.assertEqual(db._ping_interval, 10)
+        self.assertTrue(db._ping_check())
+        self.assertEqual(Connection.num_pings, 1)
+        db._last_used -= 10
+        db.cursor().execute('select test')
+        self.assertTrue(db._ping_check())
+        self.assertEqual(Connection.num_pings, 1)
+        db = SteadyDBconnect(dbapi, ping_interval=(1, 5))
+        self.assertEqual(db._ping_interval, 1)
+        for interval in (2, 4, 5, 5):
+            db._last_used -= 5
+            self.assertTrue(db._ping_check())
+            self.assertEqual(db._ping_interval, interval)
+        self.assertEqual(Connection.num_pings, 5)
+        con = db._con
+        con.valid = False
+        db._last_used -= 5
+        self.assertTrue(db._ping_check())
+        self.assertTrue(db._con is not con)
+        self.assertEqual(db._ping_interval, 1)
+        self.assertEqual(Connection.num_pings, 6)
+        Connection.has_ping = False
+        Connection.num_pings = 0
+
+    def test25_SocketProbe(self):
+        Connection = dbapi.Connection
+        Connection.has_socket = True
+        Connection.num_pings = 0
+        try:
+            self.assertRaises(TypeError, SteadyDBconnect, dbapi, probe=1)
+            db = SteadyDBconnect(dbapi)
+            self.assertTrue(db._ping_check())
+            self.assertEqual(Connection.num_pings, 1)
+            self.assertEqual(
+                db._probes, (SteadyDBConnection._socket_probe,))
+            self.assertEqual(db._ping, 1)
+            self.assertTrue(db._ping_check())
+            self.assertEqual(Connection.num_pings, 1)
+            con = db._con
+            con.peer.send(b'notice')
+            self.assertTrue(db._ping_check())
+            self.assertTrue(db._con is con)
+            self.assertEqual(con.socket.recv(8), b'notice')
+            con.peer.close()
+            self.assertTrue(db._ping_check())
+            self.assertTrue(db._con is not con)
+            db.close()
+            Connection.has_ping = True
+            db = SteadyDBconnect(dbapi, probe='socket')
+            self.assertTrue(db._ping_check())
+            self.assertEqual(Connection.num_pings, 1)
+            db.begin()
+            db._con.peer.close()
+            self.assertEqual(db._ping_check(), False)
+            db.close()
+            Connection.has_socket = False
+            db = SteadyDBconnect(dbapi, probe='socket')
+            self.assertTrue(db._ping_check())
+            self.assertEqual(Connection.num_pings, 2)
+            self.assertEqual(db._probes, (SteadyDBConnection._ping_probe,))
+        finally:
+            Connection.has_ping = Connection.has_socket = False
+            Connection.num_pings = 0
+
+    def test26_QueryProbe(self):
+        Connection = dbapi.Connection
+        Connection.num_pings = 0
+        try:
+            db = SteadyDBconnect(dbapi, probe='select 1')
+            con = db._con
+            self.assertTrue(db._ping_check())
+            self.assertEqual(Connection.num_pings, 1)
+            self.assertEqual(con.num_queries, 1)
+            self.assertEqual(db._ping, 1)
+            self.assertTrue(db._dirty)
+            db.rollback()
+            self.assertTrue(db._ping_check())
+            self.assertEqual(Connection.num_pings, 1)
+            self.assertEqual(con.num_queries, 2)
+            con.valid = False
+            self.assertTrue(db._ping_check())
+            self.assertTrue(db._con is not con)
+            Connection.has_ping = True
+            db = SteadyDBconnect(dbapi, probe='select 1')
+            self.assertTrue(db._ping_check())
+            self.assertEqual(Connection.num_pings, 2)
+            self.assertEqual(db._con.num_queries, 0)
+            self.assertFalse(db._dirty)
+            Connection.has_ping = False
+            db = SteadyDBconnect(dbapi, probe='bad query')
+            con = db._con
+            self.assertTrue(db._ping_check())
+            self.assertTrue(db._con is not con)
+        finally:
+            Connection.has_ping = False
+            Connection.num_pings = 0
+
+    def test27_CircuitBreaker(self):
+        self.assertRaises(ValueError, SteadyDBBreaker, 0)
+        self.assertRaises(ValueError, SteadyDBBreaker, backoff=(2, 1))
+        self.assertRaises(ValueError, SteadyDBBreaker, jitter=2)
+        self.assertRaises(TypeError, SteadyDBconnect, dbapi, breaker='on')
+        down, calls = [], []
+
+        def creator():
+            calls.append(True)
+            if down:
+                raise dbapi.OperationalError
+            return dbapi.connect()
+
+        creator.dbapi = dbapi
+        breaker = SteadyDBBreaker(2, backoff=(10, 40), jitter=0)
+        db = SteadyDBconnect(creator, breaker=breaker)
+        self.assertTrue(db._breaker is breaker)
+        self.assertEqual(breaker.state, 'closed')
+        con = db._con
+        con.valid = False
+        down.append(True)
+        self.assertRaises(dbapi.InternalError, db.cursor)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(breaker.failures, 1)
+        self.assertRaises(dbapi.InternalError, db.cursor)
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(len(calls), 3)
+        self.assertRaises(dbapi.InternalError, db.cursor)
+        self.assertRaises(BreakerOpen, SteadyDBconnect, creator,
+                          breaker=breaker)
+        self.assertEqual(len(calls), 3)
+        breaker._until -= 10
+        self.assertRaises(dbapi.InternalError, db.cursor)
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(breaker._delay, 40)
+        breaker._until -= 20
+        down.pop()
+        db.cursor().execute('select test')
+        self.assertTrue(db._con is not con)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(breaker.failures, 0)
+        self.assertEqual(breaker._delay, 10)
+        breaker.state = 'open'
+        breaker.enter()
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertRaises(BreakerOpen, breaker.enter)
+        breaker = SteadyDBBreaker(1, 10)
+        breaker.failed()
+        self.assertEqual(breaker.state, 'open')
+        self.assertTrue(4.9 < breaker._until - monotonic() <= 10)
+        db = SteadyDBconnect(creator, breaker=3)
+        breaker = db._breaker
+        self.assertEqual(breaker.threshold, 3)
+        self.assertTrue(SteadyDBconnect(creator, breaker=5)._breaker
+                        is breaker)
+        self.assertTrue(SteadyDBBreaker.shared(creator, 5) is breaker)
+        db = SteadyDBconnect(dbapi, breaker=3, database='db1')
+        self.assertTrue(SteadyDBBreaker.shared(
+            dbapi, 5, (), dict(database='db1')) is db._breaker)
+        self.assertTrue(SteadyDBconnect(
+            dbapi, breaker=3, database='db1')._breaker is db._breaker)
+        for database in None, 'db2':
+            self.assertTrue(SteadyDBconnect(
+                dbapi, breaker=3, database=database)._breaker
+                is not db._breaker)
+        self.assertTrue(SteadyDBBreaker.shared(
+            dbapi, 5, (), dict(conv={})) is SteadyDBBreaker.shared(
+            dbapi, 5, (), dict(conv={})))
+
+        class Creator(object):  # cannot be weakly referenced
+
+            __slots__ = ()
+
+            def __call__(self):
+                return dbapi.connect()
+
+        creator = Creator()
+        breaker = SteadyDBBreaker.shared(creator, 1)
+        try:
+            self.assertTrue(SteadyDBBreaker.shared(creator, 2) is breaker)
+        finally:
+            del SteadyDBBreaker._shared_strong[creator]
+
+    def test28_Limiter(self):
+        self.assertRaises(ValueError, SteadyDBLimiter, -1)
+        self.assertRaises(ValueError, SteadyDBLimiter, burst=0)
+        self.assertRaises(ValueError, SteadyDBLimiter, timeout=-1)
+        self.assertRaises(TypeError, SteadyDBconnect, dbapi, limiter=1)
+        limiter = SteadyDBLimiter(100, 2, timeout=0)
+        db = SteadyDBconnect(dbapi, limiter=limiter)
+        self.assertTrue(db._limiter is limiter)
+        SteadyDBconnect(dbapi, limiter=limiter)
+        self.assertRaises(TooManyConnects, SteadyDBconnect,
+                          dbapi, limiter=limiter)
+        self.assertEqual(limiter.connecting, 0)
+        limiter.timeout = 1
+        start = monotonic()
+        SteadyDBconnect(dbapi, limiter=limiter)
+        self.assertTrue(monotonic() - start < 0.5)
+        limiter = SteadyDBLimiter(maxconnects=1, timeout=0)
+        entered, proceed = Event(), Event()
+
+        def creator(database=None):
+            entered.set()
+            proceed.wait(5)
+            return dbapi.connect(database)
+
+        creator.dbapi = dbapi
+        thread = Thread(target=SteadyDBconnect,
+                        args=(creator,), kwargs=dict(limiter=limiter))
+        thread.start()
+        self.assertTrue(entered.wait(5))
+        self.assertEqual(limiter.connecting, 1)
+        self.assertRaises(TooManyConnects, SteadyDBconnect,
+                          dbapi, limiter=limiter)
+        proceed.set()
+        thread.join(5)
+        self.assertEqual(limiter.connecting, 0)
+        self.assertRaises(dbapi.OperationalError, SteadyDBconnect,
+                          creator, limiter=limiter, database='error')
+        self.assertEqual(limiter.connecting, 0)
+        limiter.timeout = 1
+        db = SteadyDBconnect(creator, limiter=limiter)
+        con = db._con
+        con.valid = False
+        db.cursor()
+        self.assertTrue(db._con is not con)
+        self.assertEqual(limiter.connecting, 0)
+        limiter.connecting, limiter.timeout = 1, 0
+        breaker = SteadyDBBreaker(1, jitter=0)
+        breaker.failed()
+        breaker._until -= 1
+        self.assertRaises(TooManyConnects, SteadyDBconnect,
+                          dbapi, breaker=breaker, limiter=limiter)
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(breaker._delay, 2)
+        limiter.connecting = 0
+        SteadyDBconnect(dbapi, breaker=breaker, limiter=limiter)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test29_ProbeErrors(self):
+        sock, peer = socketpair()
+        try:
+            fd = sock.fileno()
+            try:  # use a file descriptor that select() cannot take
+                fd = os.dup2(fd, 1500) or 1500
+            except OSError:  # too many open files
+                pass
+            try:
+                self.assertTrue(_socket_alive(fd))
+                peer.send(b'notice')
+                self.assertTrue(_socket_alive(fd))
+                self.assertEqual(sock.recv(8), b'notice')
+                peer.close()
+                self.assertFalse(_socket_alive(fd))
+            finally:
+                if fd != sock.fileno():
+                    os.close(fd)
+            self.assertFalse(_socket_alive(fd))
+            self.assertFalse(_socket_alive(-1))
+        finally:
+            sock.close()
+            peer.close()
+
+    def test30_ProbeKeepsBlockingMode(self):
+        import socket
+        import DBUtils.SteadyDB as SteadyDB
+        if not SteadyDB.get_blocking:
+            self.skipTest("The blocking mode cannot be checked")
+        sock, peer = socketpair()
+        fd = sock.fileno()
+        timeout, rdhup = socket.getdefaulttimeout(), SteadyDB.POLLRDHUP
+        socket.setdefaulttimeout(5)  # a socket would become non-blocking
+        try:
+            for SteadyDB.POLLRDHUP in (rdhup, 0):  # with and without
+                for blocking in (True, False):
+                    sock.setblocking(blocking)
+                    peer.send(b'notice')
+                    self.assertTrue(_socket_alive(fd))
+                    self.assertEqual(os.get_blocking(fd), blocking)
+                    self.assertEqual(sock.recv(8), b'notice')
+            peer.close()
+            self.assertFalse(_socket_alive(fd))
+            self.assertFalse(os.get_blocking(fd))  # has not been changed
+        finally:
+            SteadyDB.POLLRDHUP = rdhup
+            socket.setdefaulttimeout(timeout)
+            sock.close()
+            peer.close()
+
+    def test31_CancelBeforeExecute(self):
+        db = SteadyDBconnect(dbapi, database='ok')
+        con = db._con
+        con.cancel = lambda: None
+        cursor = db.cursor()
+        db.cancel()  # the query is cancelled just when it is started
+        con.valid = False
+        self.assertRaises(dbapi.InternalError, cursor.execute, 'select test')
+        self.assertTrue(db._con is con)  # it has not been executed again
+        self.assertFalse(db._cancelled)
+        db = SteadyDBconnect(dbapi, database='ok')
+        con = db._con
+        con.cancel = lambda: None
+        cursor = db.cursor()
+        db.cancel()  # the query has been cancelled too late
+        cursor.execute('select test')
+        self.assertFalse(db._cancelled)
+        con.valid = False
+        cursor.execute('select test')  # this is executed again
+        self.assertTrue(db._con is not con)
+        self.assertEqual(cursor.fetchone(), 'test')
+        db.cancel()
+        db._reset()
+        self.assertFalse(db._cancelled)
+
+        def probe(db):
+            raise ValueError
+
+        db = SteadyDBconnect(dbapi)
+        db._probes = (probe,)
+        con = db._con
+        self.assertEqual(db._ping_check(), True)
+        self.assertTrue(db._con is not con)
+        self.assertEqual(db._ping, 1)
+        self.assertEqual(db._probes, (probe,))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -144,6 +144,9 @@ class TestSteadyPg(unittest.TestCase):
         self.assertTrue(db.db.status)
         self.assertEqual(db.get_tables(), 'test')
         self.assertTrue(db.db.status)
+        self.assertTrue('get_tables' not in SteadyPgConnection.__dict__)
+        self.assertTrue(db.get_tables.__func__
+                        is SteadyPgConnection._tough_methods['get_tables'])
         self.assertEqual(db._usage, 4)
         self.assertEqual(db.num_queries, 3)
         db.reopen()
@@ -0,0 +1,54 @@
+"""This module serves as a mock object for an asynchronous DB-API 2 module"""
+
+from DBUtils.Tests import mock_db
+
+from DBUtils.Tests.mock_db import (
+    Error, DatabaseError, OperationalError, InternalError, ProgrammingError)
+
+threadsafety = 2
+
+
+async def connect(database=None, user=None):
+    return Connection(database, user)
+
+
+class Connection(mock_db.Connection):
+
+    has_ping = False
+    num_pings = 0
+
+    async def close(self):
+        mock_db.Connection.close(self)
+
+    async def commit(self):
+        mock_db.Connection.commit(self)
+
+    async def rollback(self):
+        mock_db.Connection.rollback(self)
+
+    async def ping(self):
+        mock_db.Connection.ping(self)
+
+    async def cursor(self, name=None):
+        if not self.valid:
+            raise InternalError
+        return Cursor(self, name)
+
+
+class Cursor(mock_db.Cursor):
+
+    async def close(self):
+        mock_db.Cursor.close(self)
+
+    async def execute(self, operation):
+        mock_db.Cursor.execute(self, operation)
+
+    async def fetchone(self):
+        return mock_db.Cursor.fetchone(self)
+
+    async def callproc(self, procname):
+        mock_db.Cursor.callproc(self, procname)
+
+    def __del__(self):
+        if self.valid:
+            mock_db.Cursor.close(self)
@@ -1,5 +1,7 @@
 """This module serves as a mock object for the DB-API 2 module"""
 
+from socket import socketpair
+
 threadsafety = 2
 
 
@@ -31,6 +33,8 @@ class Connection:
 
     has_ping = False
     num_pings = 0
+    has_socket = False
+    socket = None
 
     def __init__(self, database=None, user=None):
         self.database = database
@@ -43,11 +47,16 @@ class Connection:
         self.num_queries = 0
         self.num_pings = 0
         self.session = []
+        if self.has_socket:  # the peer plays the role of the server
+            self.socket, self.peer = socketpair()
         self.valid = True
 
     def close(self):
         if not self.valid:
             raise InternalError
+        if self.socket is not None:
+            self.socket.close()
+            self.peer.close()
         self.open_cursors = 0
         self.num_uses = 0
         self.num_queries = 0
@@ -72,6 +81,11 @@ class Connection:
         if not self.valid:
             raise OperationalError
 
+    def fileno(self):
+        if self.socket is None:
+            raise AttributeError
+        return self.socket.fileno()
+
     def cursor(self, name=None):
         if not self.valid:
             raise InternalError
@@ -121,6 +135,10 @@ class Cursor:
         self.result = None
         return result
 
+    def fetchall(self):
+        result = self.fetchone()
+        return [] if result is None else [result]
+
     def callproc(self, procname):
         if not self.valid or not self.con.valid or not procname:
             raise InternalError
@@ -2,7 +2,9 @@
 
 __all__ = [
     'SimplePooledPg', 'SteadyPg', 'PooledPg', 'PersistentPg',
-    'SimplePooledDB', 'SteadyDB', 'PooledDB', 'PersistentDB'
+    'SimplePooledDB', 'SteadyDB', 'PooledDB', 'PersistentDB', 'PoolMetrics',
+    'AsyncSteadyDB', 'AsyncPooledDB', 'AsyncPersistentDB',
+    'MultiPooledDB', 'RoutedDB'
 ]
 
 __version__ = '1.3'